@@ -0,0 +1,124 @@
+""" This file contains the shared HTTP client used by the API data retrieval functions. """
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import response_cache
+
+
+def create_session(pool_size):
+    """Create a keep-alive session whose connection pool can serve pool_size threads at once."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class RateLimiter:
+    """Space requests out so that no more than `rate` are sent per second across all threads."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """A rate limiter that halves its rate after each failure and recovers gradually as requests succeed."""
+
+    def __init__(self, rate, min_rate=None):
+        super().__init__(rate)
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.rate = rate
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+            self.interval = 1 / rate
+
+    def record_success(self):
+        self.set_rate(min(self.max_rate, self.rate + self.max_rate / 20))
+
+    def record_failure(self):
+        self.set_rate(max(self.min_rate, self.rate / 2))
+
+
+class APIClient:
+    """A keep-alive session shared by a bounded thread pool, with a client-wide rate limit."""
+
+    def __init__(self, base_url, rate_limit, max_workers, max_retries=3, cache=None, should_cache=None,
+                 adaptive=False):
+        self.base_url = base_url
+        self.rate_limit = rate_limit
+        self.rate_limiter_class = AdaptiveRateLimiter if adaptive else RateLimiter
+        self.rate_limiter = self.rate_limiter_class(rate_limit)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.cache = cache
+        self.should_cache = should_cache
+        self.session = create_session(max_workers)
+
+    def prepare_for_shard(self, shard_count):
+        """Give a forked shard process its own share of the rate limit and its own cache connection."""
+        self.rate_limiter = self.rate_limiter_class(self.rate_limit / shard_count)
+        self.session = create_session(self.max_workers)
+        if self.cache is not None:
+            self.cache.connection = None
+
+    def get(self, path, params=None, before_send=None):
+        """Send a rate-limited GET request, backing off and retrying when the server answers 429. Successful
+           responses are answered from, and stored in, the response cache when the client has one.
+           before_send is called before every request that actually goes over the network, e.g. to count it
+           against a quota; it is skipped for cache hits."""
+        url = self.base_url + path
+        if self.cache is not None:
+            cached_body = self.cache.get(url, params)
+            if cached_body is not None:
+                return response_cache.CachedResponse(cached_body)
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait()
+            if before_send is not None:
+                before_send()
+            response = self.session.get(url, params=params)
+            if response.status_code != 429 or attempt == self.max_retries:
+                if self.cache is not None and response.ok and (self.should_cache is None or
+                                                               self.should_cache(response)):
+                    self.cache.set(url, params, response.text)
+                return response
+            try:
+                retry_after = float(response.headers.get("Retry-After", 2 ** attempt))
+            except ValueError:
+                retry_after = 2 ** attempt
+            time.sleep(retry_after)
+
+    def map(self, func, items, progress_label=None):
+        """Apply func to every item on the client's thread pool and return the results in input order."""
+        items = list(items)
+        count = 0
+        count_lock = threading.Lock()
+
+        def run(item):
+            nonlocal count
+            result = func(item)
+            if progress_label is not None:
+                with count_lock:
+                    count += 1
+                    print(f'{progress_label} {count} / {len(items)}')
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(run, items))
@@ -0,0 +1,325 @@
+""" This file contains the benchmarks for the pipeline's slow steps. Run them all with `python benchmarks.py`, or
+    name the ones to run, e.g. `python benchmarks.py grammy_html_parser`. """
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_api_server
+import pipeline
+import tmdb_id_export
+import utils
+
+# The stages' modules, and pandas, are imported by the benchmarks that use them, so that importing benchmarks (as
+# the tests do for the fake server helpers and the import time budgets) stays cheap.
+
+
+def timed(func, *args, **kwargs):
+    """Call func, returning its result and the elapsed wall time in seconds."""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def benchmark_grammy_html_parser():
+    """Compare the sequential BeautifulSoup grammy parser with the parallel lxml one, and check they agree."""
+    import html_parser
+
+    docs_and_years = html_parser.grammy_html_docs_and_years()
+
+    bs4_data, bs4_seconds = timed(lambda: [html_parser.parse_grammy_html_doc(html_doc, award_year)
+                                           for html_doc, award_year in docs_and_years])
+    lxml_data, lxml_seconds = timed(html_parser.parse_grammy_html_docs_in_parallel, docs_and_years,
+                                    manifest_path=None)
+    if lxml_data != bs4_data:
+        raise AssertionError('The lxml parser output differs from the BeautifulSoup parser output.')
+
+    print(f'Grammy html parser ({len(docs_and_years)} docs):\n'
+          f'  BeautifulSoup, sequential: {bs4_seconds:.2f}s\n'
+          f'  lxml, process pool:        {lxml_seconds:.2f}s ({bs4_seconds / lxml_seconds:.1f}x faster)')
+
+
+def seed_collection_inputs(fixtures):
+    """Write the files the collection stage reads but doesn't produce itself (in the real workflow they are
+       snapshots of an earlier run's outputs and the downloaded IMDb datasets and TMDb ID export), derived from the
+       fixtures' catalogue, into the current directory."""
+    import omdb_api_functions
+    import tmdb_api_functions
+
+    catalogue = fixtures["catalogue"]
+    movies_by_id = {movie["tmdb_id"]: movie for movie in catalogue["movies"]}
+    found_actors = [actor for actor in catalogue["actors"] if actor["in_tmdb"]]
+    os.makedirs("data_files", exist_ok=True)
+
+    def tmdb_movie_data(tmdb_id):
+        movie_details = fixtures["tmdb"][fake_api_server.fixture_key(f'/movie/{tmdb_id}')]
+        return tmdb_api_functions.extract_tmdb_movie_data(tmdb_id, movie_details)
+
+    def omdb_movie_data(params):
+        return fixtures["omdb"][fake_api_server.fixture_key('/', params)]
+
+    actor_data_list = [dict(IMDb_ID=actor["imdb_id"], TMDb_ID=actor["tmdb_id"], Gender=actor["gender"],
+                            Birthday=actor["birthday"],
+                            Movie_Credits=[movies_by_id[tmdb_id]["title"] for tmdb_id in actor["credits"]])
+                       for actor in found_actors]
+    credited_tmdb_ids = list(dict.fromkeys(tmdb_id for actor in found_actors for tmdb_id in actor["credits"]))
+    original_tmdb_movie_data_list = [tmdb_movie_data(tmdb_id) for tmdb_id in credited_tmdb_ids]
+    omdb_movies_from_ids = [omdb_movie_data({"i": movie["IMDb_ID"]}) for movie in original_tmdb_movie_data_list
+                            if movie["IMDb_ID"]]
+    unresolved_titles = omdb_api_functions.plan_omdb_title_lookups(actor_data_list, omdb_movies_from_ids)
+    omdb_movies_from_titles = [omdb_movie_data({"t": title}) for title in unresolved_titles.values()]
+    additional_tmdb_movie_data_list = [tmdb_movie_data(movie["tmdb_id"]) for movie in catalogue["movies"]
+                                       if movie["title"] in unresolved_titles.values()]
+
+    utils.save_data_as_json("actor_not_found_in_tmdb_list.json",
+                            [actor["imdb_id"] for actor in catalogue["actors"] if not actor["in_tmdb"]])
+    utils.save_data_as_json("data_files/actor_data_list_all_2225.json", actor_data_list)
+    utils.save_data_as_json("original_tmdb_movie_data_list_all_2225.json", original_tmdb_movie_data_list)
+    utils.save_data_as_json("data_files/original_tmdb_movie_data_list_all_2225.json", original_tmdb_movie_data_list)
+    utils.save_data_as_json("data_files/valid_omdb_movie_data_from_ids.json", omdb_movies_from_ids)
+    utils.save_data_as_json("data_files/valid_omdb_movie_data_from_titles.json", omdb_movies_from_titles)
+    utils.save_data_as_json("data_files/updated_additional_tmdb_movie_data_list.json",
+                            original_tmdb_movie_data_list + additional_tmdb_movie_data_list)
+
+    with gzip.open("data_files/title.basics.tsv.gz", 'wt', encoding='utf-8') as f:
+        f.write("tconst\ttitleType\tprimaryTitle\toriginalTitle\tisAdult\tstartYear\tendYear\truntimeMinutes\t"
+                "genres\n")
+        for movie in catalogue["movies"]:
+            f.write(f'{movie["imdb_id"]}\tmovie\t{movie["title"]}\t{movie["title"]}\t0\t{movie["year"]}\t\\N\t'
+                    f'{movie["runtime"]}\t{",".join(movie["genres"])}\n')
+    with gzip.open("data_files/title.ratings.tsv.gz", 'wt', encoding='utf-8') as f:
+        f.write("tconst\taverageRating\tnumVotes\n")
+        for movie in catalogue["movies"]:
+            f.write(f'{movie["imdb_id"]}\t{movie["rating"]}\t{movie["votes"]}\n')
+    with gzip.open(tmdb_id_export.DEFAULT_EXPORT_PATH, 'wt', encoding='utf-8') as f:
+        for movie in catalogue["movies"]:
+            f.write(json.dumps({"adult": False, "id": movie["tmdb_id"], "original_title": movie["title"],
+                                "popularity": movie["votes"] / 1000, "video": False}) + "\n")
+
+
+def run_collection_against_fake_server(fixtures, directory, **server_options):
+    """Seed directory with the collection stage's inputs and run data_collection.collect_data there against a fake
+       server for the fixtures; return the elapsed seconds and the server's request stats. The crawls run on
+       Twisted's reactor, which can't be restarted, so this can only run once per process."""
+    import data_collection
+    import imdb_scrapers
+    import omdb_api_functions
+    import tmdb_api_functions
+
+    working_directory = os.getcwd()
+    with fake_api_server.start_fake_server(fixtures, **server_options) as server:
+        os.chdir(directory)
+        try:
+            seed_collection_inputs(fixtures)
+            tmdb_api_functions.tmdb_client.base_url = f'{server.url}/tmdb/3'
+            omdb_api_functions.omdb_client.base_url = f'{server.url}/omdb/'
+            imdb_scrapers.IMDB_BASE_URL = f'{server.url}/imdb'
+            _, seconds = timed(data_collection.collect_data)
+        finally:
+            os.chdir(working_directory)
+        return seconds, server.stats()
+
+
+def benchmark_collection(actor_count=100, movies_per_actor=6, latency=0.02, error_rate=0.0):
+    """Run data_collection.collect_data end to end against the fake server in a scratch directory and report its
+       throughput. Run this once per process (see run_collection_against_fake_server)."""
+    fixtures = fake_api_server.generate_fixtures(actor_count, movies_per_actor)
+    with tempfile.TemporaryDirectory() as scratch_directory:
+        seconds, stats = run_collection_against_fake_server(fixtures, scratch_directory, latency=latency,
+                                                            latency_jitter=latency, error_rate=error_rate)
+
+    print(f'Collection stage ({actor_count} actors, {len(fixtures["catalogue"]["movies"])} movies, '
+          f'{latency * 1000:.0f}-{latency * 2000:.0f}ms latency, {error_rate:.0%} errors):\n'
+          f'  End to end: {seconds:.1f}s\n'
+          f'  Requests:   {stats["requests"]} ({stats["requests"] / seconds:.1f} requests/s)')
+    for service, count in sorted(stats["by_service"].items()):
+        print(f'    {service}: {count}')
+    print(f'  Responses by status: {dict(sorted(stats["by_status"].items()))}')
+
+
+def benchmark_sql_load(schema="bulk_load_benchmark"):
+    """Load the pre-db tables into a scratch schema of the configured (e.g. a local) PostgreSQL database, once with
+       DataFrame.to_sql and once with the parallel COPY loader, check the row counts agree and drop the schema."""
+    import psql_database_eng
+
+    engine = psql_database_eng.get_engine()
+    tables = psql_database_eng.PRE_DB_TABLES
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f'CREATE SCHEMA IF NOT EXISTS {schema}')
+    try:
+        def load_with_to_sql():
+            with engine.begin() as connection:
+                for table_name, artifact in tables:
+                    utils.load_dataframe(artifact).to_sql(table_name, con=connection, schema=schema,
+                                                          if_exists="replace")
+        _, to_sql_seconds = timed(load_with_to_sql)
+        timings, copy_seconds = timed(psql_database_eng.copy_dataframes_to_sql_database, tables, schema=schema,
+                                        incremental=False)
+        with engine.connect() as connection:
+            for table_name, _ in tables:
+                loaded_rows = connection.exec_driver_sql(f'SELECT count(*) FROM {schema}."{table_name}"').scalar()
+                if loaded_rows != timings[table_name][0]:
+                    raise AssertionError(f'{table_name}: {loaded_rows} rows loaded, expected {timings[table_name][0]}.')
+    finally:
+        with engine.begin() as connection:
+            connection.exec_driver_sql(f'DROP SCHEMA IF EXISTS {schema} CASCADE')
+
+    total_rows = sum(rows for rows, _, _ in timings.values())
+    print(f'Pre-db table load ({len(tables)} tables, {total_rows} rows):\n'
+          f'  DataFrame.to_sql, one transaction: {to_sql_seconds:.2f}s ({total_rows / to_sql_seconds:.0f} rows/s)\n'
+          f'  COPY, parallel connections:        {copy_seconds:.2f}s ({total_rows / copy_seconds:.0f} rows/s, '
+          f'{to_sql_seconds / copy_seconds:.1f}x faster)')
+
+
+def benchmark_sql_backends():
+    """Build the post-db artifacts from the pre-db ones with each backend: the PostgreSQL round trip (COPY the tables
+       in, run the SQL transforms, stream the results back) and DuckDB in process. Both run in a scratch directory,
+       but the PostgreSQL side rebuilds the configured database's tables, as a pipeline run does. The merged tables
+       must come out with the same number of rows."""
+    import psql_database_eng
+
+    working_directory = os.getcwd()
+    seconds = {}
+    row_counts = {}
+
+    def postgres_round_trip():
+        psql_database_eng.write_pre_db_dataframes_to_sql_database(backend="postgres")
+        psql_database_eng.run_sql_transforms(backend="postgres")
+        psql_database_eng.load_sql_tables_as_dataframes(backend="postgres")
+
+    def duckdb_in_process():
+        psql_database_eng.load_sql_tables_as_dataframes(backend="duckdb")
+
+    with tempfile.TemporaryDirectory() as scratch_directory:
+        for _, artifact in psql_database_eng.PRE_DB_TABLES:
+            # An artifact that hasn't been written yet is read from the pickle it replaces.
+            shutil.copy(artifact if os.path.exists(artifact) else utils.legacy_pickle_path(artifact),
+                        scratch_directory)
+        os.chdir(scratch_directory)
+        try:
+            for backend, build in [("postgres", postgres_round_trip), ("duckdb", duckdb_in_process)]:
+                _, seconds[backend] = timed(build)
+                row_counts[backend] = {table_name: len(utils.load_dataframe(artifact))
+                                       for table_name, artifact, _ in psql_database_eng.POST_DB_TABLES}
+        finally:
+            os.chdir(working_directory)
+
+    for table_name in psql_database_eng.DUCKDB_QUERIES:
+        if row_counts["postgres"][table_name] != row_counts["duckdb"][table_name]:
+            raise AssertionError(f'{table_name}: {row_counts["postgres"][table_name]} rows with postgres, '
+                                 f'{row_counts["duckdb"][table_name]} with duckdb.')
+    table_sizes = ", ".join(f'{table_name}: {rows} rows' for table_name, rows in row_counts["duckdb"].items())
+    print(f'Pre-db to post-db artifacts ({table_sizes}):\n'
+          f'  PostgreSQL round trip: {seconds["postgres"]:.2f}s\n'
+          f'  DuckDB, in process:    {seconds["duckdb"]:.2f}s ({seconds["postgres"] / seconds["duckdb"]:.1f}x faster)')
+
+
+def legacy_tmdb_movie_table(tmdb_movie_data_list):
+    """The per-movie builder clean_tmdb_movie_data used before build_tmdb_movie_table: a one-row DataFrame per movie,
+       concatenated, then every column from the sixth on parsed with pd.to_datetime."""
+    import pandas as pd
+
+    import data_cleaning_functions as dcf
+
+    movie_dataframes = []
+    for movie_data in tmdb_movie_data_list:
+        movie_data = dcf.append_release_dates(dcf.append_keywords(dict(movie_data)))
+        movie_dataframes.append(pd.DataFrame.from_dict(movie_data, orient="index").transpose())
+    tmdb_df = pd.concat(movie_dataframes, axis=0, ignore_index=True)
+    tmdb_df.drop(["Release_Dates", "Keywords"], axis=1, inplace=True)
+    tmdb_df.iloc[:, 5:] = tmdb_df.iloc[:, 5:].apply(pd.to_datetime)
+    return tmdb_df
+
+
+def benchmark_tmdb_movie_table():
+    """Compare the per-movie TMDb table builder with the single-pass one on the full collected movie list, and check
+       they produce the same columns and release dates."""
+    import pandas as pd
+
+    import pre_db_data_cleaning
+
+    tmdb_movie_data_list = utils.load_records("data_files/updated_additional_tmdb_movie_data_list.json")
+
+    legacy_df, legacy_seconds = timed(legacy_tmdb_movie_table, tmdb_movie_data_list)
+    tmdb_df, seconds = timed(pre_db_data_cleaning.build_tmdb_movie_table, tmdb_movie_data_list)
+    if list(tmdb_df.columns) != list(legacy_df.columns) or len(tmdb_df) != len(legacy_df):
+        raise AssertionError('The single-pass TMDb table differs in shape from the per-movie one.')
+    for column in tmdb_df.columns[5:]:
+        if not pd.to_datetime(legacy_df[column], utc=True).equals(tmdb_df[column]):
+            raise AssertionError(f'The single-pass TMDb table differs from the per-movie one in {column}.')
+    if not tmdb_df["Keyword_List"].equals(legacy_df["Keyword_List"]):
+        raise AssertionError('The single-pass TMDb table differs from the per-movie one in Keyword_List.')
+
+    print(f'TMDb movie table ({len(tmdb_df)} movies, {len(tmdb_df.columns)} columns):\n'
+          f'  per-movie DataFrames + concat: {legacy_seconds:.2f}s\n'
+          f'  single pass:                   {seconds:.2f}s ({legacy_seconds / seconds:.1f}x faster)')
+
+
+# The most a pipeline stage's module may take to import in a fresh interpreter, in seconds. The collection stage's
+# crawls need scrapy and Twisted, which take most of its allowance.
+IMPORT_TIME_BUDGET = 1.0
+IMPORT_TIME_BUDGETS = {"data_collection": 2.5}
+
+
+def module_import_seconds(module_name):
+    """Import a module in a fresh interpreter with -X importtime and return its cumulative import time."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+    # Lines are "import time: <self us> | <cumulative us> | <module>", nested imports indented under the module.
+    for line in result.stderr.splitlines():
+        fields = [field.strip() for field in line.removeprefix("import time:").split("|")]
+        if len(fields) == 3 and fields[2] == module_name:
+            return int(fields[1]) / 1e6
+    raise ValueError(f'No import time reported for {module_name}.')
+
+
+def import_time_module_names():
+    """The pipeline's entry points and each stage's module, which import_time checks."""
+    return ["main", "pipeline"] + list(dict.fromkeys(stage.func.split(":")[0] for stage in pipeline.STAGES))
+
+
+def import_time_budget(module_name):
+    return IMPORT_TIME_BUDGETS.get(module_name, IMPORT_TIME_BUDGET)
+
+
+def benchmark_import_time():
+    """Check that the pipeline's entry points and each stage's module import within their budgets, so that
+       running a single stage doesn't pay for every other stage's dependencies. Fails if any is over budget."""
+    over_budget = []
+    print('Import times (fresh interpreter, -X importtime):')
+    for module_name in import_time_module_names():
+        seconds = module_import_seconds(module_name)
+        budget = import_time_budget(module_name)
+        if seconds > budget:
+            over_budget.append(module_name)
+        print(f'  {module_name}: {seconds:.3f}s (budget {budget:.1f}s){" OVER BUDGET" if seconds > budget else ""}')
+    if over_budget:
+        raise AssertionError(f'Over the import time budget: {", ".join(over_budget)}')
+
+
+BENCHMARKS = {
+    "grammy_html_parser": benchmark_grammy_html_parser,
+    "collection": benchmark_collection,
+    "sql_load": benchmark_sql_load,
+    "sql_backends": benchmark_sql_backends,
+    "import_time": benchmark_import_time,
+    "tmdb_movie_table": benchmark_tmdb_movie_table,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the pipeline benchmarks.")
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark",
+                        help=f'benchmarks to run (default: all of {", ".join(BENCHMARKS)})')
+    names = parser.parse_args().benchmarks or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(unknown)}')
+    for name in names:
+        BENCHMARKS[name]()
@@ -1,9 +1,9 @@
 """ This file contains the data cleaning functions. """
 
+import functools
 import pandas as pd
 import re
 import numpy as np
-from nltk.corpus import stopwords
 # nltk.download('stopwords')
 # omdb_movie_data_list.json
 
@@ -124,11 +124,18 @@ def clean_grammy_artists(artists_string):
     return artists
 
 
+@functools.lru_cache(maxsize=None)
+def stop_words():
+    """The nltk stop words, in every language, as a set. nltk is only imported when a plot is first cleaned."""
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words())
+
+
 def clean_plot(plot):
     """Clean the plot text."""
     plot = re.sub("[^a-zA-Z0-9]", " ", plot).lower()  # remove non-alphanumeric characters
     plot = re.sub("[0-9]+", "number", plot)  # convert all digits to the word "number"
-    plot = [word for word in plot.split() if word not in stopwords.words()]  # remove stop words
+    plot = [word for word in plot.split() if word not in stop_words()]  # remove stop words
     return plot
 
 
@@ -139,21 +146,14 @@ def clean_rt_rating(rt_rating):
 
 
 def clean_cast(movie_cast):
-    """Remove duplicates from the movie_cast values."""
-    actors = []
-    for actor in movie_cast:
-        if actor not in actors:
-            actors.append(actor)
-    return actors
+    """Remove duplicates from the movie_cast values, keeping the first of each."""
+    return list(dict.fromkeys(movie_cast))
 
 
 def clean_crew(movie_crew):
-    """Remove duplicates from the movie_crew values."""
-    crew = []
-    for member in movie_crew:
-        if member not in crew:
-            crew.append(member)
-    return crew
+    """Remove duplicates from the movie_crew values (crew members credited for several jobs), keeping the first of
+       each."""
+    return list(dict.fromkeys(movie_crew))
 
 
 def get_supporting_actors(movie_cast, lead_actors):
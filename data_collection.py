@@ -3,21 +3,27 @@
 import imdb_scrapers
 import tmdb_api_functions
 import omdb_api_functions
+import imdb_datasets
 
 
-def collect_data():
-    imdb_scrapers.run_actor_name_crawler()
-    imdb_scrapers.save_actor_names_and_ids()
-    imdb_scrapers.verify_actor_name_data()
-    tmdb_api_functions.retrieve_actor_and_movie_data_from_tmdb()
+def collect_api_data(shard_count=1):
+    """Collect the TMDb and OMDb data for the scraped actors. The passes resume from their work queues if
+       interrupted and can be split across shard_count processes."""
+    tmdb_api_functions.retrieve_actor_and_movie_data_from_tmdb(shard_count)
     tmdb_api_functions.save_original_retrieved_tmdb_data()
     tmdb_api_functions.summarise_original_tmdb_data_retrieval()
-    omdb_api_functions.retrieve_actor_and_movie_data_from_omdb()
+    imdb_datasets.ingest_imdb_datasets_for_collected_movies()
+    omdb_api_functions.retrieve_actor_and_movie_data_from_omdb(shard_count)
     omdb_api_functions.compare_retrieved_omdb_movie_data_and_return_additional_titles()
-    tmdb_api_functions.retrieve_additional_actor_and_movie_data_from_tmdb()
+    tmdb_api_functions.retrieve_additional_actor_and_movie_data_from_tmdb(shard_count)
     tmdb_api_functions.save_additional_retrieved_tmdb_data()
     tmdb_api_functions.concatenate_retrieved_tmdb_data()
-    tmdb_api_functions.retrieve_cast_and_crew_data_from_tmdb()
-    imdb_scrapers.run_imdb_box_office_data_summary_crawler()
-    imdb_scrapers.run_soundtrack_credits_crawler()
-    grammy_scraper.run_grammy_awards_crawler()
+    tmdb_api_functions.retrieve_cast_and_crew_data_from_tmdb(shard_count)
+
+
+def collect_data(shard_count=1):
+    """Run the whole collection stage, with the API collection between the actor name crawl and the movie page
+       crawls of a single IMDb crawler run."""
+    imdb_scrapers.run_imdb_crawlers(between_crawls=lambda: collect_api_data(shard_count))
+    print(f'TMDb response cache: {tmdb_api_functions.tmdb_response_cache.summary()}')
+    print(f'OMDb response cache: {omdb_api_functions.omdb_response_cache.summary()}')
@@ -6,12 +6,12 @@ def get_total_movie_awards(names, date, oscar_awards_df, gg_awards_df):
     award_count = 0
     if names is not None:
         for name in names:
-            award_count += len(oscar_awards_df[(oscar_awards_df["year_ceremony"] < date) &
-                                               (oscar_awards_df["name"] == name) &
+            award_count += len(oscar_awards_df[(oscar_awards_df["ceremony_year"] < date) &
+                                               (oscar_awards_df["nominee"] == name) &
                                                (oscar_awards_df["winner"])])
-            award_count += len(gg_awards_df[(gg_awards_df["year_award"] < date) &
+            award_count += len(gg_awards_df[(gg_awards_df["awards_year"] < date) &
                                             (gg_awards_df["nominee"] == name) &
-                                            (gg_awards_df["win"])])
+                                            (gg_awards_df["winner"])])
     return award_count
 
 
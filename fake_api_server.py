@@ -0,0 +1,339 @@
+""" This file contains a local stand-in for the TMDb, OMDb and IMDb endpoints the collection stage uses, so the
+    stage can be benchmarked and exercised without touching the live services or spending API quota.
+
+    One server answers all three services under a path prefix each: /tmdb/3/..., /omdb/ and /imdb/....
+    Responses come from a fixtures dictionary, either recorded (see save_fixtures / load_fixtures) or generated
+    with generate_fixtures. Latency, injected errors and rate limiting are configurable. """
+
+import argparse
+import gzip
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+SERVICES = ("tmdb", "omdb", "imdb")
+
+# Parameters that don't change the answer (keys and fixed options), left out of fixture keys.
+IGNORED_PARAMS = {"api_key", "apikey", "type", "plot", "external_source", "append_to_response"}
+
+ACTOR_LIST_PAGES = [("ls006050174", page) for page in range(1, 9)] + [("ls066061932", page) for page in range(1, 16)]
+GENRES = ["Drama", "Comedy", "Action", "Romance", "Thriller", "Crime", "Documentary", "Music", "Horror"]
+
+
+def fixture_key(path, params=None):
+    """The key a response is stored under: the path plus any parameters that select the answer, sorted."""
+    params = sorted((name, value) for name, value in (params or {}).items() if name not in IGNORED_PARAMS)
+    return path + "?" + urlencode(params) if params else path
+
+
+def save_fixtures(path, fixtures):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(fixtures, f, ensure_ascii=False)
+
+
+def load_fixtures(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def generate_catalogue(actor_count=50, movies_per_actor=6, seed=0):
+    """Generate a synthetic set of actors and movies. Movies are shared between actors, about one in ten has no
+       IMDb ID on TMDb (so OMDb's by-title pass has something to find), and about one in twenty actors is
+       missing from TMDb."""
+    rng = random.Random(seed)
+    movie_count = max(movies_per_actor, actor_count * movies_per_actor // 3)
+    movies = []
+    for movie_no in range(movie_count):
+        movies.append(dict(tmdb_id=10000 + movie_no, imdb_id=f'tt{9000000 + movie_no}',
+                           imdb_id_on_tmdb=rng.random() >= 0.1, title=f'Synthetic Movie {movie_no}',
+                           year=rng.randint(1958, 2023), runtime=rng.randint(75, 180),
+                           budget=rng.randint(0, 200) * 1000000, genres=rng.sample(GENRES, 2),
+                           rating=round(rng.uniform(3, 9), 1), votes=rng.randint(100, 500000),
+                           opening_weekend_gross=rng.randint(0, 90000000),
+                           worldwide_gross=rng.randint(0, 900000000), director_id=30000 + movie_no))
+    actors = []
+    for actor_no in range(actor_count):
+        actors.append(dict(imdb_id=f'nm{1000000 + actor_no}', tmdb_id=20000 + actor_no,
+                           name=f'Synthetic Actor {actor_no}', gender=rng.choice([1, 2]),
+                           birthday=f'{rng.randint(1920, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+                           in_tmdb=rng.random() >= 0.05,
+                           credits=[movie["tmdb_id"] for movie in rng.sample(movies, movies_per_actor)]))
+    return {"actors": actors, "movies": movies}
+
+
+def tmdb_movie_details(movie, cast):
+    """A /movie/{id} response with every sub-resource the collection stage appends."""
+    imdb_id = movie["imdb_id"] if movie["imdb_id_on_tmdb"] else None
+    director_name = f'Synthetic Director {movie["director_id"]}'
+    crew = [{"id": movie["director_id"], "name": director_name, "original_name": director_name, "job": "Director",
+             "department": "Directing", "gender": 0, "credit_id": f'crew{movie["tmdb_id"]}'}]
+    return {"id": movie["tmdb_id"], "imdb_id": imdb_id, "title": movie["title"], "original_title": movie["title"],
+            "budget": movie["budget"], "runtime": movie["runtime"], "release_date": f'{movie["year"]}-06-01',
+            "genres": [{"id": GENRES.index(genre), "name": genre} for genre in movie["genres"]],
+            "external_ids": {"id": movie["tmdb_id"], "imdb_id": imdb_id},
+            "alternative_titles": {"titles": [{"iso_3166_1": "GB", "title": f'{movie["title"]} (UK)', "type": ""}]},
+            "release_dates": {"results": [
+                {"iso_3166_1": "US", "release_dates": [{"certification": "R", "iso_639_1": "", "note": "", "type": 3,
+                                                       "release_date": f'{movie["year"]}-06-01T00:00:00.000Z'}]},
+                {"iso_3166_1": "GB", "release_dates": [{"certification": "15", "iso_639_1": "", "note": "", "type": 3,
+                                                       "release_date": f'{movie["year"]}-07-01T00:00:00.000Z'}]}]},
+            "keywords": {"keywords": [{"id": GENRES.index(genre), "name": genre.lower()}
+                                      for genre in movie["genres"]]},
+            "credits": {"cast": cast, "crew": crew}}
+
+
+def omdb_movie(movie, cast):
+    actors = ", ".join(member["name"] for member in cast[:3]) or "N/A"
+    return {"Title": movie["title"], "Year": str(movie["year"]), "Rated": "R", "Released": f'01 Jun {movie["year"]}',
+            "Runtime": f'{movie["runtime"]} min', "Genre": ", ".join(movie["genres"]),
+            "Director": f'Synthetic Director {movie["director_id"]}', "Writer": "Synthetic Writer", "Actors": actors,
+            "Plot": f'The plot of {movie["title"]}.', "Language": "English", "Country": "United States",
+            "Awards": "N/A", "Poster": "N/A", "Ratings": [], "Metascore": "N/A", "imdbRating": str(movie["rating"]),
+            "imdbVotes": f'{movie["votes"]:,}', "imdbID": movie["imdb_id"], "Type": "movie", "DVD": "N/A",
+            "BoxOffice": f'${movie["worldwide_gross"]:,}', "Production": "Synthetic Pictures", "Website": "N/A",
+            "Response": "True"}
+
+
+def imdb_actor_list_page(actors):
+    items = "".join(f'<div class="lister-item mode-detail"><h3 class="lister-item-header">'
+                    f'<a href="/name/{actor["imdb_id"]}">\n{actor["name"]}\n</a></h3></div>' for actor in actors)
+    return f'<html><body><div class="lister-list">{items}</div></body></html>'
+
+
+def imdb_title_page(movie):
+    return (f'<html><head><meta property="imdb:pageConst" content="{movie["imdb_id"]}"/></head><body><ul>'
+            f'<li data-testid="title-boxoffice-openingweekenddomestic"><span class="ipc-metadata-list-item__'
+            f'list-content-item">${movie["opening_weekend_gross"]:,}</span></li>'
+            f'<li data-testid="title-boxoffice-cumulativeworldwidegross"><span class="ipc-metadata-list-item__'
+            f'list-content-item">${movie["worldwide_gross"]:,}</span></li></ul></body></html>')
+
+
+def imdb_soundtrack_page(movie):
+    track = ('<li class="ipc-metadata-list__item ipc-metadata-list__item--stacked">'
+             '<span class="ipc-metadata-list-item__label">{title}</span>'
+             '<div class="ipc-html-content-inner-div">Written by '
+             '<a class="ipc-md-link ipc-md-link--entity" href="/name/nm{person}/">Synthetic Writer {person}</a></div>'
+             '<div class="ipc-html-content-inner-div">Performed by '
+             '<a class="ipc-md-link ipc-md-link--entity" href="/name/nm{person}/">Synthetic Writer {person}</a></div>'
+             '</li>')
+    tracks = "".join(track.format(title=f'{movie["title"]} Theme {track_no}', person=8000000 + movie["tmdb_id"])
+                     for track_no in range(1, 3))
+    return (f'<html><head><meta property="og:url" content="https://www.imdb.com/title/{movie["imdb_id"]}/soundtrack/"'
+            f'/></head><body><ul>{tracks}</ul></body></html>')
+
+
+def generate_fixtures(actor_count=50, movies_per_actor=6, seed=0):
+    """Generate the responses for a synthetic catalogue; the catalogue itself is kept under "catalogue"."""
+    catalogue = generate_catalogue(actor_count, movies_per_actor, seed)
+    fixtures = {"catalogue": catalogue, "tmdb": {}, "omdb": {}, "imdb": {}}
+    movies_by_id = {movie["tmdb_id"]: movie for movie in catalogue["movies"]}
+    cast_by_movie = {movie["tmdb_id"]: [] for movie in catalogue["movies"]}
+
+    for actor in catalogue["actors"]:
+        person = {"id": actor["tmdb_id"], "name": actor["name"], "gender": actor["gender"],
+                  "known_for_department": "Acting"}
+        fixtures["tmdb"][fixture_key(f'/find/{actor["imdb_id"]}')] = {
+            "movie_results": [], "tv_results": [], "person_results": [person] if actor["in_tmdb"] else []}
+        fixtures["tmdb"][fixture_key(f'/person/{actor["tmdb_id"]}')] = dict(
+            person, birthday=actor["birthday"], imdb_id=actor["imdb_id"])
+        credits = [{"id": tmdb_id, "title": movies_by_id[tmdb_id]["title"],
+                    "original_title": movies_by_id[tmdb_id]["title"], "character": "Self",
+                    "release_date": f'{movies_by_id[tmdb_id]["year"]}-06-01'} for tmdb_id in actor["credits"]]
+        fixtures["tmdb"][fixture_key(f'/person/{actor["tmdb_id"]}/movie_credits')] = {
+            "id": actor["tmdb_id"], "cast": credits, "crew": []}
+        for tmdb_id in actor["credits"]:
+            cast = cast_by_movie[tmdb_id]
+            cast.append(dict(person, original_name=actor["name"], character="Self", order=len(cast),
+                             credit_id=f'cast{tmdb_id}-{actor["tmdb_id"]}'))
+
+    for movie in catalogue["movies"]:
+        details = tmdb_movie_details(movie, cast_by_movie[movie["tmdb_id"]])
+        fixtures["tmdb"][fixture_key(f'/movie/{movie["tmdb_id"]}')] = details
+        fixtures["tmdb"][fixture_key(f'/movie/{movie["tmdb_id"]}/credits')] = dict(id=movie["tmdb_id"],
+                                                                                  **details["credits"])
+        fixtures["tmdb"][fixture_key('/search/movie', {"query": movie["title"]})] = {
+            "page": 1, "total_pages": 1, "total_results": 1,
+            "results": [{"id": movie["tmdb_id"], "title": movie["title"], "original_title": movie["title"]}]}
+        fixtures["omdb"][fixture_key('/', {"i": movie["imdb_id"]})] = omdb_movie(movie, details["credits"]["cast"])
+        fixtures["omdb"][fixture_key('/', {"t": movie["title"]})] = omdb_movie(movie, details["credits"]["cast"])
+        fixtures["imdb"][fixture_key(f'/title/{movie["imdb_id"]}/')] = imdb_title_page(movie)
+        fixtures["imdb"][fixture_key(f'/title/{movie["imdb_id"]}/soundtrack/')] = imdb_soundtrack_page(movie)
+
+    actors_per_page = math.ceil(len(catalogue["actors"]) / len(ACTOR_LIST_PAGES))
+    for page_no, (list_id, page) in enumerate(ACTOR_LIST_PAGES):
+        page_actors = catalogue["actors"][page_no * actors_per_page:(page_no + 1) * actors_per_page]
+        fixtures["imdb"][fixture_key(f'/list/{list_id}/', {"sort": "list_order,asc", "mode": "detail",
+                                                            "page": str(page)})] = imdb_actor_list_page(page_actors)
+    return fixtures
+
+
+class TokenBucket:
+    """Allow `rate` requests per second on average, with bursts of up to one second's worth."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class FakeAPIServer:
+    """Serves the fixtures for every service from one threaded HTTP server on localhost.
+
+       latency (+ up to latency_jitter) seconds is added to every response, error_rate is the fraction of
+       requests answered with a 503, rate_limits maps a service to the requests per second it accepts before
+       answering 429, and omdb_daily_limit answers OMDb's "Request limit reached!" once that many OMDb requests
+       have been served."""
+
+    def __init__(self, fixtures, port=0, latency=0.0, latency_jitter=0.0, error_rate=0.0, rate_limits=None,
+                 omdb_daily_limit=None, seed=None):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limits = {service: TokenBucket(rate) for service, rate in (rate_limits or {}).items()}
+        self.omdb_daily_limit = omdb_daily_limit
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), FakeAPIRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake_api = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        # start_fake_server has already started the server it returns, when that is then used as a context manager.
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, service, status):
+        with self.lock:
+            self.counts[service, status] = self.counts.get((service, status), 0) + 1
+
+    def stats(self):
+        """Request counts by service and by status code."""
+        with self.lock:
+            counts = dict(self.counts)
+        by_service = {}
+        by_status = {}
+        for (service, status), count in counts.items():
+            by_service[service] = by_service.get(service, 0) + count
+            by_status[status] = by_status.get(status, 0) + count
+        return {"requests": sum(counts.values()), "by_service": by_service, "by_status": by_status}
+
+    def respond(self, service, key):
+        """Return the status, headers and body for a request to the service."""
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.latency_jitter)
+            inject_error = self.random.random() < self.error_rate
+            omdb_requests = sum(count for (name, _), count in self.counts.items() if name == "omdb")
+        time.sleep(delay)
+
+        if service in self.rate_limits and not self.rate_limits[service].take():
+            return 429, {"Retry-After": "1"}, error_body(service, 429)
+        if service == "omdb" and self.omdb_daily_limit is not None and omdb_requests >= self.omdb_daily_limit:
+            return 401, {}, json.dumps({"Response": "False", "Error": "Request limit reached!"})
+        if inject_error:
+            return 503, {}, error_body(service, 503)
+
+        fixture = self.fixtures.get(service, {}).get(key)
+        if fixture is not None:
+            return 200, {}, fixture if service == "imdb" else json.dumps(fixture, ensure_ascii=False)
+        if service == "tmdb" and key.startswith("/search/"):
+            return 200, {}, json.dumps({"page": 1, "results": [], "total_pages": 0, "total_results": 0})
+        if service == "omdb":
+            return 200, {}, json.dumps({"Response": "False", "Error": "Movie not found!"})
+        return 404, {}, error_body(service, 404)
+
+
+def error_body(service, status):
+    if service == "tmdb":
+        messages = {404: (34, "The resource you requested could not be found."),
+                    429: (25, "Your request count is over the allowed limit."),
+                    503: (9, "Service offline.")}
+        status_code, message = messages[status]
+        return json.dumps({"success": False, "status_code": status_code, "status_message": message})
+    if service == "omdb":
+        return json.dumps({"Response": "False", "Error": f'HTTP {status}'})
+    return f'<html><body><h1>{status}</h1></body></html>'
+
+
+class FakeAPIRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        service, _, path = url.path.lstrip("/").partition("/")
+        path = "/" + path
+        if service == "tmdb" and path.startswith("/3/"):
+            path = path[2:]
+        status, headers, body = 404, {}, error_body("imdb", 404)
+        if service in SERVICES:
+            status, headers, body = self.server.fake_api.respond(service,
+                                                                 fixture_key(path, dict(parse_qsl(url.query))))
+            self.server.fake_api.count(service, status)
+
+        encoded_body = body.encode("utf-8")
+        self.send_response(status)
+        content_type = "text/html" if service == "imdb" else "application/json"
+        self.send_header("Content-Type", f'{content_type}; charset=utf-8')
+        self.send_header("Content-Length", str(len(encoded_body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded_body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_server(fixtures=None, **options):
+    """Start a fake server on a free port in a background thread and return it; stop it with .stop() or use it
+       as a context manager. Without fixtures it serves a small generated catalogue."""
+    return FakeAPIServer(fixtures if fixtures is not None else generate_fixtures(), **options).start()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve fixture responses for TMDb, OMDb and IMDb.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--fixtures", help="gzipped JSON fixtures file; a catalogue is generated if omitted")
+    parser.add_argument("--actors", type=int, default=50, help="actors in the generated catalogue")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else generate_fixtures(args.actors)
+    server = FakeAPIServer(fixtures, port=args.port, latency=args.latency, error_rate=args.error_rate)
+    print(f'Serving TMDb at {server.url}/tmdb/3, OMDb at {server.url}/omdb/ and IMDb at {server.url}/imdb')
+    server.httpd.serve_forever()
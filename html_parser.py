@@ -1,66 +1,182 @@
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
+from lxml import html as lxml_html
+import hashlib
+import json
 import os
 import utils
 
+GRAMMY_HTML_DIR = 'data_files/Grammy Award HTMLs'
+GRAMMY_PARSE_MANIFEST_PATH = 'data_files/grammy_html_parse_manifest.json'
+
+CATEGORY_SECTION_CLASS = "h-full w-full flex flex-col items-center mt-6 md-xl:mt-8"
+CEREMONY_CLASS = 'font-polaris text-23 font-medium flex flex-row items-center relative'
+CATEGORY_CLASS = 'w-full text-left md-xl:text-right mb-1 md-xl:mb-20px text-14 md-xl:text-22 font-polaris uppercase'
+NOMINEE_CLASS = ('w-full text-left md-xl:text-22 text-17 mr-10px md-xl:mr-30px font-polaris font-bold '
+                 'md-xl:leading-8 tracking-wider flex flex-row justify-between')
+ARTIST_CLASS = "awards-nominees-link"
+WORKER_CLASS = "text-left text-14 font-polaris"
+WORKER_NAMES_CLASS = "pt-8 pb-4"
+
+
+def grammy_html_docs_and_years():
+    """Pair each grammy webpage with its awards year."""
+    grammy_html_docs = []
+    grammy_award_years = [year for year in range(2023, 1957, -1)]
+
+    # Sorted, so the pairing doesn't depend on the order the file system lists the directory in.
+    for file in sorted(os.listdir(GRAMMY_HTML_DIR)):
+        grammy_html_docs.append(GRAMMY_HTML_DIR + "/" + file)
+    return list(zip(grammy_html_docs, grammy_award_years))
+
 
 def extract_data_from_category_section(category_section):
     """Extract the data from each category section and store it in a dictionary."""
-    category = category_section.find('div', class_='w-full text-left md-xl:text-right mb-1 md-xl:mb-20px text-14 '
-                                                   'md-xl:text-22 font-polaris uppercase').get_text(strip=True)
-    nominee_section = category_section.find_all('div',
-                                                class_='w-full text-left md-xl:text-22 text-17 mr-10px md-xl:mr-30px '
-                                                       'font-polaris font-bold md-xl:leading-8 tracking-wider flex '
-                                                       'flex-row justify-between')
+    category = category_section.find('div', class_=CATEGORY_CLASS).get_text(strip=True)
+    nominee_section = category_section.find_all('div', class_=NOMINEE_CLASS)
     nominees = [nominee.get_text()[:-1].strip('"').replace('"', '').replace('\\', '') for nominee in nominee_section]
-    artist_section = category_section.find_all('div', class_="awards-nominees-link")
+    artist_section = category_section.find_all('div', class_=ARTIST_CLASS)
     artists = [artist.get_text().replace('\n', '') for artist in artist_section]
-    worker_section = category_section.find_all('div', class_="text-left text-14 font-polaris")
-    workers = [workers.find('p', class_="pt-8 pb-4").get_text().replace('\n', '') if workers.find('p', class_="pt-8 pb-4") else list()
+    worker_section = category_section.find_all('div', class_=WORKER_CLASS)
+    workers = [workers.find('p', class_=WORKER_NAMES_CLASS).get_text().replace('\n', '') if workers.find('p', class_=WORKER_NAMES_CLASS) else list()
                for workers in worker_section]
     return [category, nominees, artists, workers]
 
 
+def parse_grammy_html_doc(html_doc, award_year):
+    """Parse one grammy webpage with BeautifulSoup and extract its awards data."""
+    from bs4 import BeautifulSoup
+
+    with open(html_doc, 'r', encoding='utf-8') as file:
+        html_doc = file.read()
+        soup = BeautifulSoup(html_doc, 'html.parser')
+        awards_data = {"ceremony": [], "awards_year": [], "category": [], "nominee": [], "artist": [],
+                       "workers": [], "winner": []}
+        category_sections = soup.find_all('section', class_=CATEGORY_SECTION_CLASS)
+        for category_section in category_sections:
+            category_data = extract_data_from_category_section(category_section)
+            ceremony = soup.find('h2', class_=CEREMONY_CLASS).get_text(strip=True)
+            ceremony_list = ((ceremony + "&&") * len(category_data[1])).split("&&")[:-1]
+            awards_year = str(award_year)
+            awards_year_list = ((awards_year + "&&") * len(category_data[1])).split("&&")[:-1]
+            awards_data["ceremony"].append(ceremony_list)
+            awards_data["awards_year"].append(awards_year_list)
+            category_list = ((category_data[0] + "&&") * len(category_data[1])).split("&&")[:-1]
+            awards_data["category"].append(category_list)
+            awards_data["nominee"].append(category_data[1])
+            awards_data["artist"].append(category_data[2])
+            awards_data["workers"].append(category_data[3])
+            winner_bool_list = [True if nominee == 0 else False for nominee in range(len(category_data[1]))]
+            awards_data["winner"].append(winner_bool_list)
+    return awards_data
+
+
+def with_class(tag, class_name):
+    """XPath for the tags BeautifulSoup's class_ matches: the whole class attribute for a multi-class string,
+       any one of the classes for a single class."""
+    if ' ' in class_name:
+        return f'{tag}[normalize-space(@class) = "{class_name}"]'
+    return f'{tag}[contains(concat(" ", normalize-space(@class), " "), " {class_name} ")]'
+
+
+def element_text(element, strip=False):
+    """Equivalent of BeautifulSoup's get_text() (get_text(strip=True) when strip is set)."""
+    strings = element.xpath('.//text()[not(parent::script or parent::style)]')
+    if strip:
+        return "".join(string.strip() for string in strings)
+    return "".join(strings)
+
+
+def parse_grammy_html_doc_lxml(html_doc, award_year):
+    """Parse one grammy webpage with lxml; the extracted data is the same as parse_grammy_html_doc's."""
+    with open(html_doc, 'rb') as file:
+        tree = lxml_html.fromstring(file.read(), parser=lxml_html.HTMLParser(encoding='utf-8'))
+    awards_data = {"ceremony": [], "awards_year": [], "category": [], "nominee": [], "artist": [],
+                   "workers": [], "winner": []}
+    category_sections = tree.xpath('//' + with_class('section', CATEGORY_SECTION_CLASS))
+    if not category_sections:
+        return awards_data
+
+    # The ceremony heading is the same for every category, so look it up once per page.
+    ceremony = element_text(tree.xpath('//' + with_class('h2', CEREMONY_CLASS))[0], strip=True)
+    awards_year = str(award_year)
+    for category_section in category_sections:
+        category = element_text(category_section.xpath('.//' + with_class('div', CATEGORY_CLASS))[0], strip=True)
+        nominees = [element_text(nominee)[:-1].strip('"').replace('"', '').replace('\\', '')
+                    for nominee in category_section.xpath('.//' + with_class('div', NOMINEE_CLASS))]
+        artists = [element_text(artist).replace('\n', '')
+                   for artist in category_section.xpath('.//' + with_class('div', ARTIST_CLASS))]
+        workers = []
+        for worker in category_section.xpath('.//' + with_class('div', WORKER_CLASS)):
+            worker_names = worker.xpath('.//' + with_class('p', WORKER_NAMES_CLASS))
+            workers.append(element_text(worker_names[0]).replace('\n', '') if worker_names else list())
+
+        awards_data["ceremony"].append([ceremony] * len(nominees))
+        awards_data["awards_year"].append([awards_year] * len(nominees))
+        awards_data["category"].append([category] * len(nominees))
+        awards_data["nominee"].append(nominees)
+        awards_data["artist"].append(artists)
+        awards_data["workers"].append(workers)
+        awards_data["winner"].append([nominee == 0 for nominee in range(len(nominees))])
+    return awards_data
+
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_parse_manifest(manifest_path):
+    if os.path.exists(manifest_path):
+        return utils.load_json_data(manifest_path)
+    return {}
+
+
+def parse_grammy_html_docs_in_parallel(docs_and_years, manifest_path=GRAMMY_PARSE_MANIFEST_PATH,
+                                       max_workers=None):
+    """Parse the grammy webpages with lxml across a process pool. The manifest keeps each page's content hash and
+       parsed data, so only new or changed pages are parsed again; manifest_path=None parses every page."""
+    manifest = load_parse_manifest(manifest_path) if manifest_path else {}
+    updated_manifest = {}
+    to_parse = []
+    for html_doc, award_year in docs_and_years:
+        file_name = os.path.basename(html_doc)
+        sha256 = file_sha256(html_doc)
+        entry = manifest.get(file_name)
+        if entry and entry["sha256"] == sha256 and entry["award_year"] == award_year:
+            updated_manifest[file_name] = entry
+        else:
+            updated_manifest[file_name] = {"sha256": sha256, "award_year": award_year, "awards_data": None}
+            to_parse.append((html_doc, award_year))
+
+    print(f'Parsing {len(to_parse)} of {len(docs_and_years)} html docs; the rest are unchanged.')
+    if to_parse:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            parsed = executor.map(parse_grammy_html_doc_lxml, *zip(*to_parse))
+            for html_doc_no, ((html_doc, _), awards_data) in enumerate(zip(to_parse, parsed), start=1):
+                print(f'Currently on html doc {html_doc_no} / {len(to_parse)}.')
+                updated_manifest[os.path.basename(html_doc)]["awards_data"] = awards_data
+
+    if manifest_path:
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(updated_manifest, f, ensure_ascii=False)
+    return [updated_manifest[os.path.basename(html_doc)]["awards_data"] for html_doc, _ in docs_and_years]
+
+
 annual_grammy_awards_data_list = []
 
 
-def run_html_parser():
-    """Parse each grammy webpage and extract and store data in a dictionary."""
-    grammy_html_docs = []
-    grammy_award_years = [year for year in range(2023, 1957, -1)]
+def run_html_parser(parallel=True, max_workers=None):
+    """Parse each grammy webpage and extract and store data in a dictionary. parallel=False runs the original
+       sequential BeautifulSoup parser."""
+    docs_and_years = grammy_html_docs_and_years()
+    annual_grammy_awards_data_list.clear()
 
-    for file in os.listdir('data_files/Grammy Award HTMLs'):
-        grammy_html_docs.append("data_files/Grammy Award HTMLs/" + file)
-        print(file)
-
-    html_doc_no = 0
-    for html_doc, award_year in zip(grammy_html_docs, grammy_award_years):
-        html_doc_no += 1
-        print(f'Currently on html doc {html_doc_no} / {len(grammy_html_docs)}.')
-        with open(html_doc, 'r', encoding='utf-8') as file:
-            html_doc = file.read()
-            soup = BeautifulSoup(html_doc, 'html.parser')
-            awards_data = {"ceremony": [], "awards_year": [], "category": [], "nominee": [], "artist": [],
-                           "workers": [], "winner": []}
-            category_sections = soup.find_all('section',
-                                              class_="h-full w-full flex flex-col items-center mt-6 md-xl:mt-8")
-            for category_section in category_sections:
-                category_data = extract_data_from_category_section(category_section)
-                ceremony = soup.find('h2',
-                                     class_='font-polaris text-23 font-medium flex flex-row items-center '
-                                            'relative').get_text(strip=True)
-                ceremony_list = ((ceremony + "&&") * len(category_data[1])).split("&&")[:-1]
-                awards_year = str(award_year)
-                awards_year_list = ((awards_year + "&&") * len(category_data[1])).split("&&")[:-1]
-                awards_data["ceremony"].append(ceremony_list)
-                awards_data["awards_year"].append(awards_year_list)
-                category_list = ((category_data[0] + "&&") * len(category_data[1])).split("&&")[:-1]
-                awards_data["category"].append(category_list)
-                awards_data["nominee"].append(category_data[1])
-                awards_data["artist"].append(category_data[2])
-                awards_data["workers"].append(category_data[3])
-                winner_bool_list = [True if nominee == 0 else False for nominee in range(len(category_data[1]))]
-                awards_data["winner"].append(winner_bool_list)
-
-            annual_grammy_awards_data_list.append(awards_data)
+    if parallel:
+        annual_grammy_awards_data_list.extend(parse_grammy_html_docs_in_parallel(docs_and_years,
+                                                                                 max_workers=max_workers))
+    else:
+        for html_doc_no, (html_doc, award_year) in enumerate(docs_and_years, start=1):
+            print(f'Currently on html doc {html_doc_no} / {len(docs_and_years)}.')
+            annual_grammy_awards_data_list.append(parse_grammy_html_doc(html_doc, award_year))
 
     utils.save_data_as_json("data_files/annual_grammy_awards.json", annual_grammy_awards_data_list)
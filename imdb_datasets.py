@@ -0,0 +1,125 @@
+""" This file contains the ingester for IMDb's non-commercial TSV datasets, which backfill fields that would
+    otherwise have to be requested from OMDb one movie at a time. """
+
+import csv
+import os
+
+import pandas as pd
+import requests
+
+import utils
+
+IMDB_DATASET_URL = "https://datasets.imdbws.com/{file_name}"
+TITLE_BASICS_PATH = "data_files/title.basics.tsv.gz"
+TITLE_RATINGS_PATH = "data_files/title.ratings.tsv.gz"
+IMDB_TITLE_STORE_PATH = "data_files/imdb_titles.parquet"
+# IMDb refreshes the datasets daily; a week-old copy only lags on the newest titles and votes.
+DATASET_MAX_AGE = 7 * 24 * 60 * 60
+
+TITLE_BASICS_COLUMNS = ["tconst", "titleType", "primaryTitle", "startYear", "runtimeMinutes", "genres"]
+TITLE_RATINGS_COLUMNS = ["tconst", "averageRating", "numVotes"]
+
+# OMDb reports TV movies, shorts and videos as movies too.
+OMDB_TYPES = {"movie": "movie", "tvMovie": "movie", "short": "movie", "video": "movie", "tvSeries": "series",
+              "tvMiniSeries": "series", "tvEpisode": "episode", "videoGame": "game"}
+
+
+def download_imdb_datasets(paths=(TITLE_BASICS_PATH, TITLE_RATINGS_PATH)):
+    """Download the title basics and ratings datasets (or the given ones of them). Each is written beside its
+       path and swapped in once complete, so a failed download keeps the previous copy."""
+    for path in paths:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with requests.get(IMDB_DATASET_URL.format(file_name=os.path.basename(path)), stream=True) as response:
+            response.raise_for_status()
+            with open(path + ".part", 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+        os.replace(path + ".part", path)
+
+
+def ensure_imdb_datasets(max_age=DATASET_MAX_AGE):
+    """Download the datasets that are missing or older than max_age seconds; return whether both are there. If
+       a download fails, an older copy is used as it is."""
+    stale_paths = [path for path in (TITLE_BASICS_PATH, TITLE_RATINGS_PATH) if utils.is_stale(path, max_age)]
+    if stale_paths:
+        try:
+            download_imdb_datasets(stale_paths)
+        except OSError as e:  # requests' errors are OSErrors too
+            print(f'Could not download the IMDb datasets ({e}).')
+    return all(os.path.exists(path) for path in (TITLE_BASICS_PATH, TITLE_RATINGS_PATH))
+
+
+def read_tsv_in_chunks(path, columns, imdb_ids, chunksize=500000):
+    """Stream a gzipped IMDb TSV chunk by chunk, keeping only the rows for the given IMDb IDs."""
+    chunks = pd.read_csv(path, sep="\t", usecols=columns, dtype=str, na_values=["\\N"], keep_default_na=False,
+                         quoting=csv.QUOTE_NONE, chunksize=chunksize)
+    for chunk in chunks:
+        yield chunk[chunk["tconst"].isin(imdb_ids)]
+
+
+def ingest_imdb_datasets(imdb_ids, basics_path=TITLE_BASICS_PATH, ratings_path=TITLE_RATINGS_PATH,
+                         store_path=IMDB_TITLE_STORE_PATH):
+    """Stream the basics and ratings datasets and store our titles as a Parquet table sorted by tconst, so a
+       lookup reads only the row groups and columns it needs."""
+    imdb_ids = list(set(imdb_ids))
+    basics = pd.concat(read_tsv_in_chunks(basics_path, TITLE_BASICS_COLUMNS, imdb_ids), ignore_index=True)
+    ratings = pd.concat(read_tsv_in_chunks(ratings_path, TITLE_RATINGS_COLUMNS, imdb_ids), ignore_index=True)
+    imdb_titles = basics.merge(ratings, on="tconst", how="left").sort_values("tconst", ignore_index=True)
+    imdb_titles.to_parquet(store_path, index=False)
+    print(f'Stored IMDb dataset rows for {len(imdb_titles)} of {len(imdb_ids)} IMDb IDs.')
+
+
+def load_imdb_titles(imdb_ids, store_path=IMDB_TITLE_STORE_PATH):
+    """Load the stored dataset rows for the given IMDb IDs, indexed by tconst."""
+    imdb_titles = pd.read_parquet(store_path, filters=[("tconst", "in", list(set(imdb_ids)))])
+    return imdb_titles.set_index("tconst")
+
+
+def to_omdb_fields(imdb_title):
+    """Format an IMDb dataset row the way OMDb formats the same fields."""
+    omdb_fields = {"Type": OMDB_TYPES.get(imdb_title["titleType"]), "Title": None, "Year": None, "Genre": None,
+                   "Runtime": None, "imdbRating": None, "imdbVotes": None}
+    if pd.notna(imdb_title["primaryTitle"]):
+        omdb_fields["Title"] = imdb_title["primaryTitle"]
+    if pd.notna(imdb_title["startYear"]):
+        omdb_fields["Year"] = str(int(imdb_title["startYear"]))
+    if pd.notna(imdb_title["genres"]):
+        omdb_fields["Genre"] = imdb_title["genres"].replace(",", ", ")
+    if pd.notna(imdb_title["runtimeMinutes"]):
+        omdb_fields["Runtime"] = f'{imdb_title["runtimeMinutes"]} min'
+    if pd.notna(imdb_title["averageRating"]):
+        omdb_fields["imdbRating"] = imdb_title["averageRating"]
+    if pd.notna(imdb_title["numVotes"]):
+        omdb_fields["imdbVotes"] = f'{int(imdb_title["numVotes"]):,}'
+    return omdb_fields
+
+
+def backfill_omdb_movie_data(omdb_movie_data_list, store_path=IMDB_TITLE_STORE_PATH):
+    """Fill the Type, Title, Year, Genre, Runtime, imdbRating and imdbVotes fields that OMDb left missing or
+       "N/A" from the stored IMDb datasets, in place; return the number of fields filled."""
+    if not os.path.exists(store_path):
+        print(f'No IMDb dataset store at {store_path}; skipping the backfill.')
+        return 0
+
+    imdb_ids = [movie["imdbID"] for movie in omdb_movie_data_list if movie.get("imdbID")]
+    imdb_titles = load_imdb_titles(imdb_ids, store_path)
+    filled_count = 0
+    for movie in omdb_movie_data_list:
+        if movie.get("imdbID") not in imdb_titles.index:
+            continue
+        for field, value in to_omdb_fields(imdb_titles.loc[movie["imdbID"]]).items():
+            if movie.get(field) in (None, "N/A") and value is not None:
+                movie[field] = value
+                filled_count += 1
+    print(f'Backfilled {filled_count} OMDb fields from the IMDb datasets.')
+    return filled_count
+
+
+def ingest_imdb_datasets_for_collected_movies():
+    """Ingest the IMDb dataset rows for every movie collected from TMDb, downloading the datasets first if they
+       are missing or stale. Without them the ingestion is skipped, and OMDb's missing fields aren't backfilled."""
+    if not ensure_imdb_datasets():
+        print(f'No IMDb datasets at {TITLE_BASICS_PATH} and {TITLE_RATINGS_PATH}; skipping the ingestion.')
+        return
+    tmdb_movie_data_list = utils.load_records("original_tmdb_movie_data_list_all_2225.json", columns=["IMDb_ID"])
+    ingest_imdb_datasets(movie["IMDb_ID"] for movie in tmdb_movie_data_list if movie["IMDb_ID"])
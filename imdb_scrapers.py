@@ -1,57 +1,250 @@
 """File that contains the functions that scrape and store actor/film data from film websites.
     Scraper 1: Black actor names and imdb IDs from imdb
-    Scraper 2: Movie box office data (worldwide gross, box office gross) from imdb
-    Scraper 3: Soundtrack credits data from imdb
+    Scraper 2: Movie box office data (worldwide gross, box office gross) and soundtrack credits data from imdb,
+               fetched for each unique title in one crawl
+    Both run in a single crawler process (the Twisted reactor can't be restarted), and every scraped item is
+    streamed to a JSON lines feed as it arrives.
 """
 import utils
 import scrapy
+from scrapy import signals
 from scrapy.crawler import CrawlerProcess
+from scrapy.utils.reactor import install_reactor
+import json
+import os
 import re
 import warnings
 
 warnings.filterwarnings("ignore", category=scrapy.crawler.ScrapyDeprecationWarning)
 
-# Dictionary for scraped actor names and IDs from imdb
-actor_names_and_ids = {"imdb_ids": [], "names": []}
-
-
-def run_actor_name_crawler():
-    """Create a list of imdb URLs and scrape actor names and ids."""
-    actor_list_urls = []
+IMDB_BASE_URL = 'https://www.imdb.com'
+IMDB_FEED_DIR = "data_files/imdb_feeds"
+
+CRAWLER_SETTINGS = {
+    'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                  'Chrome/91.0.4472.124 Safari/537.36',
+    'CONCURRENT_REQUESTS': 32,
+    'CONCURRENT_REQUESTS_PER_DOMAIN': 16,
+    # AutoThrottle adapts the delay to IMDb's response times, aiming for ~8 requests in flight.
+    'AUTOTHROTTLE_ENABLED': True,
+    'AUTOTHROTTLE_START_DELAY': 0.5,
+    'AUTOTHROTTLE_MAX_DELAY': 10,
+    'AUTOTHROTTLE_TARGET_CONCURRENCY': 8.0,
+    'RETRY_TIMES': 3,
+    'LOG_LEVEL': 'INFO',
+    'ITEM_PIPELINES': {'imdb_scrapers.JsonLinesFeedPipeline': 300},
+    'TWISTED_REACTOR': 'twisted.internet.asyncioreactor.AsyncioSelectorReactor',
+}
+
+
+def feed_path(feed_name):
+    return os.path.join(IMDB_FEED_DIR, f'{feed_name}.jsonl')
+
+
+class JsonLinesFeedPipeline:
+    """Append every scraped item to its spider's JSON lines feed as soon as it arrives, so memory stays flat.
+       Spiders with several feeds route items with feed_name_for. Items go to a .part file beside the feed, which
+       replaces the feed only once the spider has finished, so an interrupted crawl keeps the previous run's
+       feed (and leaves what it scraped in the .part file)."""
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls()
+        crawler.signals.connect(pipeline.spider_closed, signal=signals.spider_closed)
+        return pipeline
+
+    def open_spider(self, spider):
+        os.makedirs(IMDB_FEED_DIR, exist_ok=True)
+        feed_names = getattr(spider, 'feed_names', [getattr(spider, 'feed_name', None)])
+        self.feeds = {feed_name: open(feed_path(feed_name) + '.part', 'w', encoding='utf-8')
+                      for feed_name in feed_names}
+
+    def process_item(self, item, spider):
+        feed_name = spider.feed_name_for(item) if hasattr(spider, 'feed_name_for') else spider.feed_name
+        feed = self.feeds[feed_name]
+        feed.write(json.dumps(dict(item), ensure_ascii=False) + "\n")
+        feed.flush()
+        return item
+
+    def close_spider(self, spider):
+        for feed in self.feeds.values():
+            feed.close()
+
+    def spider_closed(self, spider, reason):
+        # Sent after the pipelines have closed, with the reason the crawl stopped.
+        if reason != 'finished':
+            print(f'{spider.name} stopped ({reason}); keeping the previous feeds.')
+            return
+        for feed_name in self.feeds:
+            os.replace(feed_path(feed_name) + '.part', feed_path(feed_name))
+
+
+def actor_list_urls():
+    """Create a list of the imdb URLs which display the lists of actor names."""
+    urls = []
     for i in range(1, 9):
-        # get url which displays list of actor names
-        imdb_url = f'https://www.imdb.com/list/ls006050174/?sort=list_order,asc&mode=detail&page={i}'
-        actor_list_urls.append(imdb_url)
-
+        urls.append(f'{IMDB_BASE_URL}/list/ls006050174/?sort=list_order,asc&mode=detail&page={i}')
     for i in range(1, 16):
-        imdb_url = f'https://www.imdb.com/list/ls066061932/?sort=list_order,asc&mode=detail&page={i}'
-        actor_list_urls.append(imdb_url)
-
-    # Create the Spider class for imdb_actor_names
-    class ScrapeActors(scrapy.Spider):
-        name = 'imdb_actor_names'
-
-        def start_requests(self):
-            for url in actor_list_urls:
-                yield scrapy.Request(url=url, callback=self.parse)
-
-        def parse(self, response):
-            # Extract actor IMDb IDs and names
-            # Create a SelectorList of the IMDb html links (which contain the IDs)
-            act_links = response.xpath(
-                '//h3[@class = "lister-item-header"]/a/@href')
-            for link in act_links.extract():
-                actor_names_and_ids["imdb_ids"].append(re.sub("(/name/)", "", link))
-
-            # Create a SelectorList of the actor name headers (which is the actor name in text format)
-            act_names = response.xpath(
-                '//h3[@class = "lister-item-header"]/a/text()')
-            for name in act_names.extract():
-                actor_names_and_ids["names"].append(name.strip(" \n"))  # extract, clean, and append names
-
-    process = CrawlerProcess()
-    process.crawl(ScrapeActors)
+        urls.append(f'{IMDB_BASE_URL}/list/ls066061932/?sort=list_order,asc&mode=detail&page={i}')
+    return urls
+
+
+class ScrapeActors(scrapy.Spider):
+    name = 'imdb_actor_names'
+    feed_name = 'actor_names_and_ids'
+
+    def start_requests(self):
+        for url in actor_list_urls():
+            yield scrapy.Request(url=url, callback=self.parse)
+
+    def parse(self, response):
+        # Extract actor IMDb IDs and names
+        # Create a SelectorList of the IMDb html links (which contain the IDs)
+        act_links = response.xpath(
+            '//h3[@class = "lister-item-header"]/a/@href')
+        imdb_ids = [re.sub("(/name/)", "", link) for link in act_links.extract()]
+
+        # Create a SelectorList of the actor name headers (which is the actor name in text format)
+        act_names = response.xpath(
+            '//h3[@class = "lister-item-header"]/a/text()')
+        names = [name.strip(" \n") for name in act_names.extract()]  # extract and clean names
+        yield {"imdb_ids": imdb_ids, "names": names}
+
+
+def collected_imdb_movie_ids():
+    """Load the unique, non-null IMDb IDs of the collected TMDb movies, in their original order."""
+    tmdb_movie_data_list = utils.load_records("data_files/updated_additional_tmdb_movie_data_list.json",
+                                              columns=["IMDb_ID"])
+    return [imdb_id for imdb_id in dict.fromkeys(movie_data["IMDb_ID"] for movie_data in tmdb_movie_data_list)
+            if imdb_id is not None]
+
+
+class ScrapeMovieTitles(scrapy.Spider):
+    """Scrape each movie's IMDb summary page for the US Opening Weekend Gross and Worldwide Box Office Gross
+       figures, and its soundtrack page for the soundtrack credits. Pages are kept in Scrapy's on-disk HTTP cache,
+       so a crawl run with IMDB_OFFLINE set replays them without touching the network."""
+    name = 'movie_title_scraper'
+    feed_names = ['box_office_data', 'soundtrack_credits_data']
+    custom_settings = {
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_DIR': 'imdb_http_cache',
+        'HTTPCACHE_EXPIRATION_SECS': 0,
+        'HTTPCACHE_GZIP': True,
+        'HTTPCACHE_IGNORE_HTTP_CODES': [403, 429, 500, 502, 503, 504],
+    }
+
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        if settings.getbool('IMDB_OFFLINE'):
+            # Drop requests for pages that aren't cached instead of fetching them.
+            settings.set('HTTPCACHE_IGNORE_MISSING', True, priority='spider')
+
+    def start_requests(self):
+        for imdb_id in collected_imdb_movie_ids():
+            yield scrapy.Request(url=f'{IMDB_BASE_URL}/title/{imdb_id}/', callback=self.parse_summary)
+            yield scrapy.Request(url=f'{IMDB_BASE_URL}/title/{imdb_id}/soundtrack/', callback=self.parse_soundtrack)
+
+    def feed_name_for(self, item):
+        return 'soundtrack_credits_data' if "credits" in item else 'box_office_data'
+
+    def parse_summary(self, response):
+        # Extract first billed cast and names
+        imdb_movie_id = (response.xpath('//meta[contains(@property, "pageConst")]/@content').extract_first())
+        opening_weekend_gross = (response.xpath(
+            '//li[contains(@data-testid, "weekend")]//span[contains(@class, "content-item")]/text()')
+                                 .extract_first())
+        worldwide_gross = (response.xpath(
+            '//li[contains(@data-testid, "worldwide")]//span[contains(@class, "content-item")]/text()')
+                           .extract_first())
+        yield dict(IMDb_ID=imdb_movie_id, Opening_Weekend_Gross=opening_weekend_gross,
+                   Worldwide_Gross=worldwide_gross)
+
+    def parse_soundtrack(self, response):
+        # Iterate through each <li> element
+        imdb_movie_id = response.xpath(
+            'substring-before(substring-after(//meta[@property="og:url"]/@content, "/title/"), "/soundtrack/")').extract_first()
+        soundtrack_credits = {"imdb_ID": imdb_movie_id, "credits": []}
+        for track_element in response.xpath('//li[@class="ipc-metadata-list__item ipc-metadata-list__item--stacked"]'):
+            track_credit = {"title": track_element.xpath('.//span[@class="ipc-metadata-list-item__label"]/text()').get()}
+            for person_element in track_element.xpath('.//div[@class="ipc-html-content-inner-div"]'):
+                text_p1 = person_element.xpath('./text()[1]').get()
+                if text_p1 == 'Written by ':
+                    track_credit["writers"] = self.extract_people_info(person_element)
+                elif (text_p1[:11] == 'Written by ') and (len(text_p1) > 11):
+                    track_credit["writers"] = text_p1
+                if text_p1 == "Performed by ":
+                    track_credit["performers"] = self.extract_people_info(person_element)
+                elif (text_p1[:13] == 'Performed by ') and (len(text_p1) > 13):
+                    track_credit["performers"] = text_p1
+                if text_p1 == "Arranged by ":
+                    track_credit["arrangers"] = self.extract_people_info(person_element)
+                elif (text_p1[:12] == 'Arranged by') and (len(text_p1) > 12):
+                    track_credit["arrangers"] = text_p1
+
+            soundtrack_credits["credits"].append(track_credit)
+        yield soundtrack_credits
+
+    def extract_people_info(self, person_element):
+        people_info = []
+        # Extract the links inside the div
+        links = person_element.xpath('.//a[@class="ipc-md-link ipc-md-link--entity"]')
+
+        # Extract the name and IMDb ID for each link
+        for link in links:
+            name = link.xpath('text()').get()
+            person_imdb_id = link.xpath('@href').re_first(r'/name/(nm\d+)/')
+            person_info = {'name': name, 'imdb_id': person_imdb_id}
+            people_info.append(person_info)
+
+        return people_info
+
+
+def run_imdb_title_crawler(offline=False):
+    """Re-run only the title crawl, e.g. after changing its parsing. With offline=True the pages are replayed
+       from the HTTP cache and nothing is fetched."""
+    process = CrawlerProcess(dict(CRAWLER_SETTINGS, IMDB_OFFLINE=offline))
+    process.crawl(ScrapeMovieTitles)
     process.start()
+    save_box_office_data()
+    save_soundtrack_credits_data()
+
+
+def run_imdb_crawlers(between_crawls=None):
+    """Run every IMDb crawl in one crawler process: the actor name crawl first, then between_crawls (the API
+       collection, which needs the actor IDs and produces the movie IDs) in a worker thread, then the title
+       crawl."""
+    process = CrawlerProcess(CRAWLER_SETTINGS)
+    # Importing the reactor installs Twisted's default one unless another is installed first, and the crawls
+    # refuse to run on a reactor other than the configured one.
+    install_reactor(CRAWLER_SETTINGS['TWISTED_REACTOR'])
+    from twisted.internet import defer, reactor, threads
+    errors = []
+
+    @defer.inlineCallbacks
+    def crawl_in_sequence():
+        try:
+            yield process.crawl(ScrapeActors)
+            save_actor_names_and_ids()
+            verify_actor_name_data()
+            if between_crawls is not None:
+                yield threads.deferToThread(between_crawls)
+            yield process.crawl(ScrapeMovieTitles)
+            save_box_office_data()
+            save_soundtrack_credits_data()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            reactor.stop()
+
+    reactor.callWhenRunning(crawl_in_sequence)
+    process.start(stop_after_crawl=False)
+    if errors:
+        raise errors[0]
+
+
+# Dictionary for scraped actor names and IDs from imdb
+actor_names_and_ids = {"imdb_ids": [], "names": []}
 
 
 def verify_actor_name_data():
@@ -71,129 +264,20 @@ def verify_actor_name_data():
 
 
 def save_actor_names_and_ids():
-    """Save actor name and id dictionary as json."""
+    """Combine the scraped actor list pages and save the actor name and id dictionary as json."""
+    actor_names_and_ids["imdb_ids"].clear()
+    actor_names_and_ids["names"].clear()
+    for list_page in utils.load_json_lines_data(feed_path(ScrapeActors.feed_name)):
+        actor_names_and_ids["imdb_ids"] += list_page["imdb_ids"]
+        actor_names_and_ids["names"] += list_page["names"]
     utils.save_data_as_json("data_files/actor_names_and_ids.json", actor_names_and_ids)
 
 
-# List for imdb box office data dictionaries
-box_office_data_list = []
-
-
-def run_imdb_box_office_data_summary_crawler():
-    """Scrape the movie's IMDb summary page to retrieve the US Opening Weekend Gross 
-       and Worldwide Box Office Gross figures."""
-    # Load the two tmdb movie data lists to use.
-    tmdb_movie_data_list = utils.load_json_data("data_files/updated_additional_tmdb_movie_data_list.json")
-
-    imdb_summary_urls = []
-
-    for movie_data in tmdb_movie_data_list:
-        if movie_data["IMDb_ID"] is not None:
-            imdb_id = movie_data["IMDb_ID"]
-            summary_url = f'https://www.imdb.com/title/{imdb_id}/'
-            imdb_summary_urls.append(summary_url)
-
-    # Create the Spider class
-    class ScrapeMovieSummary(scrapy.Spider):
-        name = 'movie_summary_scraper'
-        custom_settings = {
-            'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-
-        def start_requests(self):
-            count = 0
-            for url in imdb_summary_urls:
-                count += 1
-                print(f'Currently on page {count} of {len(imdb_summary_urls)}.')
-                yield scrapy.Request(url=url, callback=self.parse)
-
-        def parse(self, response):
-            # Extract first billed cast and names
-            imdb_movie_id = (response.xpath('//meta[contains(@property, "pageConst")]/@content').extract_first())
-            opening_weekend_gross = (response.xpath(
-                '//li[contains(@data-testid, "weekend")]//span[contains(@class, "content-item")]/text()')
-                                  .extract_first())
-            worldwide_gross = (response.xpath(
-                '//li[contains(@data-testid, "worldwide")]//span[contains(@class, "content-item")]/text()')
-                               .extract_first())
-            box_office_data = dict(IMDb_ID=imdb_movie_id, Opening_Weekend_Gross=opening_weekend_gross,
-                                   Worldwide_Gross=worldwide_gross)
-            box_office_data_list.append(box_office_data)
-
-    process = CrawlerProcess()
-    process.crawl(ScrapeMovieSummary)
-    process.start()
+def save_box_office_data():
+    utils.save_data_as_json("additional_box_office_data_list.json",
+                            utils.load_json_lines_data(feed_path('box_office_data')))
 
-    utils.save_data_as_json("additional_box_office_data_list.json", box_office_data_list)
-
-
-soundtrack_credits_data_list = []
-
-
-def run_soundtrack_credits_crawler():
-    print("I get here.")
-    tmdb_movie_data_list = utils.load_json_data("data_files/updated_additional_tmdb_movie_data_list.json")
-    imdb_soundtrack_urls = []
-
-    for movie_data in tmdb_movie_data_list:
-        imdb_id = movie_data["IMDb_ID"]
-        soundtrack_url = f'https://www.imdb.com/title/{imdb_id}/soundtrack/'
-        imdb_soundtrack_urls.append(soundtrack_url)
-
-    class ScrapeSoundtrackCredits(scrapy.Spider):
-        name = 'soundtrack_creds_scraper'
-        custom_settings = {
-            'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-
-        def start_requests(self):
-            count = 0
-            for url in imdb_soundtrack_urls:
-                count += 1
-                print(f"Currently on url {count} / {len(imdb_soundtrack_urls)}.")
-                yield scrapy.Request(url=url, callback=self.parse)
-
-        def parse(self, response):
-            # Iterate through each <li> element
-            imdb_movie_id = response.xpath(
-                'substring-before(substring-after(//meta[@property="og:url"]/@content, "/title/"), "/soundtrack/")').extract_first()
-            soundtrack_credits = {"imdb_ID": imdb_movie_id, "credits": []}
-            for track_element in response.xpath('//li[@class="ipc-metadata-list__item ipc-metadata-list__item--stacked"]'):
-                track_credit = {"title": track_element.xpath('.//span[@class="ipc-metadata-list-item__label"]/text()').get()}
-                for person_element in track_element.xpath('.//div[@class="ipc-html-content-inner-div"]'):
-                    text_p1 = person_element.xpath('./text()[1]').get()
-                    if text_p1 == 'Written by ':
-                        track_credit["writers"] = self.extract_people_info(person_element)
-                    elif (text_p1[:11] == 'Written by ') and (len(text_p1) > 11):
-                        track_credit["writers"] = text_p1
-                    if text_p1 == "Performed by ":
-                        track_credit["performers"] = self.extract_people_info(person_element)
-                    elif (text_p1[:13] == 'Performed by ') and (len(text_p1) > 13):
-                        track_credit["performers"] = text_p1
-                    if text_p1 == "Arranged by ":
-                        track_credit["arrangers"] = self.extract_people_info(person_element)
-                    elif (text_p1[:12] == 'Arranged by') and (len(text_p1) > 12):
-                        track_credit["arrangers"] = text_p1
-
-                soundtrack_credits["credits"].append(track_credit)
-            soundtrack_credits_data_list.append(soundtrack_credits)
-
-        def extract_people_info(self, person_element):
-            people_info = []
-            # Extract the links inside the div
-            links = person_element.xpath('.//a[@class="ipc-md-link ipc-md-link--entity"]')
-
-            # Extract the name and IMDb ID for each link
-            for link in links:
-                name = link.xpath('text()').get()
-                person_imdb_id = link.xpath('@href').re_first(r'/name/(nm\d+)/')
-                person_info = {'name': name, 'imdb_id': person_imdb_id}
-                people_info.append(person_info)
-
-            return people_info
-
-    process = CrawlerProcess()
-    process.crawl(ScrapeSoundtrackCredits)
-    process.start()
 
-    utils.save_data_as_json("additional_soundtrack_credits_data_list.json", soundtrack_credits_data_list)
+def save_soundtrack_credits_data():
+    utils.save_data_as_json("additional_soundtrack_credits_data_list.json",
+                            utils.load_json_lines_data(feed_path('soundtrack_credits_data')))
@@ -2,16 +2,59 @@
 
 import utils
 import pandas as pd
-import requests
 import hidden
 import time
 import json
+import api_client
+import response_cache
+import work_queue
+import request_quota
+import requests
+import itertools
+
+OMDB_BASE_URL = 'http://www.omdbapi.com/'
+OMDB_RATE_LIMIT = 10
+OMDB_MAX_WORKERS = 4
+
+
+# OMDb errors that are a definitive answer about the movie, rather than a failed request worth retrying.
+DEFINITIVE_OMDB_ERRORS = {"Movie not found!", "Incorrect IMDb ID."}
+
+
+def is_definitive_omdb_answer(movie_info):
+    """Check whether OMDb found the movie or definitively reported that it doesn't exist."""
+    return movie_info is not None and (movie_info.get("Response") != "False" or
+                                       movie_info.get("Error") in DEFINITIVE_OMDB_ERRORS)
+
+
+def is_cacheable_omdb_response(response):
+    """Only cache definitive answers, not transient errors or quota messages."""
+    try:
+        movie_info = response.json()
+    except json.decoder.JSONDecodeError:
+        return False
+    return is_definitive_omdb_answer(movie_info)
+
+
+omdb_response_cache = response_cache.ResponseCache(default_ttl=90 * response_cache.DAY)
+omdb_client = api_client.APIClient(OMDB_BASE_URL, rate_limit=OMDB_RATE_LIMIT, max_workers=OMDB_MAX_WORKERS,
+                                   cache=omdb_response_cache, should_cache=is_cacheable_omdb_response, adaptive=True)
 
-def get_omdb_movie_info_by_id(imdb_movie_id):
+# Free OMDb keys allow 1,000 requests a day; usage is tracked per key per day across runs and processes.
+OMDB_DAILY_REQUEST_LIMIT = 1000
+omdb_quota = request_quota.DailyQuota("data_files/omdb_request_quota.sqlite", daily_limit=OMDB_DAILY_REQUEST_LIMIT)
+
+
+def omdb_api_keys():
+    """Return the configured OMDb API keys; secrets may list several under "omdb_api_keys"."""
+    omdb_secrets = hidden.secrets["omdb"]
+    return omdb_secrets.get("omdb_api_keys") or [omdb_secrets["omdb_api_key"]]
+
+
+def get_omdb_movie_info(params, api_key=None, before_send=None):
     """Get movie information from OMDb's Web API."""
-    base_url = 'http://www.omdbapi.com/?' 
-    params = {'apikey': hidden.secrets["omdb"]["omdb_api_key"], 'i': imdb_movie_id, 'type': 'movie', 'plot': 'full'}
-    response = requests.get(base_url, params=params)
+    params = dict(params, apikey=api_key or hidden.secrets["omdb"]["omdb_api_key"], type='movie', plot='full')
+    response = omdb_client.get('', params=params, before_send=before_send)
     if response.ok:
         try:
             movie_info = response.json()
@@ -23,93 +66,163 @@ def get_omdb_movie_info_by_id(imdb_movie_id):
             print(f"Request successful. Error decoding JSON: {e}")
     else:
         print(f"Request failed with status code: {response.status_code}")
+        # OMDb explains failures such as a spent daily limit in a JSON body.
+        try:
+            return response.json()
+        except json.decoder.JSONDecodeError:
+            return None
 
-def get_omdb_movie_info_by_title(title):
+
+def get_omdb_movie_info_by_id(imdb_movie_id, api_key=None, before_send=None):
     """Get movie information from OMDb's Web API."""
-    base_url = 'http://www.omdbapi.com/?' 
-    params = {'apikey': hidden.secrets["omdb"]["omdb_api_key"], 't': title, 'type': 'movie', 'plot': 'full'}
-    response = requests.get(base_url, params=params)
-    if response.ok:
-        try:
-            movie_info = response.json()
-            if movie_info is not None:
-                return movie_info
-            else:
-                print(response.text)
-        except json.decoder.JSONDecodeError as e:
-            print(f"Request successful. Error decoding JSON: {e}")
-    else:
-        print(f"Request failed with status code: {response.status_code}")
+    return get_omdb_movie_info({'i': imdb_movie_id}, api_key, before_send)
+
+
+def get_omdb_movie_info_by_title(title, api_key=None, before_send=None):
+    """Get movie information from OMDb's Web API."""
+    return get_omdb_movie_info({'t': title}, api_key, before_send)
 
 
 omdb_movie_data_from_ids_list = []
 omdb_movie_data_from_titles_list = []
 
 
-def retrieve_actor_and_movie_data_from_omdb():
+def retrieve_omdb_movie_record(lookup, get_movie_info):
+    """Look a movie up in OMDb within the daily quota, spreading requests over the keys with budget left.
+       Raises StopRun once every key is spent for the day, so the rest of the queue waits for tomorrow, and
+       raises RuntimeError when there is no definitive answer, so the work queue retries the item later."""
+    while True:
+        api_key = omdb_quota.key_with_budget(omdb_api_keys())
+        if api_key is None:
+            raise work_queue.StopRun("the OMDb daily request quota is spent for every key.")
+        try:
+            omdb_movie_info = get_movie_info(lookup, api_key, before_send=lambda: omdb_quota.consume(api_key))
+        except request_quota.QuotaExhausted:
+            continue
+        except requests.RequestException:
+            omdb_client.rate_limiter.record_failure()
+            raise
+        if omdb_movie_info is not None and omdb_movie_info.get("Error") == "Request limit reached!":
+            omdb_quota.mark_exhausted(api_key)
+            continue
+        break
+
+    if not is_definitive_omdb_answer(omdb_movie_info):
+        omdb_client.rate_limiter.record_failure()
+        raise RuntimeError(f'No definitive OMDb answer for {lookup!r}: {omdb_movie_info}')
+    omdb_client.rate_limiter.record_success()
+    return omdb_movie_info
+
+
+def report_omdb_quota_plan(queue):
+    """Print how much of the queue fits in today's budget and when the whole queue should be finished."""
+    pending_count = len(queue.pending_items())
+    requests_today, completion = omdb_quota.plan(pending_count, omdb_api_keys(), omdb_client.rate_limiter.rate)
+    print(f'{queue.name}: {pending_count} requests pending, {requests_today} fit in today\'s OMDb budget. '
+          f'Projected completion: {completion:%Y-%m-%d %H:%M} UTC.')
+
+
+def retrieve_omdb_by_id_shard(shard_index, shard_count):
+    """Work through one shard of the by-ID queue."""
+    if shard_count > 1:
+        omdb_client.prepare_for_shard(shard_count)
+    id_queue = work_queue.WorkQueue("omdb_by_id", shard_index, shard_count)
+    report_omdb_quota_plan(id_queue)
+    id_queue.run(lambda imdb_id: retrieve_omdb_movie_record(imdb_id, get_omdb_movie_info_by_id),
+                 map_func=omdb_client.map)
+
+
+def retrieve_omdb_by_title_shard(shard_index, shard_count):
+    """Work through one shard of the by-title queue."""
+    if shard_count > 1:
+        omdb_client.prepare_for_shard(shard_count)
+    title_queue = work_queue.WorkQueue("omdb_by_title", shard_index, shard_count)
+    report_omdb_quota_plan(title_queue)
+    title_queue.run(lambda title: retrieve_omdb_movie_record(title, get_omdb_movie_info_by_title),
+                    map_func=omdb_client.map)
+
+
+def plan_omdb_title_lookups(actor_data_list, omdb_movie_data_from_ids):
+    """Flatten every actor's movie credits in one linear pass and return the distinct titles, keyed by normalised
+       title, that the by-ID pass hasn't already resolved."""
+    resolved_titles = {utils.normalise_title(movie["Title"]) for movie in omdb_movie_data_from_ids
+                       if movie.get("Response") != "False" and movie.get("Title")}
+
+    credited_titles = itertools.chain.from_iterable(actor["Movie_Credits"] for actor in actor_data_list)
+    credit_count = 0
+    unique_titles = {}
+    for title in credited_titles:
+        credit_count += 1
+        if title is not None:
+            unique_titles.setdefault(utils.normalise_title(title), title)
+
+    unresolved_titles = {normalised_title: title for normalised_title, title in unique_titles.items()
+                         if normalised_title not in resolved_titles}
+    print(f'By title : {credit_count} credits, {len(unique_titles)} distinct titles, '
+          f'{len(unresolved_titles)} not already resolved by ID.')
+    return unresolved_titles
+
+
+def retrieve_actor_and_movie_data_from_omdb(shard_count=1):
     """Use the stored TMDb data (movie IDs and Titles) to retrieve additional data from OMDb.
-       First query the database by ID (in batches), then by movie Title. Save both sets of data."""
-    tmdb_movie_data_list = pd.DataFrame(utils.load_json_data("original_tmdb_movie_data_list_all_2225.json"))
-    tmdb_movie_data_list["IMDb_ID"].fillna("", inplace=True)
+       First query the database by ID, then by movie Title. Save both sets of data.
+       Progress is kept in work queues and requests are counted against each key's daily OMDb quota: a run stops
+       once the day's budget is spent, and calling it again on a later day resumes where it stopped. The work can
+       be split across shard_count processes, which share the same quota."""
+    tmdb_movie_data_list = pd.DataFrame(utils.load_records("original_tmdb_movie_data_list_all_2225.json",
+                                                                columns=["IMDb_ID"]))
 
-    by_id_count = 0
     # Query OMBb database by ID
-    for imdb_id in tmdb_movie_data_list["IMDb_ID"][27000:]:
-        by_id_count += 1
-        print(f'By ID : Currently on movie {by_id_count} / 2126')
-        if imdb_id is not None:
-            omdb_movie_info = get_omdb_movie_info_by_id(imdb_id)
-            omdb_movie_data_from_ids_list.append(omdb_movie_info)
-
-    utils.save_data_as_json("omdb_movie_data_from_ids_from_27000_to_29126.json", omdb_movie_data_from_ids_list)
-
-    actor_data_list = utils.load_json_data("data_files/actor_data_list_all_2225.json")
-    actor_data = pd.DataFrame(actor_data_list)
-
-    # Query OMBb database by title
-    by_title_count = 0
-    for title in actor_data["Movie_Credits"].sum()[32500:35433]:
-        by_title_count += 1
-        print(f'By title : Currently on movie {by_title_count} / 2933')
-        if title is not None:
-            omdb_movie_info = get_omdb_movie_info_by_title(title)
-            omdb_movie_data_from_titles_list.append(omdb_movie_info)
+    id_queue = work_queue.WorkQueue("omdb_by_id")
+    id_queue.add(imdb_id for imdb_id in tmdb_movie_data_list["IMDb_ID"] if imdb_id)
+    work_queue.run_sharded(retrieve_omdb_by_id_shard, shard_count)
+    omdb_movie_data_from_ids_list.extend(id_queue.results())
+    print(f'By ID : {id_queue.status_counts()}')
 
-    utils.save_data_as_json("data_files/omdb_movie_data_from_titles_from_32500_to_35433.json", omdb_movie_data_from_titles_list)
+    utils.save_records("data_files/omdb_movie_data_from_all_ids.json", omdb_movie_data_from_ids_list)
 
+    # Titles can only be planned against a finished by-ID pass; otherwise we'd pay for titles it will resolve.
+    if not id_queue.is_complete():
+        print("The by-ID pass is unfinished; run again to finish it before the by-title pass.")
+        return
 
-additional_titles_list = {"Titles": []}
+    actor_data_list = utils.load_records("data_files/actor_data_list_all_2225.json", columns=["Movie_Credits"])
+    unresolved_titles = plan_omdb_title_lookups(actor_data_list, omdb_movie_data_from_ids_list)
 
-def validate_retrieved_omdb_json_data():
-    """Remove json dictionaries that have invalid data i.e., where the API request failed."""
-    omdb_movie_data_from_all_29126_ids = utils.load_json_data("data_files/omdb_movie_data_from_all_29126_ids.json")
-    omdb_movie_data_from_all_35433_titles = utils.load_json_data("data_files/omdb_movie_data_from_all_35433_titles.json")
+    # Query OMBb database by title, once per distinct title that the by-ID pass didn't resolve
+    title_queue = work_queue.WorkQueue("omdb_by_title")
+    title_queue.add(unresolved_titles.values(), key=utils.normalise_title)
+    work_queue.run_sharded(retrieve_omdb_by_title_shard, shard_count)
+    omdb_movie_data_from_titles_list.extend(title_queue.results())
+    print(f'By title : {title_queue.status_counts()}')
 
-    valid_movie_list_from_ids = []
-    valid_movie_list_from_titles = []
+    utils.save_records("data_files/omdb_movie_data_from_all_titles.json", omdb_movie_data_from_titles_list)
 
-    for movie in omdb_movie_data_from_all_29126_ids:
-        if ("'Response': 'False'" not in str(movie)) and (movie is not None):
-            valid_movie_list_from_ids.append(movie)
 
-    for movie in omdb_movie_data_from_all_35433_titles:
-        if ("'Response': 'False'" not in str(movie)) and (movie is not None):
-            valid_movie_list_from_titles.append(movie)
+additional_titles_list = {"Titles": []}
+
+def validate_retrieved_omdb_json_data():
+    """Remove json dictionaries that have invalid data i.e., where the API request failed. The failed responses
+       are filtered out as the datasets are read."""
+    valid_movie_list_from_ids = utils.load_records("data_files/omdb_movie_data_from_all_ids.json",
+                                                   filters=[("Response", "!=", "False")])
+    valid_movie_list_from_titles = utils.load_records("data_files/omdb_movie_data_from_all_titles.json",
+                                                      filters=[("Response", "!=", "False")])
 
-    utils.save_data_as_json("data_files/valid_omdb_movie_data_from_ids.json", valid_movie_list_from_ids)
-    utils.save_data_as_json("valid_omdb_movie_data_from_titles.json", valid_movie_list_from_titles)
+    utils.save_records("data_files/valid_omdb_movie_data_from_ids.json", valid_movie_list_from_ids)
+    utils.save_records("valid_omdb_movie_data_from_titles.json", valid_movie_list_from_titles)
 
 
 def compare_retrieved_omdb_movie_data_and_return_additional_titles():
     """Compare the resulting lists from retrieval (by ID and title) and create a dataset
        of additional movie titles."""
 
-    omdb_movie_data_list_1_ids = pd.DataFrame(utils.load_json_data(
-        "data_files/valid_omdb_movie_data_from_ids.json"))
+    omdb_movie_data_list_1_ids = pd.DataFrame(utils.load_records(
+        "data_files/valid_omdb_movie_data_from_ids.json", columns=["Title"]))
     title_list_1 = omdb_movie_data_list_1_ids[["Title"]]
 
-    omdb_movie_data_list_2_titles = pd.DataFrame(utils.load_json_data(
-        "data_files/valid_omdb_movie_data_from_titles.json"))
+    omdb_movie_data_list_2_titles = pd.DataFrame(utils.load_records(
+        "data_files/valid_omdb_movie_data_from_titles.json", columns=["Title"]))
     title_list_2 = omdb_movie_data_list_2_titles[["Title"]]
 
     print(f'There are {len(title_list_1)} movies in the dataset made using imdb ids and '
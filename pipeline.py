@@ -0,0 +1,376 @@
+""" This file contains the pipeline DAG: every stage declares the files it reads and writes, and a stage only runs
+    when the contents of its inputs or its code have changed since the outputs were last produced. Source stages,
+    which fetch the data from live services, only run when forced or when their outputs are missing.
+
+    Each successful run's outputs are stored in .stage_cache under a hash of the stage's inputs and code, so going
+    back to an earlier input or code version restores its outputs instead of recomputing them. Independent stages
+    run side by side in worker processes.
+
+    Usage: python pipeline.py [target ...] [--jobs N] [--force] [--list] """
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import utils
+
+PIPELINE_DIR = os.path.dirname(os.path.abspath(__file__))
+STAGE_CACHE_DIR = ".stage_cache"
+FILE_HASHES_PATH = os.path.join(STAGE_CACHE_DIR, "file_hashes.json")
+
+# Modules every stage's code version includes.
+SHARED_CODE = ["utils"]
+
+
+class Stage:
+    """A pipeline step: func ("module:function") reads the inputs and writes the outputs. optional_inputs are read
+       if they exist, and are part of the stage's version as present or missing. after names upstream stages whose
+       effects aren't files (e.g. database tables) that this stage depends on, and code names the modules, besides
+       func's own, whose source is part of the stage's version, and env the environment variables whose values are.
+       A source stage (e.g. one that fetches from live services) is never run on its downstream stages' behalf: only
+       when it is forced as a target or when one of its outputs is missing; otherwise its outputs are used as they
+       are."""
+
+    def __init__(self, name, func, inputs=(), outputs=(), after=(), code=(), optional_inputs=(), source=False,
+                 env=()):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.optional_inputs = list(optional_inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+        self.code = [func.split(":")[0]] + list(code) + SHARED_CODE
+        self.source = source
+        self.env = list(env)
+
+
+PRE_DB_CLEANING_CODE = ["data_cleaning_functions"]
+# The database stages write to and read from the backend SQL_BACKEND chooses (see psql_database_eng).
+SQL_BACKEND_ENV = ["SQL_BACKEND"]
+
+STAGES = [
+    Stage("parse_grammy_html", "html_parser:run_html_parser",
+          inputs=["data_files/Grammy Award HTMLs"],
+          outputs=["data_files/annual_grammy_awards.json"]),
+    # Collection talks to the live services and spends their request quotas, so it only runs when forced or when
+    # one of its outputs is missing.
+    Stage("collect_data", "data_collection:collect_data",
+          outputs=["data_files/actor_names_and_ids.json", "additional_box_office_data_list.json",
+                   "additional_soundtrack_credits_data_list.json"],
+          code=["imdb_scrapers", "tmdb_api_functions", "omdb_api_functions", "imdb_datasets", "api_client"],
+          source=True),
+
+    # The IMDb title store (imdb_datasets.IMDB_TITLE_STORE_PATH) backfills OMDb's missing fields when collection
+    # could ingest the IMDb datasets.
+    Stage("clean_omdb_movie_data", "pre_db_data_cleaning:clean_omdb_movie_data",
+          inputs=["data_files/valid_omdb_movie_data_from_ids.json", "data_files/valid_omdb_movie_data_from_titles.json"],
+          optional_inputs=["data_files/imdb_titles.parquet"],
+          outputs=["updated_omdb_df_pre_db.arrow"], code=PRE_DB_CLEANING_CODE + ["imdb_datasets"]),
+    Stage("clean_tmdb_movie_data", "pre_db_data_cleaning:clean_tmdb_movie_data",
+          inputs=["data_files/updated_additional_tmdb_movie_data_list.json"],
+          outputs=["additional_tmdb_df_pre_db.arrow"], code=PRE_DB_CLEANING_CODE),
+    Stage("clean_cast_crew_data", "pre_db_data_cleaning:clean_cast_crew_data",
+          inputs=["additional_cast_crew_tmdb_movie_data_list.json"],
+          outputs=["additional_cast_df_pre_db.arrow", "additional_crew_df_pre_db.arrow"], code=PRE_DB_CLEANING_CODE),
+    Stage("clean_actor_data", "pre_db_data_cleaning:clean_actor_data",
+          inputs=["data_files/actor_data_list_all_2225.json"],
+          outputs=["actor_df_pre_db.arrow"], code=PRE_DB_CLEANING_CODE),
+    Stage("clean_golden_globe_data", "pre_db_data_cleaning:clean_golden_globe_data",
+          inputs=["data_files/golden_globe_awards.csv"],
+          outputs=["gg_awards_df_pre_db.arrow"], code=PRE_DB_CLEANING_CODE),
+    Stage("clean_grammy_data", "pre_db_data_cleaning:clean_grammy_data",
+          inputs=["data_files/annual_grammy_awards.json"],
+          outputs=["grammy_awards_df_pre_db.arrow"], code=PRE_DB_CLEANING_CODE),
+    Stage("clean_oscars_data", "pre_db_data_cleaning:clean_oscars_data",
+          inputs=["data_files/the_oscar_award.csv"],
+          outputs=["oscar_awards_df_pre_db.arrow"], code=PRE_DB_CLEANING_CODE),
+    Stage("clean_soundtrack_credits_data", "pre_db_data_cleaning:clean_soundtrack_credits_data",
+          inputs=["additional_soundtrack_credits_data_list.json"],
+          outputs=["additional_soundtrack_credits_df_pre_db.arrow"], code=PRE_DB_CLEANING_CODE),
+    Stage("clean_box_office_data", "pre_db_data_cleaning:clean_box_office_data",
+          inputs=["additional_box_office_data_list.json"],
+          outputs=["additional_box_office_df_pre_db.arrow"], code=PRE_DB_CLEANING_CODE),
+    Stage("convert_remaining_datasets", "psql_database_eng:convert_remaining_datasets_to_dfs",
+          inputs=["data_files/actor_names_and_ids.json", "data_files/actor_not_found_list_all_2225.json"],
+          outputs=["name_id_df_pre_db.arrow", "actor_na_df_pre_db.arrow"]),
+
+    Stage("write_pre_db_tables", "psql_database_eng:write_pre_db_dataframes_to_sql_database",
+          inputs=["updated_omdb_df_pre_db.arrow", "additional_tmdb_df_pre_db.arrow", "additional_cast_df_pre_db.arrow",
+                  "additional_crew_df_pre_db.arrow", "additional_box_office_df_pre_db.arrow",
+                  "additional_soundtrack_credits_df_pre_db.arrow", "grammy_awards_df_pre_db.arrow",
+                  "gg_awards_df_pre_db.arrow", "oscar_awards_df_pre_db.arrow", "actor_df_pre_db.arrow",
+                  "actor_na_df_pre_db.arrow", "name_id_df_pre_db.arrow"],
+          env=SQL_BACKEND_ENV),
+    Stage("run_sql_transforms", "psql_database_eng:run_sql_transforms",
+          after=["write_pre_db_tables"], code=["sql_transforms"], env=SQL_BACKEND_ENV),
+    Stage("load_sql_tables", "psql_database_eng:load_sql_tables_as_dataframes",
+          outputs=["updated_movie_data_df_post_db.arrow", "actor_data_df_post_db.arrow", "grammy_awards_df_post_db.arrow",
+                   "oscar_awards_df_post_db.arrow", "gg_awards_df_post_db.arrow",
+                   "updated_soundtrack_credits_df_post_db.arrow"],
+          after=["run_sql_transforms"], env=SQL_BACKEND_ENV),
+
+    Stage("post_db_data_clean", "post_db_data_cleaning:run_post_db_data_clean",
+          inputs=["updated_movie_data_df_post_db.arrow"],
+          outputs=["updated_movie_data_df_post_db_v2.arrow"], code=PRE_DB_CLEANING_CODE),
+    Stage("normalise_columns", "post_db_data_cleaning:execute_normalise_columns",
+          inputs=["updated_movie_data_df_post_db_v2.arrow", "actor_data_df_post_db.arrow",
+                  "updated_soundtrack_credits_df_post_db.arrow", "grammy_awards_df_post_db.arrow",
+                  "gg_awards_df_post_db.arrow", "oscar_awards_df_post_db.arrow"],
+          outputs=["updated_movie_data_df_post_db_v3.arrow", "actor_data_df_post_db_v2.arrow",
+                   "updated_soundtrack_credits_df_post_db_v2.arrow", "grammy_awards_df_post_db_v2.arrow",
+                   "gg_awards_df_post_db_v2.arrow", "oscar_awards_df_post_db_v2.arrow"],
+          code=PRE_DB_CLEANING_CODE),
+    Stage("move_actors", "post_db_data_cleaning:execute_move_actors",
+          inputs=["updated_movie_data_df_post_db_v3.arrow"],
+          outputs=["updated_movie_data_df_post_db_v4.arrow"], code=PRE_DB_CLEANING_CODE),
+    Stage("post_db_data_preprocessing", "post_db_data_preprocessing:run_post_db_data_preprocessing",
+          inputs=["updated_movie_data_df_post_db_v4.arrow", "oscar_awards_df_post_db_v2.arrow",
+                  "grammy_awards_df_post_db_v2.arrow", "gg_awards_df_post_db_v2.arrow", "actor_data_df_post_db_v2.arrow"],
+          outputs=["updated_movie_data_df_post_db_v5.arrow"], code=["data_preprocessing_functions"]),
+    Stage("write_complete_movie_data", "psql_database_eng:write_complete_movie_data_to_sql_database",
+          inputs=["updated_movie_data_df_post_db_v5.arrow"], env=SQL_BACKEND_ENV),
+]
+
+STAGES_BY_NAME = {stage.name: stage for stage in STAGES}
+
+
+def producers():
+    """Map every stage output to the stage that writes it."""
+    return {output: stage.name for stage in STAGES for output in stage.outputs}
+
+
+def upstream_stages(stage, stage_producers):
+    """The names of the stages that must finish before the stage can run."""
+    upstream = [stage_producers[path] for path in stage.inputs + stage.optional_inputs if path in stage_producers]
+    return list(dict.fromkeys(upstream + stage.after))
+
+
+def stages_for_targets(targets):
+    """The target stages and everything upstream of them, in declaration order (which is topological)."""
+    stage_producers = producers()
+    needed = set()
+    to_visit = list(targets)
+    while to_visit:
+        name = to_visit.pop()
+        if name not in needed:
+            needed.add(name)
+            to_visit += upstream_stages(STAGES_BY_NAME[name], stage_producers)
+    return [stage for stage in STAGES if stage.name in needed]
+
+
+class FileHasher:
+    """Content hashes of files and directories, remembered by size and modification time across runs so that
+       unchanged files aren't read again."""
+
+    def __init__(self, path=FILE_HASHES_PATH):
+        self.path = path
+        self.hashes = utils.load_json_data(path) if os.path.exists(path) else {}
+
+    def file_hash(self, file_path):
+        stat = os.stat(file_path)
+        known = self.hashes.get(file_path)
+        if known is not None and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        self.hashes[file_path] = [stat.st_size, stat.st_mtime_ns, sha256.hexdigest()]
+        return sha256.hexdigest()
+
+    def path_hash(self, path):
+        """Hash a file (together with the Parquet file utils.save_records writes in its place, or the pickle an
+           Arrow artifact replaces, if any) or every file in a directory."""
+        if os.path.isdir(path):
+            file_names = sorted(os.listdir(path))
+            return hashlib.sha256(json.dumps([[file_name, self.file_hash(os.path.join(path, file_name))]
+                                              for file_name in file_names]).encode()).hexdigest()
+        paths = [candidate for candidate in (path, utils.parquet_path(path), utils.legacy_pickle_path(path))
+                 if os.path.isfile(candidate)]
+        if not paths:
+            raise FileNotFoundError(path)
+        return "+".join(self.file_hash(candidate) for candidate in paths)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.hashes, f)
+
+
+def code_version(stage):
+    sha256 = hashlib.sha256()
+    for module_name in stage.code:
+        with open(os.path.join(PIPELINE_DIR, f'{module_name.replace(".", os.sep)}.py'), 'rb') as f:
+            sha256.update(f.read())
+    return sha256.hexdigest()
+
+
+def stage_key(stage, hasher, upstream_keys):
+    """Hash the stage's name, code, input contents (an optional input's as None if it is missing), environment
+       variables and the keys of the upstream stages it runs after."""
+    try:
+        input_hashes = [[path, hasher.path_hash(path)] for path in stage.inputs]
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f'{stage.name} is missing its input {e.args[0]}.') from None
+    optional_input_hashes = [[path, hasher.path_hash(path) if os.path.exists(path) else None]
+                             for path in stage.optional_inputs]
+    key_data = {"stage": stage.name, "code": code_version(stage), "inputs": input_hashes,
+                "optional_inputs": optional_input_hashes,
+                "env": [[name, os.environ.get(name)] for name in stage.env],
+                "after": [[name, upstream_keys[name]] for name in stage.after]}
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()[:20]
+
+
+def source_key(stage, hasher):
+    """Hash a source stage's name and the contents of its outputs, which stand in for a run's key when they are
+       used as they are."""
+    output_hashes = [[path, hasher.path_hash(path)] for path in stage.outputs]
+    return hashlib.sha256(json.dumps({"stage": stage.name, "outputs": output_hashes}).encode()).hexdigest()[:20]
+
+
+def cache_dir(stage, key):
+    return os.path.join(STAGE_CACHE_DIR, stage.name, key)
+
+
+def is_cached(stage, key):
+    return os.path.exists(os.path.join(cache_dir(stage, key), "complete"))
+
+
+def store_outputs(stage, key):
+    """Copy the stage's outputs into the cache under its key."""
+    directory = cache_dir(stage, key)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+    for output_no, output in enumerate(stage.outputs):
+        if not os.path.exists(output):
+            raise RuntimeError(f'{stage.name} did not write its output {output}.')
+        shutil.copy2(output, os.path.join(directory, str(output_no)))
+    open(os.path.join(directory, "complete"), 'w').close()
+
+
+def restore_outputs(stage, key, hasher):
+    """Put the cached outputs back where the stage writes them, where the working copies differ; return the
+       number of files restored."""
+    directory = cache_dir(stage, key)
+    restored_count = 0
+    for output_no, output in enumerate(stage.outputs):
+        cached_output = os.path.join(directory, str(output_no))
+        if os.path.exists(output) and hasher.file_hash(output) == hasher.file_hash(cached_output):
+            continue
+        if os.path.dirname(output):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+        shutil.copy2(cached_output, output)
+        restored_count += 1
+    return restored_count
+
+
+def call_stage_function(func):
+    """Run a stage's function in a worker process and return how long it took."""
+    module_name, function_name = func.split(":")
+    started = time.perf_counter()
+    getattr(importlib.import_module(module_name), function_name)()
+    return time.perf_counter() - started
+
+
+def run_pipeline(targets=None, jobs=1, force=False):
+    """Bring the target stages (by default every stage) up to date, running only the stages whose inputs or code
+       changed, as many at a time as jobs allows. force reruns the targets even if they are up to date."""
+    targets = targets or [stage.name for stage in STAGES]
+    stages = stages_for_targets(targets)
+    stage_producers = producers()
+    hasher = FileHasher()
+    keys = {}
+    failed = []
+    running = {}
+    waiting = list(stages)
+    started = time.perf_counter()
+
+    # Each worker process runs a single stage, so module level state never leaks between stages.
+    with ProcessPoolExecutor(max_workers=jobs, max_tasks_per_child=1) as executor:
+        while waiting or running:
+            scheduled = True
+            while scheduled:
+                scheduled = False
+                for stage in list(waiting):
+                    upstream = upstream_stages(stage, stage_producers)
+                    if any(name in failed for name in upstream):
+                        waiting.remove(stage)
+                        failed.append(stage.name)
+                        print(f'{stage.name}: skipped, an upstream stage failed.')
+                        continue
+                    if not all(name in keys for name in upstream):
+                        continue
+                    waiting.remove(stage)
+                    scheduled = True
+                    forced = force and stage.name in targets
+                    if stage.source and not forced and all(os.path.exists(path) for path in stage.outputs):
+                        keys[stage.name] = source_key(stage, hasher)
+                        print(f'{stage.name}: using its existing outputs (a source stage only reruns when forced).')
+                        continue
+                    try:
+                        key = stage_key(stage, hasher, keys)
+                    except FileNotFoundError as e:
+                        failed.append(stage.name)
+                        print(f'{stage.name}: failed, {e}')
+                        continue
+                    if is_cached(stage, key) and not forced:
+                        restored_count = restore_outputs(stage, key, hasher)
+                        keys[stage.name] = key
+                        print(f'{stage.name}: up to date' +
+                              (f', restored {restored_count} outputs from the cache.' if restored_count else '.'))
+                        continue
+                    print(f'{stage.name}: running {stage.func}.')
+                    running[executor.submit(call_stage_function, stage.func)] = (stage, key)
+
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, key = running.pop(future)
+                try:
+                    seconds = future.result()
+                    store_outputs(stage, key)
+                except Exception as e:
+                    failed.append(stage.name)
+                    print(f'{stage.name}: failed with {e!r}')
+                    continue
+                keys[stage.name] = key
+                print(f'{stage.name}: finished in {seconds:.1f}s.')
+
+    hasher.save()
+    print(f'Pipeline finished in {time.perf_counter() - started:.1f}s: {len(keys)} stages up to date, '
+          f'{len(failed)} failed.')
+    if failed:
+        raise RuntimeError(f'Pipeline stages failed: {", ".join(failed)}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the pipeline's stages that are out of date.")
+    parser.add_argument("targets", nargs="*", metavar="stage",
+                        help="stages to bring up to date, with their upstream stages (default: every stage)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="stages to run at once")
+    parser.add_argument("--force", action="store_true", help="rerun the target stages even if up to date")
+    parser.add_argument("--list", action="store_true", help="list the stages and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        stage_producers = producers()
+        for stage in STAGES:
+            upstream = upstream_stages(stage, stage_producers)
+            print(f'{stage.name} ({stage.func})' + (f' <- {", ".join(upstream)}' if upstream else ''))
+        return
+    unknown = [target for target in args.targets if target not in STAGES_BY_NAME]
+    if unknown:
+        parser.error(f'unknown stages: {", ".join(unknown)}')
+    run_pipeline(args.targets, jobs=args.jobs, force=args.force)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
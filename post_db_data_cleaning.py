@@ -1,6 +1,7 @@
 """ This file contains post database cleaning function for the single movie data dataframe. """
 
 import pandas as pd
+import utils
 import pytz
 
 import data_cleaning_functions as dcf
@@ -8,7 +9,7 @@ import numpy as np
 
 
 def run_post_db_data_clean():
-    movie_data_df = pd.read_pickle("updated_movie_data_df_post_db.pkl")
+    movie_data_df = utils.load_dataframe("updated_movie_data_df_post_db.arrow")
 
     print(f"The length of the movie_data_df is {len(movie_data_df)}.")
     movie_data_df.drop_duplicates(subset="imdbID", inplace=True)
@@ -67,25 +68,25 @@ def run_post_db_data_clean():
     movie_data_df["soundtrack_artists"] = movie_data_df["soundtrack_artists"].map(
         lambda x: dcf.remove_redundant_names(x))
     movie_data_df["Director"] = movie_data_df["Director"].map(lambda x: dcf.split_director_names(x))
-    movie_data_df.to_pickle("updated_movie_data_df_post_db_v2.pkl")
+    utils.save_dataframe(movie_data_df, "updated_movie_data_df_post_db_v2.arrow")
 
 
 def execute_move_actors():
-    movie_data_df = pd.read_pickle("updated_movie_data_df_post_db_v3.pkl")
+    movie_data_df = utils.load_dataframe("updated_movie_data_df_post_db_v3.arrow")
     movie_data_df.apply(lambda row: dcf.move_actors(row["Lead_Actors"], row["Supporting_Actors"], row["movie_cast"]),
                         axis=1)
-    movie_data_df.to_pickle("updated_movie_data_df_post_db_v4.pkl")
+    utils.save_dataframe(movie_data_df, "updated_movie_data_df_post_db_v4.arrow")
 
 
 def execute_normalise_columns():
     """Normalise the text and datetime columns by removing redundant characters and making all letters uppercase, and
        making datetimes timezone aware."""
-    movie_data_df = pd.read_pickle("updated_movie_data_df_post_db_v2.pkl")
-    actor_data_df = pd.read_pickle("actor_data_df_post_db.pkl")
-    soundtrack_credits_df = pd.read_pickle("updated_soundtrack_credits_df_post_db.pkl")
-    grammy_awards_df = pd.read_pickle("grammy_awards_df_post_db.pkl")
-    gg_awards_df = pd.read_pickle("gg_awards_df_post_db.pkl")
-    oscar_awards_df = pd.read_pickle("oscar_awards_df_post_db.pkl")
+    movie_data_df = utils.load_dataframe("updated_movie_data_df_post_db_v2.arrow")
+    actor_data_df = utils.load_dataframe("actor_data_df_post_db.arrow")
+    soundtrack_credits_df = utils.load_dataframe("updated_soundtrack_credits_df_post_db.arrow")
+    grammy_awards_df = utils.load_dataframe("grammy_awards_df_post_db.arrow")
+    gg_awards_df = utils.load_dataframe("gg_awards_df_post_db.arrow")
+    oscar_awards_df = utils.load_dataframe("oscar_awards_df_post_db.arrow")
 
     movie_data_df_str_cols_to_normalise = ["Title", "Rated", "Type", "Awards"]
     for col in movie_data_df_str_cols_to_normalise:
@@ -118,18 +119,18 @@ def execute_normalise_columns():
     for col in gg_df_str_cols_to_normalise:
         gg_awards_df[col] = gg_awards_df[col].map(lambda x: dcf.normalise_string_names(x))
 
-    oscar_df_str_cols_to_normalise = ["category", "name", "film"]
+    oscar_df_str_cols_to_normalise = ["category", "nominee", "film"]
     for col in oscar_df_str_cols_to_normalise:
         oscar_awards_df[col] = oscar_awards_df[col].map(lambda x: dcf.normalise_string_names(x))
 
-    gg_awards_df["year_award"] = pd.to_datetime(gg_awards_df["year_award"], utc=True)
-    oscar_awards_df["year_ceremony"] = pd.to_datetime(oscar_awards_df["year_ceremony"], utc=True)
+    gg_awards_df["awards_year"] = pd.to_datetime(gg_awards_df["awards_year"], utc=True)
+    oscar_awards_df["ceremony_year"] = pd.to_datetime(oscar_awards_df["ceremony_year"], utc=True)
     grammy_awards_df["awards_year"] = pd.to_datetime(grammy_awards_df["awards_year"], utc=True)
     movie_data_df["Released"] = movie_data_df["Released"].apply(lambda d: d.replace(tzinfo=pytz.utc))
 
-    movie_data_df.to_pickle("updated_movie_data_df_post_db_v3.pkl")
-    actor_data_df.to_pickle("actor_data_df_post_db_v2.pkl")
-    soundtrack_credits_df.to_pickle("updated_soundtrack_credits_df_post_db_v2.pkl")
-    grammy_awards_df.to_pickle("grammy_awards_df_post_db_v2.pkl")
-    gg_awards_df.to_pickle("gg_awards_df_post_db_v2.pkl")
-    oscar_awards_df.to_pickle("oscar_awards_df_post_db_v2.pkl")
+    utils.save_dataframe(movie_data_df, "updated_movie_data_df_post_db_v3.arrow")
+    utils.save_dataframe(actor_data_df, "actor_data_df_post_db_v2.arrow")
+    utils.save_dataframe(soundtrack_credits_df, "updated_soundtrack_credits_df_post_db_v2.arrow")
+    utils.save_dataframe(grammy_awards_df, "grammy_awards_df_post_db_v2.arrow")
+    utils.save_dataframe(gg_awards_df, "gg_awards_df_post_db_v2.arrow")
+    utils.save_dataframe(oscar_awards_df, "oscar_awards_df_post_db_v2.arrow")
@@ -2,14 +2,23 @@
 
 import data_cleaning_functions as dcf
 import utils
+import imdb_datasets
 import pandas as pd
 import numpy as np
 
+# Every OMDb field the cleaning keeps, plus Ratings for the Rotten Tomatoes score.
+OMDB_COLUMNS = ["Title", "Year", "Rated", "Released", "Runtime", "Genre", "Director", "Writer", "Actors", "Plot",
+                "Language", "Country", "Awards", "Poster", "Ratings", "Metascore", "imdbRating", "imdbVotes", "imdbID",
+                "Type", "DVD", "BoxOffice", "Production", "Response"]
+
 
 def clean_omdb_movie_data():
-    omdb_movie_data_from_ids = utils.load_json_data("data_files/valid_omdb_movie_data_from_ids.json")
-    omdb_movie_data_from_titles = utils.load_json_data("data_files/valid_omdb_movie_data_from_titles.json")
+    omdb_movie_data_from_ids = utils.load_records("data_files/valid_omdb_movie_data_from_ids.json",
+                                                  columns=OMDB_COLUMNS)
+    omdb_movie_data_from_titles = utils.load_records("data_files/valid_omdb_movie_data_from_titles.json",
+                                                     columns=OMDB_COLUMNS)
     omdb_movie_data_list = omdb_movie_data_from_ids + omdb_movie_data_from_titles
+    imdb_datasets.backfill_omdb_movie_data(omdb_movie_data_list)
 
     for movie in omdb_movie_data_list:
         movie["rtRating"] = dcf.get_rt_score(movie)
@@ -17,7 +26,7 @@ def clean_omdb_movie_data():
     omdb_df = pd.DataFrame(omdb_movie_data_list)
     omdb_df.set_index("imdbID", inplace=True)
     print(f"There are {len(omdb_df.index)} movies in the omdb dataset.")
-    omdb_df.drop(labels=["Website", "Ratings"], axis=1, inplace=True)
+    omdb_df.drop(labels=["Ratings"], axis=1, inplace=True)
     omdb_df.drop_duplicates(inplace=True)
     print(f"There are {len(omdb_df.index)} movies in the omdb dataset after a single drop duplicates.")
     omdb_df.replace(to_replace="N/A", value=np.nan, inplace=True)
@@ -38,67 +47,89 @@ def clean_omdb_movie_data():
     omdb_df["Country"] = omdb_df["Country"].map(lambda x: dcf.clean_country(x), na_action='ignore')
     omdb_df["Released"] = pd.to_datetime(omdb_df["Released"])
 
-    omdb_df.to_pickle("updated_omdb_df_pre_db.pkl")
+    utils.save_dataframe(omdb_df, "updated_omdb_df_pre_db.arrow")
 
 
-def clean_tmdb_movie_data():
-    tmdb_movie_data_list = utils.load_json_data("data_files/updated_additional_tmdb_movie_data_list.json")
+# The nested TMDb fields, which are flattened into Keyword_List and the <country>_release_date columns.
+TMDB_NESTED_FIELDS = {"Release_Dates", "Keywords"}
+THEATRICAL_RELEASE_TYPE = 3
+
 
-    # Add relevant key-value pairs to movie_data dictionaries, load into dataframes and store in a list.
-    movie_dataframes = []
-    for movie_data in tmdb_movie_data_list:
-        movie_data = dcf.append_release_dates(dcf.append_keywords(movie_data))
-        movie_df = pd.DataFrame.from_dict(movie_data, orient="index")
-        movie_df = movie_df.transpose()
-        movie_dataframes.append(movie_df)
+def build_tmdb_movie_table(tmdb_movie_data_list):
+    """Flatten the TMDb movie records into column lists in one pass and build the table once. Each movie's keyword
+       names become Keyword_List and its theatrical release dates <country>_release_date columns (the last date
+       listed for a country wins), with the columns in order of first appearance. The release dates are TMDb's
+       ISO 8601 timestamps, so each date column is parsed once with that format, as UTC."""
+    columns = {}
+    for row_number, movie_data in enumerate(tmdb_movie_data_list):
+        row = {field: value for field, value in movie_data.items() if field not in TMDB_NESTED_FIELDS}
+        row["Keyword_List"] = [keyword.get("name") for keyword in movie_data["Keywords"] or []]
+        for release in movie_data["Release_Dates"] or []:
+            for data in release.get("release_dates"):
+                if data["type"] == THEATRICAL_RELEASE_TYPE:
+                    row[f'{release.get("iso_3166_1")}_release_date'] = data.get("release_date")
 
-    tmdb_df = pd.concat(movie_dataframes, axis=0, ignore_index=True)
+        for field, value in row.items():
+            # A column first seen now is missing from every earlier movie.
+            columns.setdefault(field, [None] * row_number).append(value)
+        for field in columns.keys() - row.keys():
+            columns[field].append(None)
 
-    # assert len(tmdb_movie_data_list) == len(tmdb_df)
-    tmdb_df.drop(["Release_Dates", "Keywords"], axis=1, inplace=True)
-    tmdb_df.iloc[:, 5:] = tmdb_df.iloc[:, 5:].apply(pd.to_datetime)
-    tmdb_df.to_pickle("additional_tmdb_df_pre_db.pkl")
+    tmdb_df = pd.DataFrame(columns)
+    for column in tmdb_df.columns[tmdb_df.columns.str.endswith("_release_date")]:
+        tmdb_df[column] = pd.to_datetime(tmdb_df[column], format="ISO8601", utc=True)
+    return tmdb_df
+
+
+def clean_tmdb_movie_data():
+    tmdb_movie_data_list = utils.load_records("data_files/updated_additional_tmdb_movie_data_list.json")
+    tmdb_df = build_tmdb_movie_table(tmdb_movie_data_list)
+    utils.save_dataframe(tmdb_df, "additional_tmdb_df_pre_db.arrow")
+
+
+CAST_CREW_SCHEMA = utils.RecordSchema("CastCrewRecord", {"TMDb_ID": int, "Cast": (list, type(None)),
+                                                         "Crew": (list, type(None))})
+CAST_DROPPED_FIELDS = {"adult", "popularity", "profile_path", "cast_id", "credit_id"}
+CREW_DROPPED_FIELDS = {"adult", "popularity", "profile_path", "credit_id"}
 
 
 def clean_cast_crew_data():
-    cast_crew_data_list = utils.load_json_data("additional_cast_crew_tmdb_movie_data_list.json")
-    # Flatten cast and crew data into dataframes and append dataframes to lists.
-    cast_dfs = []
-    crew_dfs = []
-    for cc_data in cast_crew_data_list:
-        cast_df = pd.json_normalize(cc_data, record_path="Cast", meta=["TMDb_ID"])
-        cast_dfs.append(cast_df)
-        crew_df = pd.json_normalize(cc_data, record_path="Crew", meta=["TMDb_ID"])
-        crew_dfs.append(crew_df)
-
-    cast_df = pd.concat(cast_dfs)
-    crew_df = pd.concat(crew_dfs)
+    """Stream the cast and crew records one movie at a time, flattening each cast and crew member into a row
+       without the dropped fields, so only the rows being kept are ever held in memory."""
+    cast_rows = []
+    crew_rows = []
+    for cc_data in utils.iter_records("additional_cast_crew_tmdb_movie_data_list.json", schema=CAST_CREW_SCHEMA):
+        for cast_member in cc_data.Cast or []:
+            cast_row = {field: value for field, value in cast_member.items() if field not in CAST_DROPPED_FIELDS}
+            cast_row["TMDb_ID"] = cc_data.TMDb_ID
+            cast_rows.append(cast_row)
+        for crew_member in cc_data.Crew or []:
+            crew_row = {field: value for field, value in crew_member.items() if field not in CREW_DROPPED_FIELDS}
+            crew_row["TMDb_ID"] = cc_data.TMDb_ID
+            crew_rows.append(crew_row)
+
+    cast_df = pd.DataFrame(cast_rows)
+    crew_df = pd.DataFrame(crew_rows)
     cast_df.set_index("TMDb_ID", inplace=True)
     crew_df.set_index("TMDb_ID", inplace=True)
-    cast_df.drop(labels=["adult", "popularity", "profile_path", "cast_id", "credit_id"], axis=1,
-                 inplace=True)
-    crew_df.drop(labels=["adult", "popularity", "profile_path", "credit_id"], axis=1,
-                 inplace=True)
 
-    cast_df.to_pickle("additional_cast_df_pre_db.pkl")
-    crew_df.to_pickle("additional_crew_df_pre_db.pkl")
+    utils.save_dataframe(cast_df, "additional_cast_df_pre_db.arrow")
+    utils.save_dataframe(crew_df, "additional_crew_df_pre_db.arrow")
 
 
 def clean_actor_data():
-    actor_data_list = utils.load_json_data("data_files/actor_data_list_all_2225.json")
+    actor_data_list = utils.load_records("data_files/actor_data_list_all_2225.json")
     actor_df = pd.DataFrame(actor_data_list)
     actor_df["TMDb_ID"] = actor_df["TMDb_ID"].astype("str")
     actor_df["Birthday"] = pd.to_datetime(actor_df["Birthday"])
-    actor_df.to_pickle("actor_df_pre_db.pkl")
+    utils.save_dataframe(actor_df, "actor_df_pre_db.arrow")
 
 
 def clean_soundtrack_credits_data():
     """Explode the soundtrack credits nested json file so that every row corresponds to
        an artist's track credit in a movie."""
-    soundtrack_credits_data = utils.load_json_data("additional_soundtrack_credits_data_list.json")
-
     soundtrack_credits_exploded = []
-    for movie_soundtrack_credits in soundtrack_credits_data:
+    for movie_soundtrack_credits in utils.iter_records("additional_soundtrack_credits_data_list.json"):
         if movie_soundtrack_credits["credits"] != list():
             artist_credit = {"imdb_movie_ID": movie_soundtrack_credits["imdb_ID"]}
             for credit in movie_soundtrack_credits["credits"]:
@@ -187,14 +218,14 @@ def clean_soundtrack_credits_data():
 
     soundtrack_df = pd.DataFrame(soundtrack_credits_exploded)
     soundtrack_df.set_index("imdb_movie_ID", inplace=True)
-    soundtrack_df.to_pickle("additional_soundtrack_credits_df_pre_db.pkl")
+    utils.save_dataframe(soundtrack_df, "additional_soundtrack_credits_df_pre_db.arrow")
 
 
 def clean_golden_globe_data():
     gg_awards_df = pd.read_csv("data_files/golden_globe_awards.csv", encoding='utf-8',
                                encoding_errors='ignore')
     gg_awards_df["year_award"] = gg_awards_df["year_award"].astype("str").map(lambda x: dcf.convert_award_date(x))
-    gg_awards_df.to_pickle("gg_awards_df_pre_db.pkl")
+    utils.save_dataframe(gg_awards_df, "gg_awards_df_pre_db.arrow")
 
 
 def clean_grammy_data():
@@ -214,7 +245,7 @@ def clean_grammy_data():
 
     grammy_awards_df = grammy_awards_df.explode(['ceremony', 'awards_year', 'category', 'nominee', 'artist', 'workers',
                                                  'winner'])
-    grammy_awards_df.to_pickle("grammy_awards_df_pre_db.pkl")
+    utils.save_dataframe(grammy_awards_df, "grammy_awards_df_pre_db.arrow")
 
 
 def clean_oscars_data():
@@ -222,7 +253,7 @@ def clean_oscars_data():
                                   encoding_errors='ignore')
     oscar_awards_df["year_ceremony"] = oscar_awards_df["year_ceremony"].astype("str").map(
         lambda x: dcf.convert_award_date(x))
-    oscar_awards_df.to_pickle("oscar_awards_df_pre_db.pkl")
+    utils.save_dataframe(oscar_awards_df, "oscar_awards_df_pre_db.arrow")
 
 
 def clean_box_office_data():
@@ -237,25 +268,17 @@ def clean_box_office_data():
     box_office_df.replace(to_replace="", value=np.nan, inplace=True)
     box_office_df.dropna(subset=["Opening_Weekend_Gross", "Worldwide_Gross"], how='all', inplace=True)
     print(f"There are {len(box_office_df)} entries in the box office dataset after a dropna on 2 columns.")
-    box_office_df.to_pickle("additional_box_office_df_pre_db.pkl")
+    utils.save_dataframe(box_office_df, "additional_box_office_df_pre_db.arrow")
+
+
+PRE_DB_CLEANERS = [clean_omdb_movie_data, clean_tmdb_movie_data, clean_cast_crew_data, clean_actor_data,
+                   clean_golden_globe_data, clean_grammy_data, clean_oscars_data, clean_soundtrack_credits_data,
+                   clean_box_office_data]
 
 
 def run_pre_db_data_clean():
-    print("Entering clean_omdb_movie_data function.")
-    clean_omdb_movie_data()
-    print("Entering clean_tmdb_movie_data function.")
-    clean_tmdb_movie_data()
-    print("Entering clean_cast_crew_data function.")
-    clean_cast_crew_data()
-    print("Entering clean_actor_data function.")
-    clean_actor_data()
-    print("Entering clean_golden_globe_data function.")
-    clean_golden_globe_data()
-    print("Entering clean_grammy_data function.")
-    clean_grammy_data()
-    print("Entering clean_oscars_data function.")
-    clean_oscars_data()
-    print("Entering clean_soundtrack_credits_data function.")
-    clean_soundtrack_credits_data()
-    print("Entering clean_box_office_data function.")
-    clean_box_office_data()
+    """Run every cleaner in turn. pipeline.main runs them as separate stages instead, in parallel where their
+       inputs allow, and skips those whose inputs haven't changed."""
+    for cleaner in PRE_DB_CLEANERS:
+        print(f"Entering {cleaner.__name__} function.")
+        cleaner()
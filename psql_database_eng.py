@@ -3,91 +3,592 @@
     scripts to be executed using sqlalchemy. """
 
 import utils
-import hidden
-from sqlalchemy import create_engine
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
-import sqlalchemy_jdbcapi
+import sql_transforms
+import collections
+import functools
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import time
 
 
 def convert_remaining_datasets_to_dfs():
     # Name & ID data (collected in the initial IMDb scrape). 
     name_id_list = utils.load_json_data("data_files/actor_names_and_ids.json")
     name_id_df = pd.DataFrame(name_id_list)
-    name_id_df.to_pickle("name_id_df_pre_db.pkl")
+    utils.save_dataframe(name_id_df, "name_id_df_pre_db.arrow")
 
     # Actors with no TMDb profiles/data.
     actor_not_found_list = utils.load_json_data("data_files/actor_not_found_list_all_2225.json")
     actor_na_df = pd.DataFrame(actor_not_found_list)
-    actor_na_df.to_pickle("actor_na_df_pre_db.pkl")
+    utils.save_dataframe(actor_na_df, "actor_na_df_pre_db.arrow")
 
 
-conn_string = hidden.secrets["alchemy"]["connection_string"]
+@functools.lru_cache(maxsize=None)
+def get_engine():
+    """ The pooled engine for the database in hidden.secrets, created on first use, so importing this module needs
+        neither sqlalchemy nor the database secrets. """
+    import hidden
+    import sqlalchemy_jdbcapi
+    from sqlalchemy import create_engine
 
-# Create an engine.
-engine = create_engine(conn_string)
+    return create_engine(hidden.secrets["alchemy"]["connection_string"])
 
+# "postgres" round-trips the tables through the PostgreSQL server; "duckdb" runs the same merges in process over the
+# pre-db artifacts, so the pipeline needs no database server. Set SQL_BACKEND in the environment to choose.
+SQL_BACKENDS = ["postgres", "duckdb"]
+SQL_BACKEND = os.environ.get("SQL_BACKEND", "postgres")
+if SQL_BACKEND not in SQL_BACKENDS:
+    raise ValueError(f"SQL_BACKEND must be one of {', '.join(SQL_BACKENDS)}, not {SQL_BACKEND!r}.")
 
-def write_dataframes_to_sql_database():
+# "replace" recreates every table on each load; "incremental" only applies the rows that were inserted, changed or
+# deleted since the last load, leaving the tables, their indexes and the views on them in place. Set SQL_LOAD_MODE in
+# the environment to choose.
+SQL_LOAD_MODES = ["replace", "incremental"]
+SQL_LOAD_MODE = os.environ.get("SQL_LOAD_MODE", "replace")
+if SQL_LOAD_MODE not in SQL_LOAD_MODES:
+    raise ValueError(f"SQL_LOAD_MODE must be one of {', '.join(SQL_LOAD_MODES)}, not {SQL_LOAD_MODE!r}.")
+
+
+# (table name, DataFrame artifact) for every table written to the database. The pre-db tables are the inputs the
+# movie_data and actor_data tables are built from; complete_movie_data is the pipeline's final output.
+# joined_tmdb_df_data is the table clean_tmdb_movie_data builds from the original and additional TMDb movies.
+PRE_DB_TABLES = [
+    ("updated_omdb_df_data", "updated_omdb_df_pre_db.arrow"),
+    ("joined_tmdb_df_data", "additional_tmdb_df_pre_db.arrow"),
+    ("additional_cast_df_data", "additional_cast_df_pre_db.arrow"),
+    ("additional_crew_df_data", "additional_crew_df_pre_db.arrow"),
+    ("additional_box_office_df_data", "additional_box_office_df_pre_db.arrow"),
+    ("additional_soundtrack_df_data", "additional_soundtrack_credits_df_pre_db.arrow"),
+    ("grammy_awards_df_data", "grammy_awards_df_pre_db.arrow"),
+    ("gg_awards_df_data", "gg_awards_df_pre_db.arrow"),
+    ("oscar_awards_df_data", "oscar_awards_df_pre_db.arrow"),
+    ("actor_data_df", "actor_df_pre_db.arrow"),
+    ("actor_na_df", "actor_na_df_pre_db.arrow"),
+    ("name_id_df", "name_id_df_pre_db.arrow"),
+]
+COMPLETE_MOVIE_DATA_TABLES = [("complete_movie_data", "updated_movie_data_df_post_db_v5.arrow")]
+
+# The primary keys the incremental load matches rows on. The other tables have no natural key, so their rows are
+# keyed by the row hash and the row's occurrence among identical rows.
+TABLE_KEYS = {
+    "updated_omdb_df_data": ["imdbID"],
+    "joined_tmdb_df_data": ["TMDb_ID"],
+    "additional_box_office_df_data": ["IMDb_ID"],
+    "actor_data_df": ["IMDb_ID"],
+    "name_id_df": ["imdb_ids"],
+    "complete_movie_data": ["imdbID"],
+}
+
+# NULLs are written as \N so that empty strings stay empty strings. This also loads the literal "\N" the IMDb
+# datasets use for missing values as NULL.
+COPY_NULL = "\\N"
+
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def is_text_list(value):
+    return isinstance(value, list) and all(element is None or isinstance(element, str) for element in value)
+
+
+def postgres_column_type(series):
+    """The PostgreSQL type for a DataFrame column. Lists of strings become TEXT[], other lists and dicts JSONB and
+       datetimes TIMESTAMP, or TIMESTAMPTZ when they carry a timezone."""
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return "BIGINT"
+    if pd.api.types.is_float_dtype(series.dtype):
+        return "DOUBLE PRECISION"
+    if isinstance(series.dtype, pd.DatetimeTZDtype):
+        return "TIMESTAMPTZ"
+    if pd.api.types.is_datetime64_dtype(series.dtype):
+        return "TIMESTAMP"
+
+    values = [value for value in series if isinstance(value, (list, dict)) or not pd.isna(value)]
+    if not values:
+        return "TEXT"
+    if all(is_text_list(value) for value in values):
+        return "TEXT[]"
+    if any(isinstance(value, (list, dict)) for value in values):
+        return "JSONB"
+    if all(isinstance(value, bool) for value in values):
+        return "BOOLEAN"
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+        return "BIGINT"
+    if all(isinstance(value, pd.Timestamp) for value in values):
+        return "TIMESTAMPTZ" if all(value.tzinfo is not None for value in values) else "TIMESTAMP"
+    return "TEXT"
+
+
+def text_array_literal(values):
+    """A PostgreSQL array literal, e.g. {"Drama","Sci-Fi"}, for a list of strings."""
+    elements = ("NULL" if value is None else '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+                for value in values)
+    return "{" + ",".join(elements) + "}"
+
+
+def copy_value_converter(column_type):
+    """Return the function that turns a column's values into the text COPY parses as column_type."""
+    def is_null(value):
+        return value is None or (not isinstance(value, (list, dict)) and pd.isna(value))
+
+    if column_type == "TEXT[]":
+        return lambda value: COPY_NULL if is_null(value) else text_array_literal(value)
+    if column_type == "JSONB":
+        return lambda value: COPY_NULL if is_null(value) else json.dumps(value, ensure_ascii=False, default=str)
+    if column_type in ("TIMESTAMP", "TIMESTAMPTZ"):
+        return lambda value: COPY_NULL if is_null(value) else pd.Timestamp(value).isoformat()
+    if column_type == "BOOLEAN":
+        return lambda value: COPY_NULL if is_null(value) else ("true" if value else "false")
+    if column_type == "BIGINT":
+        return lambda value: COPY_NULL if is_null(value) else str(int(value))
+    if column_type == "DOUBLE PRECISION":
+        return lambda value: COPY_NULL if is_null(value) else repr(float(value))
+    return lambda value: COPY_NULL if is_null(value) else str(value)
+
+
+class CopyCsvStream:
+    """A read-only file of CSV rows for COPY FROM STDIN, rendered a batch of rows at a time as psycopg2 reads it,
+       so a table is never held in memory as one CSV string."""
+
+    def __init__(self, rows, batch_size=5000):
+        self.rows = iter(rows)
+        self.batch_size = batch_size
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator="\n")
+        self.pending = ""
+
+    def read(self, size=-1):
+        while (size < 0 or len(self.pending) < size) and self.fill_buffer():
+            pass
+        if size < 0:
+            chunk, self.pending = self.pending, ""
+        else:
+            chunk, self.pending = self.pending[:size], self.pending[size:]
+        return chunk
+
+    def fill_buffer(self):
+        batch = list(itertools.islice(self.rows, self.batch_size))
+        if not batch:
+            return False
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.writer.writerows(batch)
+        self.pending += self.buffer.getvalue()
+        return True
+
+
+def copy_rows(dataframe, column_types):
+    """The DataFrame's rows as the text values COPY parses as the column types."""
+    converters = [copy_value_converter(column_type) for column_type in column_types.values()]
+    return zip(*(map(converter, dataframe[column]) for converter, column in zip(converters, dataframe.columns)))
+
+
+def copy_into(cursor, qualified_table_name, columns, rows):
+    column_names = ", ".join(quote_identifier(column) for column in columns)
+    cursor.copy_expert(f"COPY {qualified_table_name} ({column_names}) FROM STDIN "
+                       f"WITH (FORMAT csv, NULL '{COPY_NULL}')", CopyCsvStream(rows))
+
+
+def column_definitions(column_types):
+    return ", ".join(f"{quote_identifier(column)} {column_type}" for column, column_type in column_types.items())
+
+
+def copy_dataframe_to_table(connection, dataframe, table_name, schema="general"):
+    """Replace the rows of schema.table_name with the DataFrame's, streamed in with COPY, in one transaction on a
+       psycopg2 connection. Like to_sql, the index is written as a column. A table whose column types differ from
+       the DataFrame's (or that doesn't exist yet) is recreated; otherwise it is emptied, so the views that depend
+       on it keep working. Returns the row count and an empty dict of changes."""
+    dataframe = dataframe.reset_index()
+    column_types = {column: postgres_column_type(dataframe[column]) for column in dataframe.columns}
+    qualified_table_name = f"{quote_identifier(schema)}.{quote_identifier(table_name)}"
+    columns_table_name = quote_identifier(f"{table_name}_columns")
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE TEMP TABLE {columns_table_name} ({column_definitions(column_types)}) "
+                           f"ON COMMIT DROP")
+            cursor.execute(f"SELECT {sql_transforms.column_signature(qualified_table_name)} = "
+                           f"{sql_transforms.column_signature(columns_table_name)}")
+            if cursor.fetchone()[0]:
+                cursor.execute(f"TRUNCATE {qualified_table_name}")
+            else:
+                cursor.execute(f"DROP TABLE IF EXISTS {qualified_table_name}")
+                cursor.execute(f"CREATE TABLE {qualified_table_name} ({column_definitions(column_types)})")
+            copy_into(cursor, qualified_table_name, dataframe.columns, copy_rows(dataframe, column_types))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return len(dataframe), {}
+
+
+def hashed_copy_rows(dataframe, column_types, keys):
+    """The DataFrame's COPY rows with a _row_hash of each row's values appended, and, for a table without keys,
+       the row's _row_occurrence among identical rows. Without keys, the row hash identifies the row, so it leaves
+       out the positional index column, which the upsert compares separately."""
+    hashed_columns = [i for i, column in enumerate(dataframe.columns) if keys or column != "index"]
+    occurrences = collections.Counter()
+    for row in copy_rows(dataframe, column_types):
+        row_hash = hashlib.md5("\x1f".join(row[i] for i in hashed_columns).encode("utf-8")).hexdigest()
+        if keys:
+            yield row + (row_hash,)
+        else:
+            yield row + (row_hash, occurrences[row_hash])
+            occurrences[row_hash] += 1
+
+
+def upsert_dataframe_to_table(connection, dataframe, table_name, schema="general"):
+    """Bring schema.table_name up to date with the DataFrame in one transaction, touching only the rows that
+       changed: the rows are staged with COPY, upserted with INSERT ... ON CONFLICT on the table's keys (TABLE_KEYS,
+       else the row hash), updated only where the row hash differs, and the rows missing from the stage are
+       deleted. Rows with a missing key aren't loaded, and of the rows with the same keys only the last is; how
+       many rows were skipped is printed. A table that doesn't exist yet, or whose columns changed, is recreated
+       instead. Returns the row count and the numbers of rows inserted, updated and deleted."""
+    dataframe = dataframe.reset_index()
+    keys = TABLE_KEYS.get(table_name)
+    if keys:
+        missing_keys = dataframe[keys].isna().any(axis=1)
+        if missing_keys.any():
+            print(f"{schema}.{table_name} has {missing_keys.sum()} rows without a {', '.join(keys)}; they aren't "
+                  f"loaded.")
+            dataframe = dataframe[~missing_keys]
+        duplicates = dataframe.duplicated(subset=keys, keep="last")
+        if duplicates.any():
+            print(f"{schema}.{table_name} has {duplicates.sum()} rows with the same {', '.join(keys)} as a later "
+                  f"row; only the last of each is loaded.")
+            dataframe = dataframe[~duplicates]
+    column_types = {column: postgres_column_type(dataframe[column]) for column in dataframe.columns}
+    rows = hashed_copy_rows(dataframe, column_types, keys)
+    column_types["_row_hash"] = "TEXT"
+    if not keys:
+        column_types["_row_occurrence"] = "BIGINT"
+        keys = ["_row_hash", "_row_occurrence"]
+    columns = list(column_types)
+
+    qualified_table_name = f"{quote_identifier(schema)}.{quote_identifier(table_name)}"
+    staging_table_name = quote_identifier(f"{table_name}_staging")
+    column_names = ", ".join(quote_identifier(column) for column in columns)
+    key_names = ", ".join(quote_identifier(key) for key in keys)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_schema = %s "
+                           "AND table_name = %s ORDER BY ordinal_position", (schema, table_name))
+            if [column for column, in cursor.fetchall()] != columns:
+                print(f"{schema}.{table_name} doesn't have the incremental load's columns; recreating it.")
+                cursor.execute(f"DROP TABLE IF EXISTS {qualified_table_name}")
+                cursor.execute(f"CREATE TABLE {qualified_table_name} ({column_definitions(column_types)}, "
+                               f"PRIMARY KEY ({key_names}))")
+                copy_into(cursor, qualified_table_name, columns, rows)
+                changes = dict(inserted=len(dataframe), updated=0, deleted=0)
+            else:
+                cursor.execute(f"CREATE TEMP TABLE {staging_table_name} (LIKE {qualified_table_name}) ON COMMIT DROP")
+                copy_into(cursor, staging_table_name, columns, rows)
+                updates = ", ".join(f"{quote_identifier(column)} = EXCLUDED.{quote_identifier(column)}"
+                                    for column in columns if column not in keys)
+                changed = "target._row_hash IS DISTINCT FROM EXCLUDED._row_hash"
+                if "_row_occurrence" in keys and "index" in columns:
+                    changed += ' OR target."index" IS DISTINCT FROM EXCLUDED."index"'
+                cursor.execute(f"INSERT INTO {qualified_table_name} AS target ({column_names}) "
+                               f"SELECT {column_names} FROM {staging_table_name} "
+                               f"ON CONFLICT ({key_names}) DO UPDATE SET {updates} "
+                               f"WHERE {changed} "
+                               f"RETURNING (xmax = 0)")
+                inserted_flags = [inserted for inserted, in cursor.fetchall()]
+                key_matches = " AND ".join(f"staged.{quote_identifier(key)} = target.{quote_identifier(key)}"
+                                           for key in keys)
+                cursor.execute(f"DELETE FROM {qualified_table_name} AS target WHERE NOT EXISTS "
+                               f"(SELECT 1 FROM {staging_table_name} AS staged WHERE {key_matches})")
+                changes = dict(inserted=sum(inserted_flags), updated=len(inserted_flags) - sum(inserted_flags),
+                               deleted=cursor.rowcount)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return len(dataframe), changes
+
+
+def copy_artifact_to_table(table_name, artifact, schema, sql_engine, incremental):
+    """Load one DataFrame artifact into its table on a pooled connection and return (rows, seconds, changes)."""
+    started = time.perf_counter()
+    dataframe = utils.load_dataframe(artifact)
+    load = upsert_dataframe_to_table if incremental else copy_dataframe_to_table
+    connection = sql_engine.raw_connection()
+    try:
+        rows, changes = load(connection, dataframe, table_name, schema)
+    finally:
+        connection.close()
+    return rows, time.perf_counter() - started, changes
+
+
+def copy_dataframes_to_sql_database(tables, schema="general", sql_engine=None, max_workers=4, incremental=None):
+    """Bulk load (table name, artifact) pairs with COPY, one table per connection from the engine's pool, and
+       report each table's rows/s. Each table is loaded in its own transaction; the failures are raised together
+       once every table has finished. Pass sql_engine to load into another database, e.g. a local test one.
+       incremental (by default, SQL_LOAD_MODE is "incremental") upserts the changed rows instead of recreating
+       the tables."""
+    sql_engine = sql_engine or get_engine()
+    incremental = SQL_LOAD_MODE == "incremental" if incremental is None else incremental
+    started = time.perf_counter()
+    timings = {}
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(copy_artifact_to_table, table_name, artifact, schema, sql_engine,
+                                   incremental): table_name
+                   for table_name, artifact in tables}
+        for future in as_completed(futures):
+            table_name = futures[future]
+            try:
+                timings[table_name] = future.result()
+            except Exception as e:
+                failures[table_name] = e
+                print(f"Loading {table_name} failed with {e!r}")
+
+    print(f"Loaded {len(timings)} of {len(tables)} tables in {time.perf_counter() - started:.1f}s:")
+    for table_name, _ in tables:
+        if table_name in timings:
+            rows, seconds, changes = timings[table_name]
+            changed = "".join(f", {count} {change}" for change, count in changes.items())
+            print(f"    {schema}.{table_name}: {rows} rows in {seconds:.2f}s ({rows / max(seconds, 1e-9):.0f} rows/s)"
+                  f"{changed}")
+        else:
+            print(f"    {schema}.{table_name}: FAILED ({failures[table_name]!r})")
+    if failures:
+        raise RuntimeError(f"Loading tables failed: {', '.join(failures)}")
+    return timings
+
+
+def write_dataframes_to_sql_database(backend=None):
     """ Write records stored in DataFrames to SQL databases. """
+    write_complete_movie_data_to_sql_database(backend)
+    write_pre_db_dataframes_to_sql_database(backend)
+
+
+def write_complete_movie_data_to_sql_database(backend=None):
+    """ Write the preprocessed movie data, the pipeline's final output, to the database. """
+    if (backend or SQL_BACKEND) == "duckdb":
+        print(f"The duckdb backend has no database; the complete movie data is in {COMPLETE_MOVIE_DATA_TABLES[0][1]}.")
+        return
+    print("Creating complete_movie_data database table...")
+    copy_dataframes_to_sql_database(COMPLETE_MOVIE_DATA_TABLES)
+
+
+def write_pre_db_dataframes_to_sql_database(backend=None):
+    """ Write the cleaned collected datasets to the database, where the movie_data and actor_data tables are built
+        from them. """
+    if (backend or SQL_BACKEND) == "duckdb":
+        print("The duckdb backend reads the pre-db artifacts directly; nothing to write.")
+        return
     print("Starting push to database...")
-    with engine.begin() as connection:
-        complete_movie_data_df = pd.read_pickle("updated_movie_data_df_post_db_v5.pkl")
-        print("Creating complete_movie_data database table...")
-        complete_movie_data_df.to_sql("complete_movie_data", con=connection, schema="general", if_exists="replace")
-        omdb_df = pd.read_pickle("updated_omdb_df_pre_db.pkl")
-        print("Creating omdb_df_data database table...")
-        omdb_df.to_sql("updated_omdb_df_data", con=connection, schema="general", if_exists="replace")
-        tmdb_df = pd.read_pickle("joined_tmdb_df_pre_db.pkl")
-        print("Creating tmdb_df_data database table...")
-        tmdb_df.to_sql("joined_tmdb_df_data", con=connection, schema="general", if_exists="replace")
-        cast_df = pd.read_pickle("additional_cast_df_pre_db.pkl")
-        print("Creating cast_df_data database table...")
-        cast_df.to_sql("additional_cast_df_data", con=connection, schema="general", if_exists="replace")
-        crew_df = pd.read_pickle("additional_crew_df_pre_db.pkl")
-        print("Creating crew_df_data database table...")
-        crew_df.to_sql("additional_crew_df_data", con=connection, schema="general", if_exists="replace")
-        box_office_df = pd.read_pickle("additional_box_office_df_pre_db.pkl")
-        print("Creating box_office_df_data database table...")
-        box_office_df.to_sql("additional_box_office_df_data", con=connection, schema="general", if_exists="replace")
-        soundtrack_df = pd.read_pickle("additional_soundtrack_credits_df_pre_db.pkl")
-        print("Creating soundtrack_df_data database table...")
-        soundtrack_df.to_sql("additional_soundtrack_df_data", con=connection, schema="general", if_exists="replace")
-        grammy_awards_df = pd.read_pickle("grammy_awards_df_pre_db.pkl")
-        print("Creating grammy_awards_df_data database table...")
-        grammy_awards_df.to_sql("grammy_awards_df_data", con=connection, schema="general", if_exists="replace")
-        gg_awards_df = pd.read_pickle("gg_awards_df_pre_db.pkl")
-        print("Creating gg_awards_df_data database table...")
-        gg_awards_df.to_sql("gg_awards_df_data", con=connection, schema="general", if_exists="replace")
-        oscar_awards_df = pd.read_pickle("oscar_awards_df_pre_db.pkl")
-        print("Creating oscar_awards_df_data database table...")
-        oscar_awards_df.to_sql("oscar_awards_df_data", con=connection, schema="general", if_exists="replace")
-        actor_data_df = pd.read_pickle("actor_df_pre_db.pkl")
-        print("Creating actor_data_df_data database table...")
-        actor_data_df.to_sql("actor_data_df", con=connection, schema="general", if_exists="replace")
-        actor_na_df = pd.read_pickle("actor_na_df_pre_db.pkl")
-        print("Creating actor_na_df database table...")
-        actor_na_df.to_sql("actor_na_df", con=connection, schema="general", if_exists="replace")
-        name_id_df = pd.read_pickle("name_id_df_pre_db.pkl")
-        print("Creating name_id_df_data database table...")
-        name_id_df.to_sql("name_id_df", con=connection, schema="general", if_exists="replace")
-
-def load_sql_tables_as_dataframes():
-    """ Load tables stored in SQL database as dataframes. """
-    print("Loading movie_data_df database table...")
-    movie_data_df = pd.read_sql_table("movie_data", con=engine, schema="public")
-    movie_data_df.to_pickle("updated_movie_data_df_post_db.pkl")
-    print("Loading actor_data_df database table...")
-    actor_data_df = pd.read_sql_table("actor_data", con=engine, schema="public")
-    actor_data_df.to_pickle("actor_data_df_post_db.pkl")
-    print("Loading grammy_awards_df database table...")
-    grammy_awards_df = pd.read_sql_table("grammy_awards_df_data", con=engine, schema="public")
-    grammy_awards_df.to_pickle("grammy_awards_df_post_db.pkl")
-    print("Loading oscar_awards_df database table...")
-    oscar_awards_df = pd.read_sql_table("oscar_awards_df_data", con=engine, schema="public")
-    oscar_awards_df.to_pickle("oscar_awards_df_post_db.pkl")
-    print("Loading gg_awards_df database table...")
-    gg_awards_df = pd.read_sql_table("gg_awards_df_data", con=engine, schema="public")
-    gg_awards_df.to_pickle("gg_awards_df_post_db.pkl")
-    print("Loading soundtrack_credits_df database table...")
-    soundtrack_credits_df = pd.read_sql_table("joined_soundtrack_df_data", con=engine, schema="public")
-    soundtrack_credits_df.to_pickle("updated_soundtrack_credits_df_post_db.pkl")
+    copy_dataframes_to_sql_database(PRE_DB_TABLES)
+
+
+def plan_nodes(plan):
+    """Every node of an EXPLAIN plan, depth first."""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def node_label(node):
+    relation = node.get("Relation Name") or node.get("CTE Name") or node.get("Index Name")
+    return f"{node['Node Type']} on {relation}" if relation else node["Node Type"]
+
+
+def run_sql_transforms(sql_engine=None, slowest_nodes=3, backend=None):
+    """ Run the sql_transforms steps in order, in one transaction, and report each step's time. The steps that build
+        a table run under EXPLAIN (ANALYZE, FORMAT JSON), so their report also has the planning and execution times
+        and the plan nodes that took longest. Each run is logged with the transforms' version. """
+    if (backend or SQL_BACKEND) == "duckdb":
+        print("The duckdb backend runs the merges as it loads the tables; nothing to transform.")
+        return
+    sql_engine = sql_engine or get_engine()
+    print(f"Running SQL transforms version {sql_transforms.SQL_TRANSFORMS_VERSION}...")
+    with sql_engine.begin() as connection:
+        connection.exec_driver_sql(sql_transforms.CREATE_RUN_LOG)
+        for step in sql_transforms.TRANSFORM_STEPS:
+            started = time.perf_counter()
+            if step.explain:
+                explained = connection.exec_driver_sql(f"EXPLAIN (ANALYZE, FORMAT JSON) {step.sql}").scalar()[0]
+            else:
+                connection.exec_driver_sql(step.sql)
+                explained = {}
+            seconds = time.perf_counter() - started
+            connection.exec_driver_sql(sql_transforms.LOG_RUN, dict(
+                version=sql_transforms.SQL_TRANSFORMS_VERSION, step=step.name, seconds=seconds,
+                planning_ms=explained.get("Planning Time"), execution_ms=explained.get("Execution Time")))
+
+            print(f"    {step.name}: {seconds:.2f}s")
+            if explained:
+                print(f"        planning {explained['Planning Time']:.1f}ms, "
+                      f"execution {explained['Execution Time']:.1f}ms, {explained['Plan']['Actual Rows']} rows")
+                nodes = sorted(plan_nodes(explained["Plan"]), reverse=True,
+                               key=lambda node: node["Actual Total Time"] * node["Actual Loops"])
+                for node in nodes[:slowest_nodes]:
+                    print(f"        {node_label(node)}: {node['Actual Total Time'] * node['Actual Loops']:.1f}ms, "
+                          f"{node['Actual Rows'] * node['Actual Loops']} rows")
+
+
+# Declared dtypes for the tables read back from the database, applied as they are read: "category", "Int64"
+# (nullable ints), "datetime64[ns, UTC]" and "list" (array columns, whether the driver returns them as lists or as
+# their {a,b} text form). Other columns keep the types pandas infers.
+MOVIE_DATA_DTYPES = {
+    "Rated": "category", "Type": "category", "Runtime": "Int64", "imdbVotes": "Int64",
+    "Released": "datetime64[ns, UTC]", "US_release_date": "datetime64[ns, UTC]",
+    "GB_release_date": "datetime64[ns, UTC]",
+    "Genre": "list", "Country": "list", "Writer": "list", "Actors": "list", "Production": "list", "Language": "list",
+    "Keyword_List": "list", "movie_cast": "list", "movie_crew": "list", "soundtrack_songs": "list",
+    "soundtrack_artists": "list",
+}
+ACTOR_DATA_DTYPES = {"Gender": "category", "Birthday": "datetime64[ns, UTC]", "Movie_Credits": "list"}
+AWARDS_DTYPES = {"ceremony": "category", "category": "category"}
+
+# (table name, DataFrame artifact, declared dtypes) for every table read back from the database.
+POST_DB_TABLES = [
+    ("movie_data", "updated_movie_data_df_post_db.arrow", MOVIE_DATA_DTYPES),
+    ("actor_data", "actor_data_df_post_db.arrow", ACTOR_DATA_DTYPES),
+    ("grammy_awards_df_data", "grammy_awards_df_post_db.arrow", AWARDS_DTYPES),
+    ("oscar_awards_df_data", "oscar_awards_df_post_db.arrow", AWARDS_DTYPES),
+    ("gg_awards_df_data", "gg_awards_df_post_db.arrow", AWARDS_DTYPES),
+    ("joined_soundtrack_df_data", "updated_soundtrack_credits_df_post_db.arrow", {}),
+]
+POST_DB_READ_CHUNKSIZE = 10000
+
+TEXT_ARRAY_ELEMENT = re.compile(r'"((?:[^"\\]|\\.)*)"|([^,]+)')
+
+
+def parse_text_array(text_array):
+    """Parse the text form of a one-dimensional PostgreSQL array, e.g. {Drama,"Sci-Fi, Horror",NULL}."""
+    elements = []
+    for quoted, unquoted in TEXT_ARRAY_ELEMENT.findall(text_array[1:-1]):
+        if unquoted:
+            elements.append(None if unquoted == "NULL" else unquoted)
+        else:
+            elements.append(re.sub(r"\\(.)", r"\1", quoted))
+    return elements
+
+
+def as_list(value):
+    if isinstance(value, str) and value.startswith("{") and value.endswith("}"):
+        return parse_text_array(value)
+    return value
+
+
+def apply_dtypes(dataframe, dtypes):
+    """Convert the DataFrame's columns to their declared dtypes (see MOVIE_DATA_DTYPES)."""
+    for column, dtype in dtypes.items():
+        if column not in dataframe.columns:
+            continue
+        if dtype == "list":
+            dataframe[column] = dataframe[column].map(as_list)
+        elif dtype == "Int64":
+            dataframe[column] = pd.to_numeric(dataframe[column], errors="coerce").astype("Int64")
+        elif dtype.startswith("datetime64"):
+            dataframe[column] = pd.to_datetime(dataframe[column], utc=True)
+        else:
+            dataframe[column] = dataframe[column].astype(dtype)
+    return dataframe
+
+
+def arrow_field_type(sql_type, dtype=None):
+    """The Arrow type of a column of the given SQL type read back by read_sql_table and converted to dtype by
+       apply_dtypes, or None if the SQL type doesn't determine it (e.g. JSONB)."""
+    import pyarrow as pa
+    from sqlalchemy import types
+
+    if dtype == "list" or (isinstance(sql_type, types.ARRAY) and isinstance(sql_type.item_type, types.String)):
+        return pa.list_(pa.string())
+    if dtype == "Int64" or isinstance(sql_type, types.Integer):
+        return pa.int64()
+    if dtype is not None and dtype.startswith("datetime64"):
+        return pa.timestamp("ns", tz="UTC")
+    if isinstance(sql_type, types.Boolean):
+        return pa.bool_()
+    # read_sql_table turns NUMERIC values into floats.
+    if isinstance(sql_type, types.Numeric):
+        return pa.float64()
+    if isinstance(sql_type, types.DateTime):
+        return pa.timestamp("ns", tz="UTC" if sql_type.timezone else None)
+    if isinstance(sql_type, types.String):
+        return pa.string()
+    return None
+
+
+def read_table_in_chunks(table_name, artifact, dtypes, chunksize=POST_DB_READ_CHUNKSIZE, schema="public",
+                         sql_engine=None):
+    """Stream a table through a server-side cursor chunksize rows at a time, applying the declared dtypes to each
+       chunk and appending it to the artifact, so peak memory tracks the chunk size rather than the table size.
+       The artifact's column types come from the table's SQL column types, so a column that is null in the first
+       chunks doesn't hold them back. Returns the number of rows read."""
+    from sqlalchemy import inspect
+
+    sql_engine = sql_engine or get_engine()
+    columns = inspect(sql_engine).get_columns(table_name, schema=schema)
+    field_types = {column["name"]: arrow_field_type(column["type"], dtypes.get(column["name"]))
+                   for column in columns}
+    field_types = {name: field_type for name, field_type in field_types.items() if field_type is not None}
+    with sql_engine.connect().execution_options(stream_results=True) as connection, \
+            utils.DataFrameChunkWriter(artifact, field_types) as writer:
+        for chunk in pd.read_sql_table(table_name, con=connection, schema=schema, chunksize=chunksize):
+            writer.write(apply_dtypes(chunk, dtypes))
+    return writer.rows
+
+
+# The DuckDB backend's queries for the post-db tables, the same ones the SQL transforms build them with.
+DUCKDB_QUERIES = {"movie_data": sql_transforms.DUCKDB_MOVIE_DATA_QUERY,
+                  "actor_data": sql_transforms.DUCKDB_ACTOR_DATA_QUERY,
+                  **{table_name: sql_transforms.award_table_query(table_name)
+                     for table_name in sql_transforms.AWARD_TABLE_COLUMNS},
+                  "joined_soundtrack_df_data": sql_transforms.JOINED_SOUNDTRACK_QUERY}
+
+
+def run_duckdb_merges():
+    """ Run the post-db table queries in an in-process DuckDB database over memory-mapped views of the pre-db
+        artifacts, and return every post-db table as an Arrow table, by table name. """
+    import duckdb
+    import pyarrow as pa
+
+    connection = duckdb.connect()
+    try:
+        connection.execute("CREATE SCHEMA general")
+        for table_name, artifact in PRE_DB_TABLES:
+            connection.register(f"{table_name}_artifact", utils.load_table(artifact))
+            connection.execute(f"CREATE VIEW general.{quote_identifier(table_name)} AS "
+                               f"SELECT * FROM {quote_identifier(table_name + '_artifact')}")
+        tables = {}
+        for table_name, query in DUCKDB_QUERIES.items():
+            started = time.perf_counter()
+            # Newer duckdb releases return a RecordBatchReader from arrow(), older ones a Table.
+            tables[table_name] = pa.table(connection.execute(query).arrow())
+            print(f"    {table_name}: {tables[table_name].num_rows} rows in {time.perf_counter() - started:.2f}s")
+    finally:
+        connection.close()
+    return tables
+
+
+def load_sql_tables_as_dataframes(chunksize=POST_DB_READ_CHUNKSIZE, backend=None):
+    """ Load tables stored in SQL database as dataframes. Each table is streamed chunksize rows at a time;
+        chunksize=None reads each table whole. The duckdb backend builds the tables from the pre-db artifacts
+        instead. """
+    if (backend or SQL_BACKEND) == "duckdb":
+        print("Running the merges with duckdb...")
+        tables = run_duckdb_merges()
+        for table_name, artifact, dtypes in POST_DB_TABLES:
+            utils.save_dataframe(apply_dtypes(tables[table_name].to_pandas(), dtypes), artifact)
+        return
+    for table_name, artifact, dtypes in POST_DB_TABLES:
+        print(f"Loading {table_name} database table...")
+        if chunksize is None:
+            dataframe = pd.read_sql_table(table_name, con=get_engine(), schema="public")
+            utils.save_dataframe(apply_dtypes(dataframe, dtypes), artifact)
+        else:
+            rows = read_table_in_chunks(table_name, artifact, dtypes, chunksize)
+            print(f"Streamed {rows} rows of {table_name} in chunks of {chunksize}.")
@@ -0,0 +1,98 @@
+""" This file contains the daily API request quota tracker used by the OMDb fetcher. """
+
+import datetime
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+
+
+class QuotaExhausted(Exception):
+    """Raised when an API key has no requests left for the day."""
+
+
+def key_label(api_key):
+    """Identify an API key without storing the key itself."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def today():
+    # OMDb's daily limits reset at midnight UTC.
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+class DailyQuota:
+    """Counts requests used per API key per day in SQLite, so every process and run shares the same budget."""
+
+    def __init__(self, path, daily_limit):
+        self.path = path
+        self.daily_limit = daily_limit
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False,
+                                              isolation_level=None)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS usage (key_label TEXT, day TEXT, used INTEGER, "
+                                    "PRIMARY KEY (key_label, day))")
+        return self.connection
+
+    def used(self, api_key):
+        with self.lock:
+            row = self.connect().execute("SELECT used FROM usage WHERE key_label = ? AND day = ?",
+                                         (key_label(api_key), today().isoformat())).fetchone()
+        return row[0] if row else 0
+
+    def remaining(self, api_key):
+        return max(0, self.daily_limit - self.used(api_key))
+
+    def consume(self, api_key):
+        """Record one request against the key, raising QuotaExhausted if today's budget is already spent."""
+        label, day = key_label(api_key), today().isoformat()
+        with self.lock:
+            connection = self.connect()
+            # BEGIN IMMEDIATE takes the write lock, so the check and the increment are atomic across processes.
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT used FROM usage WHERE key_label = ? AND day = ?",
+                                         (label, day)).fetchone()
+                used = row[0] if row else 0
+                if used >= self.daily_limit:
+                    raise QuotaExhausted(f'API key {label} has used all {self.daily_limit} requests for {day}.')
+                connection.execute("INSERT OR REPLACE INTO usage VALUES (?, ?, ?)", (label, day, used + 1))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def mark_exhausted(self, api_key):
+        """Use up the rest of the key's budget for today, e.g. after the API reports that the limit was reached."""
+        with self.lock:
+            self.connect().execute("INSERT OR REPLACE INTO usage VALUES (?, ?, ?)",
+                                   (key_label(api_key), today().isoformat(), self.daily_limit))
+
+    def key_with_budget(self, api_keys):
+        """Return the key with the most requests left today, or None if every key is spent."""
+        api_key = max(api_keys, key=self.remaining)
+        return api_key if self.remaining(api_key) > 0 else None
+
+    def plan(self, pending_requests, api_keys, requests_per_second):
+        """Spread the pending requests over today's remaining budget and the following days' full budgets;
+           return the number of requests to send today and the projected completion time."""
+        remaining_today = sum(self.remaining(api_key) for api_key in api_keys)
+        daily_budget = self.daily_limit * len(api_keys)
+        requests_today = min(pending_requests, remaining_today)
+        if pending_requests <= remaining_today:
+            completion = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+                seconds=pending_requests / requests_per_second)
+        else:
+            extra_days = math.ceil((pending_requests - remaining_today) / daily_budget)
+            last_day_requests = (pending_requests - remaining_today) - (extra_days - 1) * daily_budget
+            start_of_last_day = datetime.datetime.combine(today() + datetime.timedelta(days=extra_days),
+                                                          datetime.time(), tzinfo=datetime.timezone.utc)
+            completion = start_of_last_day + datetime.timedelta(seconds=last_day_requests / requests_per_second)
+        return requests_today, completion
@@ -0,0 +1,124 @@
+""" This file contains the on-disk HTTP response cache shared by the TMDb and OMDb API functions. """
+
+import fnmatch
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlencode
+
+DEFAULT_CACHE_PATH = "data_files/http_response_cache.sqlite"
+DEFAULT_MAX_SIZE_BYTES = 2 * 1024 ** 3
+DAY = 24 * 60 * 60
+
+# Query parameters that identify the caller rather than the resource; they never form part of a cache key.
+SECRET_PARAMS = {"api_key", "apikey"}
+
+
+def make_cache_key(endpoint, params):
+    """Build a cache key from the endpoint and its sorted query parameters, leaving out API keys."""
+    params = sorted((str(key), str(value)) for key, value in (params or {}).items() if key not in SECRET_PARAMS)
+    return f'{endpoint}?{urlencode(params)}'
+
+
+class CachedResponse:
+    """Stand-in for a successful requests.Response that is replayed from the cache."""
+    ok = True
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ResponseCache:
+    """A SQLite-backed response cache with per-endpoint TTLs, size-bounded LRU eviction and hit/miss counters.
+
+       ttls maps fnmatch patterns over the endpoint URL to a time-to-live in seconds; the first match wins and
+       default_ttl applies otherwise. A TTL of None never expires."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttls=None, default_ttl=30 * DAY,
+                 max_size_bytes=DEFAULT_MAX_SIZE_BYTES):
+        self.path = path
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = None
+        self.total_size = 0
+
+    def connect(self):
+        """Open the cache database on first use, creating the table if needed."""
+        if self.connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, body TEXT, "
+                                    "size INTEGER, created_at REAL, accessed_at REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self.total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        return self.connection
+
+    def ttl_for(self, endpoint):
+        for pattern, ttl in self.ttls.items():
+            if fnmatch.fnmatch(endpoint, pattern):
+                return ttl
+        return self.default_ttl
+
+    def get(self, endpoint, params=None):
+        """Return the cached response body for the request, or None on a miss or an expired entry."""
+        key = make_cache_key(endpoint, params)
+        ttl = self.ttl_for(endpoint)
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute("SELECT body, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (ttl is not None and now - row[1] > ttl):
+                self.misses += 1
+                return None
+            connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, endpoint, params, body):
+        """Store a response body, evicting the least recently used entries if the cache grows too large."""
+        key = make_cache_key(endpoint, params)
+        size = len(body.encode("utf-8"))
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            old_row = connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, body, size, now, now))
+            connection.commit()
+            self.total_size += size - (old_row[0] if old_row else 0)
+            if self.total_size > self.max_size_bytes:
+                self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache is back under 90% of its size limit."""
+        connection = self.connect()
+        # Other processes may share the file, so start from the real total.
+        self.total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        target_size = self.max_size_bytes * 0.9
+        evicted_keys = []
+        for key, size in connection.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            if self.total_size <= target_size:
+                break
+            evicted_keys.append((key,))
+            self.total_size -= size
+        connection.executemany("DELETE FROM responses WHERE key = ?", evicted_keys)
+        connection.commit()
+
+    def summary(self):
+        """Describe the cache's hit/miss counts for this process."""
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0
+        return (f'{self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate), '
+                f'{self.total_size / 1024 ** 2:.1f} MB cached')
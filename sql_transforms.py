@@ -0,0 +1,271 @@
+""" This file contains the versioned SQL transforms that build the post-db tables (movie_data, actor_data, the award
+    tables and joined_soundtrack_df_data) from the pre-db tables written by psql_database_eng, which runs them in
+    order with run_sql_transforms, and the same queries for the DuckDB backend, which runs them over the pre-db
+    artifacts.
+
+    Bump SQL_TRANSFORMS_VERSION whenever a step changes; every run is logged with it in general.sql_transform_runs.
+    Version 1 was the merge in database_queries.ipynb, which joined crew to cast before aggregating them, so each
+    movie's cast and crew arrays came out repeated crew × cast times. Version 3 leaves the pre-db tables unaltered,
+    so the incremental load can keep updating them in place. Version 4 builds movie_data and actor_data in build
+    tables and swaps their rows into the existing tables, so views on them survive a rebuild. Version 5 builds the
+    award tables in public from the pre-db tables, with the column renames database_queries.ipynb made and without
+    the index column. Version 6 builds joined_soundtrack_df_data, the soundtrack credits of the movies in
+    updated_omdb_df_data, which until then was made outside the repo, so both backends build it with the same
+    query. """
+
+import collections
+
+SQL_TRANSFORMS_VERSION = 6
+
+# A step is one or more statements run together. explain runs the (single) statement under EXPLAIN (ANALYZE,
+# FORMAT JSON), which executes it and returns its plan with the actual timings; only queries can be explained, so
+# DDL steps are timed from the client.
+TransformStep = collections.namedtuple("TransformStep", ["name", "sql", "explain"])
+
+CREATE_RUN_LOG = """
+CREATE TABLE IF NOT EXISTS general.sql_transform_runs (
+    version INT,
+    step TEXT,
+    seconds DOUBLE PRECISION,
+    planning_ms DOUBLE PRECISION,
+    execution_ms DOUBLE PRECISION,
+    ran_at TIMESTAMPTZ DEFAULT now()
+)"""
+
+LOG_RUN = """
+INSERT INTO general.sql_transform_runs (version, step, seconds, planning_ms, execution_ms)
+VALUES (%(version)s, %(step)s, %(seconds)s, %(planning_ms)s, %(execution_ms)s)"""
+
+# The join keys of the movie_data and actor_data merges. ANALYZE refreshes the planner's statistics, as the tables
+# have just been reloaded.
+CREATE_JOIN_KEY_INDEXES = """
+CREATE INDEX IF NOT EXISTS additional_cast_df_data_tmdb_id_idx ON general.additional_cast_df_data ("TMDb_ID");
+CREATE INDEX IF NOT EXISTS additional_crew_df_data_tmdb_id_idx ON general.additional_crew_df_data ("TMDb_ID");
+CREATE INDEX IF NOT EXISTS joined_tmdb_df_data_imdb_id_idx ON general.joined_tmdb_df_data ("IMDb_ID");
+CREATE INDEX IF NOT EXISTS joined_tmdb_df_data_tmdb_id_idx ON general.joined_tmdb_df_data ("TMDb_ID");
+CREATE INDEX IF NOT EXISTS updated_omdb_df_data_imdb_id_idx ON general.updated_omdb_df_data ("imdbID");
+CREATE INDEX IF NOT EXISTS additional_soundtrack_df_data_imdb_movie_id_idx
+    ON general.additional_soundtrack_df_data ("imdb_movie_ID");
+CREATE INDEX IF NOT EXISTS additional_box_office_df_data_imdb_id_idx
+    ON general.additional_box_office_df_data ("IMDb_ID");
+CREATE INDEX IF NOT EXISTS actor_data_df_imdb_id_idx ON general.actor_data_df ("IMDb_ID");
+CREATE INDEX IF NOT EXISTS name_id_df_imdb_ids_idx ON general.name_id_df (imdb_ids);
+ANALYZE general.additional_cast_df_data, general.additional_crew_df_data, general.joined_tmdb_df_data,
+    general.updated_omdb_df_data, general.additional_soundtrack_df_data, general.additional_box_office_df_data,
+    general.actor_data_df, general.name_id_df"""
+
+
+def column_signature(table_name):
+    """A query for the names and types of a table's columns, in order (NULL if the table doesn't exist)."""
+    return (f"(SELECT array_agg(attname || ' ' || format_type(atttypid, atttypmod) ORDER BY attnum) "
+            f"FROM pg_attribute WHERE attrelid = to_regclass('{table_name}') AND attnum > 0 AND NOT attisdropped)")
+
+
+def replace_table(table_name):
+    """Replace public.table_name with the public.table_name_build table just built. If the table's columns haven't
+       changed, its rows are swapped for the build table's, so the views that depend on it keep working; otherwise
+       (or if it doesn't exist yet) it is dropped and the build table renamed to it."""
+    return f"""
+DO $$
+BEGIN
+    IF {column_signature(f"public.{table_name}")} = {column_signature(f"public.{table_name}_build")} THEN
+        TRUNCATE public.{table_name};
+        INSERT INTO public.{table_name} SELECT * FROM public.{table_name}_build;
+        DROP TABLE public.{table_name}_build;
+    ELSE
+        DROP TABLE IF EXISTS public.{table_name};
+        ALTER TABLE public.{table_name}_build RENAME TO {table_name};
+    END IF;
+END
+$$"""
+
+
+DROP_MOVIE_DATA_BUILD = "DROP TABLE IF EXISTS public.movie_data_build"
+
+# Cast and crew are aggregated per movie separately and joined afterwards, so each array holds every credit once.
+# Shared by both backends, which add their own final select.
+MOVIE_DATA_MERGE = """
+WITH
+    cte_cast AS (
+        SELECT
+            "TMDb_ID",
+            ARRAY_AGG(original_name ORDER BY "order") AS movie_cast
+        FROM general.additional_cast_df_data
+        GROUP BY "TMDb_ID"
+),
+    cte_crew AS (
+        SELECT
+            "TMDb_ID",
+            ARRAY_AGG(original_name) AS movie_crew
+        FROM general.additional_crew_df_data
+        GROUP BY "TMDb_ID"
+),
+    cte_soundtrack_credits AS (
+        SELECT
+            "imdb_movie_ID",
+            ARRAY_AGG("song_title") AS soundtrack_songs,
+            ARRAY_AGG(DISTINCT "artist_name") AS soundtrack_artists
+        FROM general.additional_soundtrack_df_data
+        GROUP BY "imdb_movie_ID"
+),
+    cte_merged_data AS (
+        SELECT DISTINCT
+            odd.*,
+            tdd."US_release_date",
+            tdd."GB_release_date",
+            tdd."Alternative_Titles",
+            tdd."Keyword_List",
+            tdd."Budget",
+            bdd2."Opening_Weekend_Gross",
+            bdd2."Worldwide_Gross",
+            castd.movie_cast,
+            crewd.movie_crew,
+            stcdd.soundtrack_songs,
+            stcdd.soundtrack_artists
+        FROM general.updated_omdb_df_data AS odd
+        LEFT JOIN general.joined_tmdb_df_data AS tdd
+         ON tdd."IMDb_ID" = odd."imdbID"
+        LEFT JOIN cte_cast AS castd
+         ON castd."TMDb_ID" = tdd."TMDb_ID"
+        LEFT JOIN cte_crew AS crewd
+         ON crewd."TMDb_ID" = tdd."TMDb_ID"
+        LEFT JOIN cte_soundtrack_credits AS stcdd
+         ON stcdd."imdb_movie_ID" = odd."imdbID"
+        LEFT JOIN general.additional_box_office_df_data AS bdd2
+         ON odd."imdbID" = bdd2."IMDb_ID"
+)"""
+
+CREATE_MOVIE_DATA = "CREATE TABLE public.movie_data_build AS" + MOVIE_DATA_MERGE + """
+(SELECT
+    cterd.*,
+    CARDINALITY(cterd."Alternative_Titles"::TEXT[]) AS alternative_titles
+ FROM cte_merged_data AS cterd)"""
+
+ALTER_MOVIE_DATA_TYPES = """
+ALTER TABLE public.movie_data_build
+    DROP COLUMN IF EXISTS _row_hash,
+    DROP COLUMN "Alternative_Titles",
+    DROP COLUMN "Type",
+    ALTER COLUMN "Runtime" SET DATA TYPE INT USING "Runtime"::INT,
+    ALTER COLUMN "Genre" SET DATA TYPE TEXT[] USING "Genre"::TEXT[],
+    ALTER COLUMN "Writer" SET DATA TYPE TEXT[] USING "Writer"::TEXT[],
+    ALTER COLUMN "Actors" SET DATA TYPE TEXT[] USING "Actors"::TEXT[],
+    ALTER COLUMN "Production" SET DATA TYPE TEXT[] USING "Production"::TEXT[],
+    ALTER COLUMN "Language" SET DATA TYPE TEXT[] USING "Language"::TEXT[],
+    ALTER COLUMN "Country" SET DATA TYPE TEXT[] USING "Country"::TEXT[],
+    ALTER COLUMN "imdbVotes" SET DATA TYPE INT USING "imdbVotes"::INT,
+    ALTER COLUMN "imdbRating" SET DATA TYPE NUMERIC USING "imdbRating"::NUMERIC,
+    ALTER COLUMN "Keyword_List" SET DATA TYPE TEXT[] USING "Keyword_List"::TEXT[],
+    ALTER COLUMN "Opening_Weekend_Gross" SET DATA TYPE NUMERIC USING "Opening_Weekend_Gross"::NUMERIC,
+    ALTER COLUMN "Worldwide_Gross" SET DATA TYPE NUMERIC USING "Worldwide_Gross"::NUMERIC"""
+
+REPLACE_MOVIE_DATA = replace_table("movie_data")
+
+DROP_ACTOR_DATA_BUILD = "DROP TABLE IF EXISTS public.actor_data_build"
+
+# The actor columns are listed, as the written index column (and the incremental load's row hash) would keep
+# SELECT DISTINCT from dropping duplicate actors.
+ACTOR_DATA_MERGE = """
+WITH cte_actor_data AS (
+    SELECT
+        add2."IMDb_ID",
+        add2."TMDb_ID",
+        add2."Gender",
+        add2."Birthday",
+        add2."Movie_Credits",
+        nidd."names" AS actor
+    FROM general.actor_data_df AS add2
+    JOIN general.name_id_df AS nidd
+     ON add2."IMDb_ID" = nidd.imdb_ids
+)
+(SELECT DISTINCT * FROM cte_actor_data)"""
+
+CREATE_ACTOR_DATA = "CREATE TABLE public.actor_data_build AS" + ACTOR_DATA_MERGE
+
+REPLACE_ACTOR_DATA = replace_table("actor_data")
+
+# DuckDB runs the same merges over views of the artifacts, making the column changes of ALTER_MOVIE_DATA_TYPES in
+# the final select.
+DUCKDB_MOVIE_DATA_QUERY = MOVIE_DATA_MERGE + """
+SELECT
+    * EXCLUDE ("Alternative_Titles", "Type")
+      REPLACE (
+        CAST("Runtime" AS INTEGER) AS "Runtime",
+        CAST("Genre" AS TEXT[]) AS "Genre",
+        CAST("Writer" AS TEXT[]) AS "Writer",
+        CAST("Actors" AS TEXT[]) AS "Actors",
+        CAST("Production" AS TEXT[]) AS "Production",
+        CAST("Language" AS TEXT[]) AS "Language",
+        CAST("Country" AS TEXT[]) AS "Country",
+        CAST("imdbVotes" AS INTEGER) AS "imdbVotes",
+        CAST("imdbRating" AS NUMERIC) AS "imdbRating",
+        CAST("Keyword_List" AS TEXT[]) AS "Keyword_List",
+        CAST("Opening_Weekend_Gross" AS NUMERIC) AS "Opening_Weekend_Gross",
+        CAST("Worldwide_Gross" AS NUMERIC) AS "Worldwide_Gross"
+      ),
+    len("Alternative_Titles") AS alternative_titles
+FROM cte_merged_data"""
+
+DUCKDB_ACTOR_DATA_QUERY = ACTOR_DATA_MERGE
+
+# The award tables' (pre-db column, post-db column) pairs. The renames are the ones database_queries.ipynb made to the
+# general tables; the index column is left out, and orders the rows.
+AWARD_TABLE_COLUMNS = {
+    "grammy_awards_df_data": [("ceremony", "ceremony"), ("awards_year", "awards_year"), ("category", "category"),
+                              ("nominee", "nominee"), ("artist", "artist"), ("workers", "workers"),
+                              ("winner", "winner")],
+    "oscar_awards_df_data": [("year_film", "film_year"), ("year_ceremony", "ceremony_year"), ("ceremony", "ceremony"),
+                             ("category", "category"), ("name", "nominee"), ("film", "film"), ("winner", "winner")],
+    "gg_awards_df_data": [("year_film", "film_year"), ("year_award", "awards_year"), ("ceremony", "ceremony"),
+                          ("category", "category"), ("nominee", "nominee"), ("film", "film"), ("win", "winner")],
+}
+
+
+def award_table_query(table_name):
+    """A query for the award table with its post-db column names, which both backends run."""
+    columns = ",\n    ".join(f'"{column}" AS "{renamed}"' for column, renamed in AWARD_TABLE_COLUMNS[table_name])
+    return f"""
+SELECT
+    {columns}
+FROM general.{table_name}
+ORDER BY "index\""""
+
+
+# The soundtrack credits of the movies in updated_omdb_df_data. The columns are listed to leave out the index column
+# and the incremental load's row hash, which the DuckDB views of the artifacts don't have.
+JOINED_SOUNDTRACK_QUERY = """
+SELECT
+    stdd.song_title,
+    stdd.artist_imdb_id,
+    stdd.artist_name,
+    stdd."Performed by",
+    stdd."Written by",
+    stdd."Arranged by",
+    stdd."imdb_movie_ID"
+FROM general.additional_soundtrack_df_data AS stdd
+WHERE EXISTS (SELECT 1 FROM general.updated_omdb_df_data AS odd WHERE odd."imdbID" = stdd."imdb_movie_ID")"""
+
+
+def build_table_steps(table_name, query):
+    """The steps that build public.table_name from the query in a build table and swap it in."""
+    return [
+        TransformStep(f"drop_{table_name}_build", f"DROP TABLE IF EXISTS public.{table_name}_build", explain=False),
+        TransformStep(f"create_{table_name}", f"CREATE TABLE public.{table_name}_build AS" + query, explain=True),
+        TransformStep(f"replace_{table_name}", replace_table(table_name), explain=False),
+    ]
+
+
+TRANSFORM_STEPS = [
+    TransformStep("create_join_key_indexes", CREATE_JOIN_KEY_INDEXES, explain=False),
+    TransformStep("drop_movie_data_build", DROP_MOVIE_DATA_BUILD, explain=False),
+    TransformStep("create_movie_data", CREATE_MOVIE_DATA, explain=True),
+    TransformStep("alter_movie_data_types", ALTER_MOVIE_DATA_TYPES, explain=False),
+    TransformStep("replace_movie_data", REPLACE_MOVIE_DATA, explain=False),
+    TransformStep("drop_actor_data_build", DROP_ACTOR_DATA_BUILD, explain=False),
+    TransformStep("create_actor_data", CREATE_ACTOR_DATA, explain=True),
+    TransformStep("replace_actor_data", REPLACE_ACTOR_DATA, explain=False),
+]
+for award_table in AWARD_TABLE_COLUMNS:
+    TRANSFORM_STEPS += build_table_steps(award_table, award_table_query(award_table))
+TRANSFORM_STEPS += build_table_steps("joined_soundtrack_df_data", JOINED_SOUNDTRACK_QUERY)
+
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("pandas")
+
+import api_client
+import fake_api_server
+import omdb_api_functions
+import request_quota
+import work_queue
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def fixtures():
+    return fake_api_server.generate_fixtures(actor_count=20, movies_per_actor=3)
+
+
+@pytest.fixture
+def omdb_client(tmp_path, monkeypatch):
+    """Run the OMDb passes in tmp_path, one request at a time, without the response cache, so every lookup
+       reaches the server."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(omdb_api_functions.omdb_client, "cache", None)
+    monkeypatch.setattr(omdb_api_functions.omdb_client, "max_workers", 1)
+    return omdb_api_functions.omdb_client
+
+
+def use_omdb_quota(monkeypatch, path):
+    monkeypatch.setattr(omdb_api_functions, "omdb_quota",
+                        request_quota.DailyQuota(path, daily_limit=omdb_api_functions.OMDB_DAILY_REQUEST_LIMIT))
+
+
+def test_rate_limited_requests_back_off_for_retry_after_and_succeed(fixtures):
+    tmdb_ids = [movie["tmdb_id"] for movie in fixtures["catalogue"]["movies"][:6]]
+    with fake_api_server.start_fake_server(fixtures, rate_limits={"tmdb": 2}) as server:
+        client = api_client.APIClient(f'{server.url}/tmdb/3', rate_limit=100, max_workers=4)
+        started = time.monotonic()
+        responses = client.map(lambda tmdb_id: client.get(f'/movie/{tmdb_id}'), tmdb_ids)
+        seconds = time.monotonic() - started
+        stats = server.stats()
+
+    assert [response.json()["id"] for response in responses] == tmdb_ids
+    assert stats["by_status"][200] == len(tmdb_ids)
+    assert stats["by_status"][429] > 0
+    # The server asks for a one second wait before each retry.
+    assert seconds >= 1
+
+
+def test_omdb_request_limit_stops_the_run_and_a_later_run_resumes(fixtures, omdb_client, monkeypatch):
+    imdb_ids = [movie["imdb_id"] for movie in fixtures["catalogue"]["movies"][:6]]
+    work_queue.WorkQueue("omdb_by_id").add(imdb_ids)
+
+    use_omdb_quota(monkeypatch, "first_day_quota.sqlite")
+    with fake_api_server.start_fake_server(fixtures, omdb_daily_limit=3) as server:
+        monkeypatch.setattr(omdb_client, "base_url", f'{server.url}/omdb/')
+        omdb_api_functions.retrieve_omdb_by_id_shard(0, 1)
+
+    # The fourth request was told the limit was reached: the key is spent and the rest of the queue waits.
+    id_queue = work_queue.WorkQueue("omdb_by_id")
+    assert id_queue.status_counts() == {work_queue.DONE: 3, work_queue.PENDING: 3}
+    assert omdb_api_functions.omdb_quota.remaining(omdb_api_functions.omdb_api_keys()[0]) == 0
+
+    # The next day's run only requests the movies still pending.
+    use_omdb_quota(monkeypatch, "second_day_quota.sqlite")
+    with fake_api_server.start_fake_server(fixtures) as server:
+        monkeypatch.setattr(omdb_client, "base_url", f'{server.url}/omdb/')
+        omdb_api_functions.retrieve_omdb_by_id_shard(0, 1)
+        stats = server.stats()
+
+    assert stats["by_service"] == {"omdb": 3}
+    assert id_queue.status_counts() == {work_queue.DONE: 6}
+    assert [movie["imdbID"] for movie in id_queue.results()] == imdb_ids
+
+
+def test_collection_stage_runs_against_the_fake_server(tmp_path):
+    pytest.importorskip("scrapy")
+    pytest.importorskip("pyarrow")
+    # The crawls run on Twisted's reactor, which can't be restarted, so the stage runs in its own interpreter.
+    script = ("import sys, benchmarks, fake_api_server\n"
+              "benchmarks.run_collection_against_fake_server(fake_api_server.generate_fixtures(20, 3), sys.argv[1])")
+    subprocess.run([sys.executable, "-c", script, str(tmp_path)], cwd=REPOSITORY_ROOT, check=True,
+                   capture_output=True, timeout=600)
+
+    for file_name in ["data_files/actor_names_and_ids.json", "data_files/omdb_movie_data_from_all_ids.parquet",
+                      "data_files/additional_tmdb_movie_data_list.parquet",
+                      "data_files/cast_crew_tmdb_movie_data_list.parquet", "additional_box_office_data_list.json",
+                      "additional_soundtrack_credits_data_list.json"]:
+        assert (tmp_path / file_name).exists(), file_name
@@ -0,0 +1,17 @@
+import pytest
+
+pytest.importorskip("lxml")
+
+import html_parser
+
+
+def test_grammy_html_docs_are_paired_with_years_in_file_name_order(tmp_path, monkeypatch, capsys):
+    for file_name in ["b.html", "c.html", "a.html"]:
+        (tmp_path / file_name).write_text("<html></html>", encoding="utf-8")
+    monkeypatch.setattr(html_parser, "GRAMMY_HTML_DIR", str(tmp_path))
+
+    docs_and_years = html_parser.grammy_html_docs_and_years()
+
+    assert docs_and_years == [(f"{tmp_path}/a.html", 2023), (f"{tmp_path}/b.html", 2022),
+                              (f"{tmp_path}/c.html", 2021)]
+    assert capsys.readouterr().out == ""
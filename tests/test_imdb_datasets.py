@@ -0,0 +1,32 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+import imdb_datasets
+
+
+def imdb_title(**fields):
+    title = {"titleType": "movie", "primaryTitle": "Inception", "startYear": "2010", "runtimeMinutes": "148",
+             "genres": "Action,Sci-Fi", "averageRating": "8.8", "numVotes": "2500000"}
+    return pd.Series({**title, **fields})
+
+
+def test_to_omdb_fields_formats_the_fields_the_way_omdb_does():
+    assert imdb_datasets.to_omdb_fields(imdb_title()) == {
+        "Type": "movie", "Title": "Inception", "Year": "2010", "Genre": "Action, Sci-Fi", "Runtime": "148 min",
+        "imdbRating": "8.8", "imdbVotes": "2,500,000"}
+
+
+@pytest.mark.parametrize("start_year", [2010, 2010.0])
+def test_to_omdb_fields_gives_the_year_as_a_string(start_year):
+    assert imdb_datasets.to_omdb_fields(imdb_title(startYear=start_year))["Year"] == "2010"
+
+
+def test_to_omdb_fields_leaves_missing_values_unfilled():
+    # The store reads missing values ("\N" in the datasets) as NaN.
+    missing = dict.fromkeys(["primaryTitle", "startYear", "runtimeMinutes", "genres", "averageRating", "numVotes"],
+                            float("nan"))
+    omdb_fields = imdb_datasets.to_omdb_fields(imdb_title(**missing))
+
+    assert omdb_fields == {"Type": "movie", "Title": None, "Year": None, "Genre": None, "Runtime": None,
+                           "imdbRating": None, "imdbVotes": None}
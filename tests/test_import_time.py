@@ -0,0 +1,18 @@
+import subprocess
+
+import pytest
+
+import benchmarks
+
+
+# benchmarks itself is imported by the tests, and by a fresh interpreter for each fake server collection run.
+@pytest.mark.parametrize("module_name", benchmarks.import_time_module_names() + ["benchmarks"])
+def test_module_imports_within_its_budget(module_name):
+    try:
+        seconds = benchmarks.module_import_seconds(module_name)
+    except subprocess.CalledProcessError as e:
+        if "ModuleNotFoundError" in e.stderr:
+            pytest.skip(f"{module_name} needs a dependency that isn't installed: {e.stderr.splitlines()[-1]}")
+        raise
+
+    assert seconds <= benchmarks.import_time_budget(module_name)
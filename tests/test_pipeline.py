@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+import pipeline
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+@pytest.fixture
+def source_and_cleaner(tmp_path, monkeypatch):
+    """A source stage and a stage that reads its output, in tmp_path. Their function does nothing, so a stage
+       that runs only succeeds if its outputs are already there."""
+    monkeypatch.chdir(tmp_path)
+    stages = [pipeline.Stage("collect", "pipeline:producers", outputs=["collected.json"], source=True),
+              pipeline.Stage("clean", "pipeline:producers", inputs=["collected.json"], outputs=["cleaned.json"])]
+    monkeypatch.setattr(pipeline, "STAGES", stages)
+    monkeypatch.setattr(pipeline, "STAGES_BY_NAME", {stage.name: stage for stage in stages})
+    write_file("cleaned.json", "[]")
+
+
+def test_a_source_stage_isnt_run_for_its_downstream_stages(source_and_cleaner, capsys):
+    write_file("collected.json", "[1]")
+
+    pipeline.run_pipeline(["clean"])
+
+    output = capsys.readouterr().out
+    assert "collect: using its existing outputs" in output
+    assert "collect: running" not in output
+    assert "clean: running" in output
+
+
+def test_a_source_stage_runs_when_its_outputs_are_missing(source_and_cleaner, capsys):
+    # The stage's function doesn't write collected.json, so the run fails.
+    with pytest.raises(RuntimeError):
+        pipeline.run_pipeline(["clean"])
+
+    assert "collect: running" in capsys.readouterr().out
+
+
+def test_a_source_stage_runs_when_forced(source_and_cleaner, capsys):
+    write_file("collected.json", "[1]")
+
+    pipeline.run_pipeline(["collect"], force=True)
+
+    assert "collect: running" in capsys.readouterr().out
+
+
+def test_a_new_imdb_title_store_reruns_the_omdb_cleaning(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stage = pipeline.STAGES_BY_NAME["clean_omdb_movie_data"]
+    for path in stage.inputs:
+        write_file(path, "[]")
+    hasher = pipeline.FileHasher(str(tmp_path / "file_hashes.json"))
+
+    keys = [pipeline.stage_key(stage, hasher, {})]
+    for store in ["first store", "the refreshed store"]:
+        write_file("data_files/imdb_titles.parquet", store)
+        keys.append(pipeline.stage_key(stage, hasher, {}))
+
+    # Each key is a different cache entry, so the stage reruns instead of restoring the earlier backfill.
+    assert len(set(keys)) == 3
+
+
+def test_switching_the_sql_backend_reruns_the_database_stages(tmp_path, monkeypatch):
+    stage = pipeline.STAGES_BY_NAME["load_sql_tables"]
+    hasher = pipeline.FileHasher(str(tmp_path / "file_hashes.json"))
+    upstream_keys = {"run_sql_transforms": "0123456789abcdef0123"}
+
+    keys = []
+    for backend in ["postgres", "duckdb"]:
+        monkeypatch.setenv("SQL_BACKEND", backend)
+        keys.append(pipeline.stage_key(stage, hasher, upstream_keys))
+
+    assert keys[0] != keys[1]
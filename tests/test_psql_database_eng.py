@@ -0,0 +1,271 @@
+import os
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+sqlalchemy = pytest.importorskip("sqlalchemy")
+pytest.importorskip("psycopg2")
+
+import psql_database_eng
+from sqlalchemy.dialects import postgresql
+
+# A scratch schema in this database is created for the tests and dropped afterwards.
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL", "postgresql+psycopg2://postgres@localhost:5432/postgres")
+TEST_SCHEMA = "copy_load_test"
+
+
+@pytest.fixture(scope="module")
+def sql_engine():
+    engine = sqlalchemy.create_engine(TEST_DATABASE_URL)
+    try:
+        with engine.begin() as connection:
+            connection.execute(sqlalchemy.text(f"CREATE SCHEMA IF NOT EXISTS {TEST_SCHEMA}"))
+    except sqlalchemy.exc.OperationalError:
+        pytest.skip(f"No PostgreSQL server at {TEST_DATABASE_URL}; set TEST_DATABASE_URL to use another.")
+    yield engine
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(f"DROP SCHEMA {TEST_SCHEMA} CASCADE"))
+    engine.dispose()
+
+
+def movie_dataframe():
+    """Rows with the values a CSV COPY has to escape: quotes, commas, newlines, backslashes, braces, empty strings
+       (which must stay distinct from NULL), NULLs inside arrays and nested JSON."""
+    return pd.DataFrame({
+        "imdbID": ["tt0000001", "tt0000002", "tt0000003"],
+        "Title": ['The "Quoted", Title', "Line one\nLine two\r\nLine three", None],
+        "Plot": ["", "C:\\films\\{draft}", None],
+        "Genre": [["Drama", 'Sci "Fi"', "Comma, Separated"], [], None],
+        "Writer": [["Back\\slash", None, "{Braced}"], ["Multi\nline"], None],
+        "Ratings": [[{"Source": "IMDb", "Value": "7.9/10"}], [], None],
+        "Awards": [{"wins": 3, "note": 'said "bravo"\n'}, None, {}],
+        "Runtime": [148.0, None, 95.5],
+        "imdbVotes": [2500000, 12, 0],
+        "Released": pd.to_datetime(["2010-07-16", None, "1999-03-31"]),
+    }).set_index("imdbID")
+
+
+def read_table(sql_engine, table_name):
+    return pd.read_sql(f'SELECT * FROM {TEST_SCHEMA}.{table_name} ORDER BY "imdbID"', sql_engine)
+
+
+def test_copy_matches_to_sql(sql_engine):
+    dataframe = movie_dataframe()
+    dataframe.to_sql("movies_to_sql", sql_engine, schema=TEST_SCHEMA, dtype={
+        "Genre": postgresql.ARRAY(sqlalchemy.Text), "Writer": postgresql.ARRAY(sqlalchemy.Text),
+        "Ratings": postgresql.JSONB, "Awards": postgresql.JSONB})
+
+    connection = sql_engine.raw_connection()
+    try:
+        rows, _ = psql_database_eng.copy_dataframe_to_table(connection, dataframe, "movies_copy", TEST_SCHEMA)
+    finally:
+        connection.close()
+
+    assert rows == len(dataframe)
+    pd.testing.assert_frame_equal(read_table(sql_engine, "movies_copy"), read_table(sql_engine, "movies_to_sql"))
+    assert read_table(sql_engine, "movies_copy").set_index("imdbID").loc["tt0000001", "Plot"] == ""
+
+
+def test_copy_csv_stream_reads_the_same_in_any_read_size():
+    rows = list(psql_database_eng.copy_rows(movie_dataframe().reset_index(), {
+        "imdbID": "TEXT", "Title": "TEXT", "Plot": "TEXT", "Genre": "TEXT[]", "Writer": "TEXT[]", "Ratings": "JSONB",
+        "Awards": "JSONB", "Runtime": "DOUBLE PRECISION", "imdbVotes": "BIGINT", "Released": "TIMESTAMP"})) * 5
+    whole = psql_database_eng.CopyCsvStream(rows).read()
+
+    # Small batches and reads make the reads end part way through rows and their embedded newlines.
+    stream = psql_database_eng.CopyCsvStream(rows, batch_size=2)
+    chunks = iter(lambda: stream.read(7), "")
+
+    assert "".join(chunks) == whole
+    assert whole.count(psql_database_eng.COPY_NULL) == 5 * 8
+
+
+def test_read_table_in_chunks_doesnt_hold_back_all_null_columns(sql_engine, tmp_path):
+    import utils
+
+    dataframe = pd.DataFrame({"imdbID": ["tt1", "tt2", "tt3"], "Title": [None, None, None],
+                              "Genre": [None, None, None], "Runtime": [None, None, None]})
+    dataframe.to_sql("movies_all_null", sql_engine, schema=TEST_SCHEMA, index=False, dtype={
+        "Title": sqlalchemy.Text, "Genre": postgresql.ARRAY(sqlalchemy.Text), "Runtime": sqlalchemy.Integer})
+    artifact = str(tmp_path / "movies_all_null.arrow")
+
+    rows = psql_database_eng.read_table_in_chunks("movies_all_null", artifact, {"Runtime": "Int64"}, chunksize=1,
+                                                  schema=TEST_SCHEMA, sql_engine=sql_engine)
+
+    assert rows == 3
+    table = utils.load_table(artifact)
+    assert [str(field.type) for field in table.schema] == ["string", "string", "list<item: string>", "int64"]
+    assert utils.load_dataframe(artifact)["Title"].isna().all()
+
+
+def copy_dataframe(sql_engine, dataframe, table_name):
+    connection = sql_engine.raw_connection()
+    try:
+        return psql_database_eng.copy_dataframe_to_table(connection, dataframe, table_name, TEST_SCHEMA)
+    finally:
+        connection.close()
+
+
+def test_reloading_a_table_keeps_the_views_on_it(sql_engine):
+    dataframe = movie_dataframe()
+    copy_dataframe(sql_engine, dataframe, "movies_viewed")
+    with sql_engine.begin() as connection:
+        connection.execute(sqlalchemy.text(f'CREATE VIEW {TEST_SCHEMA}.movie_titles AS '
+                                           f'SELECT "imdbID", "Title" FROM {TEST_SCHEMA}.movies_viewed'))
+
+    copy_dataframe(sql_engine, dataframe.iloc[:2], "movies_viewed")
+
+    assert read_table(sql_engine, "movie_titles")["imdbID"].tolist() == ["tt0000001", "tt0000002"]
+
+
+def test_replacing_a_transformed_table_keeps_the_views_on_it(sql_engine):
+    import sql_transforms
+
+    table_name = "sql_transforms_replace_test"
+    with sql_engine.begin() as connection:
+        for step in range(2):
+            connection.execute(sqlalchemy.text(
+                f"CREATE TABLE public.{table_name}_build AS SELECT g AS step FROM generate_series({step}, {step}) g"))
+            connection.exec_driver_sql(sql_transforms.replace_table(table_name))
+            if step == 0:
+                connection.execute(sqlalchemy.text(
+                    f"CREATE VIEW {TEST_SCHEMA}.replaced_steps AS SELECT step FROM public.{table_name}"))
+    try:
+        with sql_engine.connect() as connection:
+            steps = connection.execute(sqlalchemy.text(f"SELECT step FROM {TEST_SCHEMA}.replaced_steps")).scalars()
+            assert list(steps) == [1]
+            assert connection.execute(sqlalchemy.text(f"SELECT to_regclass('public.{table_name}_build')")).scalar() \
+                is None
+    finally:
+        with sql_engine.begin() as connection:
+            connection.execute(sqlalchemy.text(f"DROP TABLE public.{table_name} CASCADE"))
+
+
+def test_upsert_reports_the_rows_with_duplicate_keys(sql_engine, capsys):
+    dataframe = pd.DataFrame({"imdbID": ["tt1", "tt2", "tt1"], "Title": ["First", "Second", "First, again"]})
+    connection = sql_engine.raw_connection()
+    try:
+        rows, changes = psql_database_eng.upsert_dataframe_to_table(connection, dataframe.set_index("imdbID"),
+                                                                    "updated_omdb_df_data", TEST_SCHEMA)
+    finally:
+        connection.close()
+
+    assert rows == 2 and changes["inserted"] == 2
+    assert "1 rows with the same imdbID" in capsys.readouterr().out
+    assert read_table(sql_engine, "updated_omdb_df_data")["Title"].tolist() == ["First, again", "Second"]
+
+
+def upsert_dataframe(sql_engine, dataframe, table_name):
+    connection = sql_engine.raw_connection()
+    try:
+        return psql_database_eng.upsert_dataframe_to_table(connection, dataframe, table_name, TEST_SCHEMA)
+    finally:
+        connection.close()
+
+
+def test_upsert_skips_and_reports_the_rows_without_a_key(sql_engine, capsys):
+    dataframe = pd.DataFrame({"IMDb_ID": ["tt1", None, None], "Worldwide_Gross": [100.0, 200.0, 300.0]})
+
+    rows, changes = upsert_dataframe(sql_engine, dataframe.set_index("IMDb_ID"), "additional_box_office_df_data")
+
+    assert rows == 1 and changes["inserted"] == 1
+    assert "2 rows without a IMDb_ID" in capsys.readouterr().out
+    with sql_engine.connect() as connection:
+        stored = connection.execute(sqlalchemy.text(
+            f'SELECT "IMDb_ID" FROM {TEST_SCHEMA}.additional_box_office_df_data')).scalars()
+        assert list(stored) == ["tt1"]
+
+
+@pytest.mark.parametrize("table_name", ["joined_tmdb_df_data", "gg_awards_df_data"], ids=["keyed", "unkeyed"])
+def test_upsert_updates_the_index_of_rows_that_moved(sql_engine, table_name):
+    dataframe = pd.DataFrame({"TMDb_ID": [1, 2, 3], "Title": ["One", "Two", "Three"]})
+    upsert_dataframe(sql_engine, dataframe, table_name)
+
+    _, changes = upsert_dataframe(sql_engine, dataframe.iloc[::-1].reset_index(drop=True), table_name)
+
+    assert changes["updated"] == 2
+    with sql_engine.connect() as connection:
+        stored = connection.execute(sqlalchemy.text(
+            f'SELECT "index", "TMDb_ID" FROM {TEST_SCHEMA}.{table_name} ORDER BY "index"')).all()
+    assert [tuple(row) for row in stored] == [(0, 3), (1, 2), (2, 1)]
+
+
+# The award columns the post-db cleaning and preprocessing read.
+POST_DB_AWARD_COLUMNS = {
+    "grammy_awards_df_data": ["ceremony", "awards_year", "category", "nominee", "artist", "workers", "winner"],
+    "oscar_awards_df_data": ["film_year", "ceremony_year", "ceremony", "category", "nominee", "film", "winner"],
+    "gg_awards_df_data": ["film_year", "awards_year", "ceremony", "category", "nominee", "film", "winner"],
+}
+
+
+def pre_db_award_dataframe(table_name):
+    """Two rows of the pre-db award table, in the reverse of their index order."""
+    import sql_transforms
+
+    columns = [column for column, _ in sql_transforms.AWARD_TABLE_COLUMNS[table_name]]
+    return pd.DataFrame({column: [f"{column} 2", f"{column} 1"] for column in columns}, index=[1, 0])
+
+
+@pytest.mark.parametrize("table_name", list(POST_DB_AWARD_COLUMNS))
+def test_the_award_tables_have_their_post_db_columns_in_postgres(sql_engine, table_name):
+    import sql_transforms
+
+    copy_dataframe(sql_engine, pre_db_award_dataframe(table_name), table_name)
+
+    query = sql_transforms.award_table_query(table_name).replace("general.", f"{TEST_SCHEMA}.")
+    award_table = pd.read_sql(query, sql_engine)
+
+    assert award_table.columns.tolist() == POST_DB_AWARD_COLUMNS[table_name]
+    assert award_table["category"].tolist() == ["category 1", "category 2"]
+
+
+@pytest.mark.parametrize("table_name", list(POST_DB_AWARD_COLUMNS))
+def test_the_award_tables_have_their_post_db_columns_in_duckdb(table_name):
+    duckdb = pytest.importorskip("duckdb")
+    import sql_transforms
+
+    connection = duckdb.connect()
+    try:
+        connection.execute("CREATE SCHEMA general")
+        connection.register("award_artifact", pre_db_award_dataframe(table_name).reset_index())
+        connection.execute(f"CREATE VIEW general.{table_name} AS SELECT * FROM award_artifact")
+        award_table = connection.execute(sql_transforms.award_table_query(table_name)).df()
+    finally:
+        connection.close()
+
+    assert award_table.columns.tolist() == POST_DB_AWARD_COLUMNS[table_name]
+    assert award_table["category"].tolist() == ["category 1", "category 2"]
+
+
+def test_both_backends_build_the_same_joined_soundtrack_table(sql_engine):
+    duckdb = pytest.importorskip("duckdb")
+    import sql_transforms
+
+    soundtrack = pd.DataFrame({
+        "song_title": ["Theme", "Theme", "Unreleased"], "artist_imdb_id": ["nm1", "", "nm3"],
+        "artist_name": ["First Artist", "Second Artist", "Third Artist"], "Performed by": [True, False, True],
+        "Written by": [False, True, False], "Arranged by": [False, False, False],
+        "imdb_movie_ID": ["tt0000001", "tt0000001", "tt9999999"]})
+    movies = pd.DataFrame({"imdbID": ["tt0000001", "tt0000002"], "Title": ["One", "Two"]})
+
+    copy_dataframe(sql_engine, soundtrack, "additional_soundtrack_df_data")
+    copy_dataframe(sql_engine, movies.set_index("imdbID"), "updated_omdb_df_data")
+    query = sql_transforms.JOINED_SOUNDTRACK_QUERY.replace("general.", f"{TEST_SCHEMA}.")
+    postgres_table = pd.read_sql(query, sql_engine)
+
+    connection = duckdb.connect()
+    try:
+        connection.execute("CREATE SCHEMA general")
+        connection.register("soundtrack_artifact", soundtrack)
+        connection.register("movies_artifact", movies)
+        connection.execute("CREATE VIEW general.additional_soundtrack_df_data AS SELECT * FROM soundtrack_artifact")
+        connection.execute("CREATE VIEW general.updated_omdb_df_data AS SELECT * FROM movies_artifact")
+        duckdb_table = connection.execute(sql_transforms.JOINED_SOUNDTRACK_QUERY).df()
+    finally:
+        connection.close()
+
+    # The credits of a movie that isn't in updated_omdb_df_data are left out by both.
+    expected = soundtrack.iloc[:2]
+    for table in [postgres_table, duckdb_table]:
+        pd.testing.assert_frame_equal(table.sort_values("artist_name", ignore_index=True), expected,
+                                      check_dtype=False)
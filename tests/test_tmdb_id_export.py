@@ -0,0 +1,106 @@
+import gzip
+import json
+import os
+import time
+
+import pytest
+
+import tmdb_id_export
+
+FIXTURE_EXPORT = [
+    {"adult": False, "id": 101, "original_title": "Shared  Title", "popularity": 3.5, "video": False},
+    {"adult": False, "id": 102, "original_title": "Shared Title", "popularity": 12.0, "video": False},
+    # More popular, but a video release: the theatrical one still wins.
+    {"adult": False, "id": 103, "original_title": "shared title", "popularity": 50.0, "video": True},
+    {"adult": False, "id": 201, "original_title": "Only Title", "popularity": 1.0, "video": False},
+    {"adult": True, "id": 301, "original_title": "Adult Title", "popularity": 99.0, "video": False},
+    {"adult": False, "id": 401, "original_title": "", "popularity": 1.0, "video": False},
+]
+
+
+def write_export(path, movies):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for movie in movies:
+            f.write(json.dumps(movie) + "\n")
+
+
+def build_index(tmp_path):
+    export_path = str(tmp_path / "movie_ids.json.gz")
+    index_path = str(tmp_path / "title_index.sqlite")
+    write_export(export_path, FIXTURE_EXPORT)
+    tmdb_id_export.build_tmdb_title_index(export_path, index_path, batch_size=2)
+    return export_path, index_path
+
+
+def test_lookup_hits_and_misses(tmp_path):
+    _, index_path = build_index(tmp_path)
+    index = tmdb_id_export.TMDbTitleIndex(index_path)
+
+    assert index.lookup("Only Title") == 201
+    assert index.lookup("  ONLY   title ") == 201
+    assert index.lookup("Missing Title") is None
+    assert index.lookup("Adult Title") is None
+    assert (index.hits, index.misses) == (2, 2)
+
+
+def test_lookup_prefers_the_most_popular_non_video_release(tmp_path):
+    _, index_path = build_index(tmp_path)
+
+    assert tmdb_id_export.TMDbTitleIndex(index_path).lookup("Shared Title") == 102
+
+
+def test_lookup_misses_without_an_index(tmp_path):
+    index = tmdb_id_export.TMDbTitleIndex(str(tmp_path / "missing.sqlite"))
+
+    assert index.lookup("Only Title") is None
+    assert index.misses == 1
+
+
+def test_ensure_builds_a_missing_index_from_a_fresh_export(tmp_path, monkeypatch):
+    export_path = str(tmp_path / "movie_ids.json.gz")
+    index_path = str(tmp_path / "title_index.sqlite")
+    write_export(export_path, FIXTURE_EXPORT)
+    monkeypatch.setattr(tmdb_id_export, "download_tmdb_movie_id_export",
+                        lambda *args, **kwargs: pytest.fail("the export is fresh"))
+
+    tmdb_id_export.ensure_tmdb_title_index(export_path, index_path)
+
+    assert tmdb_id_export.TMDbTitleIndex(index_path).lookup("Only Title") == 201
+
+
+def test_ensure_downloads_a_stale_export_and_rebuilds(tmp_path, monkeypatch):
+    export_path, index_path = build_index(tmp_path)
+    stale = time.time() - 2 * tmdb_id_export.INDEX_MAX_AGE
+    os.utime(export_path, (stale, stale))
+    os.utime(index_path, (stale, stale))
+    monkeypatch.setattr(tmdb_id_export, "download_tmdb_movie_id_export",
+                        lambda path: write_export(path, [dict(FIXTURE_EXPORT[3], id=202)]))
+
+    tmdb_id_export.ensure_tmdb_title_index(export_path, index_path)
+
+    assert tmdb_id_export.TMDbTitleIndex(index_path).lookup("Only Title") == 202
+
+
+def test_ensure_indexes_the_old_export_when_the_download_fails(tmp_path, monkeypatch):
+    export_path, index_path = build_index(tmp_path)
+    os.remove(index_path)
+    stale = time.time() - 2 * tmdb_id_export.INDEX_MAX_AGE
+    os.utime(export_path, (stale, stale))
+
+    def failing_download(path):
+        raise ConnectionError("offline")
+    monkeypatch.setattr(tmdb_id_export, "download_tmdb_movie_id_export", failing_download)
+
+    tmdb_id_export.ensure_tmdb_title_index(export_path, index_path)
+
+    assert tmdb_id_export.TMDbTitleIndex(index_path).lookup("Only Title") == 201
+
+
+def test_ensure_skips_the_index_without_any_export(tmp_path, monkeypatch):
+    def failing_download(path):
+        raise ConnectionError("offline")
+    monkeypatch.setattr(tmdb_id_export, "download_tmdb_movie_id_export", failing_download)
+
+    tmdb_id_export.ensure_tmdb_title_index(str(tmp_path / "movie_ids.json.gz"), str(tmp_path / "index.sqlite"))
+
+    assert not os.path.exists(tmp_path / "index.sqlite")
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def records_path(tmp_path):
+    pytest.importorskip("pyarrow")
+    return str(tmp_path / "records.json")
+
+
+def test_records_round_trip_through_parquet(records_path):
+    records = [{"TMDb_ID": 1, "Keywords": [{"id": 7, "name": "drama"}], "Budget": None},
+               {"TMDb_ID": 2, "Keywords": [], "Budget": 1000000}]
+
+    utils.save_records(records_path, records)
+
+    assert utils.load_records(records_path) == records
+    assert utils.load_records(records_path, columns=["TMDb_ID"], filters=[("Budget", ">", 0)]) == [{"TMDb_ID": 2}]
+
+
+@pytest.mark.parametrize("records", [[], [{"TMDb_ID": 1, "Ratings": {}}], [{"Year": "2001"}, {"Year": ["2001"]}]],
+                         ids=["no records", "empty struct", "mixed types"])
+def test_records_without_a_parquet_schema_are_saved_as_json(records_path, records):
+    utils.save_records(records_path, records)
+
+    assert utils.load_records(records_path) == records
+    assert not os.path.exists(utils.parquet_path(records_path))
+
+
+def test_a_json_fallback_replaces_an_earlier_parquet_file(records_path):
+    utils.save_records(records_path, [{"TMDb_ID": 1}])
+    utils.save_records(records_path, [])
+
+    assert utils.load_records(records_path) == []
+
+
+def write_in_chunks(path, chunks, **writer_options):
+    with utils.DataFrameChunkWriter(path, **writer_options) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+            yield writer
+
+
+def test_chunk_writer_takes_all_null_columns_types_from_field_types(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pd = pytest.importorskip("pandas")
+    path = str(tmp_path / "table.arrow")
+    chunks = [pd.DataFrame({"imdbID": ["tt1", "tt2"], "Plot": [None, None]}),
+              pd.DataFrame({"imdbID": ["tt3"], "Plot": ["Late plot"]})]
+
+    # The first chunk is written straight away rather than held back for Plot's type.
+    writers = write_in_chunks(path, chunks, field_types={"Plot": pa.string()})
+    pending = [len(writer.pending_tables) for writer in writers]
+
+    assert pending == [0, 0]
+    assert utils.load_dataframe(path)["Plot"].tolist() == [None, None, "Late plot"]
+
+
+def test_chunk_writer_holds_back_at_most_max_pending_rows(tmp_path):
+    pd = pytest.importorskip("pandas")
+    path = str(tmp_path / "table.arrow")
+    chunks = [pd.DataFrame({"imdbID": [f"tt{i}"], "Awards": [None]}) for i in range(3)]
+    chunks.append(pd.DataFrame({"imdbID": ["tt3"], "Awards": [{"wins": 3}]}))
+
+    pending = [len(writer.pending_tables) for writer in write_in_chunks(path, chunks, max_pending_rows=2)]
+
+    # Awards never had a type while chunks were held back, so it is stored as pickled values.
+    assert pending == [1, 0, 0, 0]
+    assert utils.load_dataframe(path)["Awards"].tolist() == [None, None, None, {"wins": 3}]
+
+
+def test_load_table_falls_back_to_the_legacy_pickle(tmp_path):
+    pytest.importorskip("pyarrow")
+    pd = pytest.importorskip("pandas")
+    path = str(tmp_path / "joined_tmdb_df_pre_db.arrow")
+    pd.DataFrame({"TMDb_ID": [1, 2], "Keyword_List": [["drama"], []]}).to_pickle(utils.legacy_pickle_path(path))
+
+    table = utils.load_table(path)
+
+    assert table.column_names == ["index", "TMDb_ID", "Keyword_List"]
+    assert table.column("Keyword_List").to_pylist() == [["drama"], []]
@@ -1,17 +1,39 @@
 """ This file contains the TMDb API data retrieval functions. """
 
 import utils
-import requests
 import pandas as pd
 import hidden
+import api_client
+import response_cache
+import work_queue
+import tmdb_id_export
+import threading
+from concurrent.futures import Future
+
+# TMDb allows roughly 50 requests per second per IP; stay comfortably under it.
+TMDB_BASE_URL = "https://api.themoviedb.org/3"
+TMDB_RATE_LIMIT = 40
+TMDB_MAX_WORKERS = 8
+
+# Search results change as TMDb's catalogue grows; movie and person records are far more stable.
+TMDB_CACHE_TTLS = {"*/search/*": 7 * response_cache.DAY, "*/find/*": 30 * response_cache.DAY}
+tmdb_response_cache = response_cache.ResponseCache(ttls=TMDB_CACHE_TTLS, default_ttl=90 * response_cache.DAY)
+
+# Shared client: one keep-alive connection pool, rate limit and response cache for every TMDb request.
+tmdb_client = api_client.APIClient(TMDB_BASE_URL, rate_limit=TMDB_RATE_LIMIT, max_workers=TMDB_MAX_WORKERS,
+                                   cache=tmdb_response_cache)
+
+
+def tmdb_get(path, params=None):
+    """Send a GET request to the TMDb API through the shared client and return the JSON body."""
+    params = dict(params or {}, api_key=hidden.secrets["tmdb"]["tmdb_api_key"])
+    response = tmdb_client.get(path, params=params)
+    return response.json()
 
 
 def find_actor(imdb_actor_id):
     """Find an actor's record in TMDb using their IMDb ID and extract."""
-    base_url = f'https://api.themoviedb.org/3/find/{imdb_actor_id}'
-    params = {"api_key": hidden.secrets["tmdb"]["tmdb_api_key"], "external_source": "imdb_id"}
-    response = requests.get(base_url, params=params)
-    data = response.json()
+    data = tmdb_get(f'/find/{imdb_actor_id}', params={"external_source": "imdb_id"})
     actor_info = data["person_results"]
     return actor_info
 
@@ -30,20 +52,14 @@ def get_actor_gender(actor_info):
 
 def get_actor_birthday(tmdb_actor_id):
     """Extract an actor's birthday from an actor_info JSON object."""
-    base_url = f'https://api.themoviedb.org/3/person/{tmdb_actor_id}'
-    params = {"api_key": hidden.secrets["tmdb"]["tmdb_api_key"]}
-    response = requests.get(base_url, params=params)
-    data = response.json()
+    data = tmdb_get(f'/person/{tmdb_actor_id}')
     actor_birthday = data.get("birthday")
     return actor_birthday
 
 
 def get_movie_credits(tmdb_actor_id):
     """Get an actor's movie credits using their TMDb ID."""
-    base_url = f'https://api.themoviedb.org/3/person/{tmdb_actor_id}/movie_credits'
-    params = {"api_key": hidden.secrets["tmdb"]["tmdb_api_key"]}
-    response = requests.get(base_url, params=params)
-    movie_credits = response.json()
+    movie_credits = tmdb_get(f'/person/{tmdb_actor_id}/movie_credits')
     return movie_credits
 
 
@@ -67,77 +83,48 @@ def get_tmdb_movie_ids_from_credits(movie_credits):
     return tmdb_movie_ids
 
 
-def get_imdb_movie_id(tmdb_movie_id):
-    """Get the external ids for a movie and extract the IMDb id."""
-    base_url = f'https://api.themoviedb.org/3/movie/{tmdb_movie_id}/external_ids'
-    params = {"api_key": hidden.secrets["tmdb"]["tmdb_api_key"]}
-    response = requests.get(base_url, params=params)
-    id_data = response.json()
-    imdb_id = id_data.get("imdb_id")
-    return imdb_id
-
-
-def get_release_dates(tmdb_movie_id):
-    """Get the release dates for a movie."""
-    base_url = f'https://api.themoviedb.org/3/movie/{tmdb_movie_id}/release_dates'
-    params = {"api_key": hidden.secrets["tmdb"]["tmdb_api_key"]}
-    response = requests.get(base_url, params=params)
-    data = response.json()
-    release_dates = data.get("results")
-    return release_dates
-
-
 def get_cast_and_crew(tmdb_movie_id):
     """Get the cast and crew for a movie."""
-    base_url = f'https://api.themoviedb.org/3/movie/{tmdb_movie_id}/credits'
-    params = {"api_key": hidden.secrets["tmdb"]["tmdb_api_key"]}
-    response = requests.get(base_url, params=params)
-    data = response.json()
+    data = tmdb_get(f'/movie/{tmdb_movie_id}/credits')
     cast = data.get("cast")
     crew = data.get("crew")
     return cast, crew
 
 
-def get_movie_budget(tmdb_movie_id):
-    """Get the budget for a movie."""
-    base_url = f'https://api.themoviedb.org/3/movie/{tmdb_movie_id}'
-    params = {"api_key": hidden.secrets["tmdb"]["tmdb_api_key"]}
-    response = requests.get(base_url, params=params)
-    data = response.json()
-    budget = data.get("budget")
-    return budget
-
-
-def get_movie_keywords(tmdb_movie_id):
-    """Get the keywords that have been added to a movie."""
-    base_url = f'https://api.themoviedb.org/3/movie/{tmdb_movie_id}/keywords'
-    params = {"api_key": hidden.secrets["tmdb"]["tmdb_api_key"]}
-    response = requests.get(base_url, params=params)
-    data = response.json()
-    keywords = data.get("keywords")
-    return keywords
-
-
-def get_alt_movie_titles(tmdb_movie_id):
-    """Get all the alternative titles for a movie."""
-    base_url = f'https://api.themoviedb.org/3/movie/{tmdb_movie_id}/alternative_titles'
-    params = {"api_key": hidden.secrets["tmdb"]["tmdb_api_key"]}
-    response = requests.get(base_url, params=params)
-    title_data = response.json()
-    alt_titles = []
-    if title_data.get("titles") is not None:
-        for title_dict in title_data.get("titles"):
-            alt_title = title_dict.get("title")
-            alt_titles.append(alt_title)
-    return alt_titles
+# Sub-resources fetched alongside the movie details, so one request replaces six.
+MOVIE_DETAILS_APPENDS = "external_ids,alternative_titles,release_dates,keywords,credits"
+
+
+def get_movie_details(tmdb_movie_id):
+    """Get a movie's details with its external ids, alternative titles, release dates, keywords and credits
+       appended to the same response."""
+    movie_details = tmdb_get(f'/movie/{tmdb_movie_id}', params={"append_to_response": MOVIE_DETAILS_APPENDS})
+    return movie_details
+
+
+def extract_tmdb_movie_data(tmdb_movie_id, movie_details):
+    """Build a tmdb_movie_data dictionary from an appended movie details JSON object."""
+    external_ids = movie_details.get("external_ids") or {}
+    title_data = movie_details.get("alternative_titles") or {}
+    release_date_data = movie_details.get("release_dates") or {}
+    keyword_data = movie_details.get("keywords") or {}
+    alt_titles = [title_dict.get("title") for title_dict in title_data.get("titles") or []]
+    tmdb_movie_data = dict(IMDb_ID=external_ids.get("imdb_id"), TMDb_ID=tmdb_movie_id, Alternative_Titles=alt_titles,
+                           Release_Dates=release_date_data.get("results"), Keywords=keyword_data.get("keywords"),
+                           Budget=movie_details.get("budget"))
+    return tmdb_movie_data
+
+
+def extract_cast_crew_data(tmdb_movie_id, movie_details):
+    """Build a cast_crew_data dictionary from an appended movie details JSON object."""
+    credits = movie_details.get("credits") or {}
+    cast_crew_data = dict(TMDb_ID=tmdb_movie_id, Cast=credits.get("cast"), Crew=credits.get("crew"))
+    return cast_crew_data
 
 
 def search_for_movie_get_tmdb_id(title):
     """Search for a movie in TMDb's database and return the TMDb_id."""
-    base_url = f'https://api.themoviedb.org/3/search/movie'
-    params = {"api_key": hidden.secrets["tmdb"]["tmdb_api_key"], "query": title}
-    response = requests.get(base_url, params=params)
-    data = response.json()
+    data = tmdb_get('/search/movie', params={"query": title})
     if data.get("results") is not None:
         for movie in data.get("results"):
             if movie.get("title").lower() == title.lower():
@@ -145,6 +132,18 @@ def search_for_movie_get_tmdb_id(title):
                 return tmdb_id
 
 
+# Local title index built from TMDb's daily movie ID export (see tmdb_id_export.ensure_tmdb_title_index).
+tmdb_title_index = tmdb_id_export.TMDbTitleIndex()
+
+
+def resolve_tmdb_movie_id(title):
+    """Resolve a title to a TMDb ID from the local export index, only using the search endpoint on a miss."""
+    tmdb_movie_id = tmdb_title_index.lookup(title)
+    if tmdb_movie_id is None:
+        tmdb_movie_id = search_for_movie_get_tmdb_id(title)
+    return tmdb_movie_id
+
+
 # Initialise the empty lists to store actor and movie data.
 actor_data_list = []
 tmdb_movie_data_list = []
@@ -153,58 +152,168 @@ additional_tmdb_movie_data_list = []
 # Initialise an extra list to store the actor IDs that returned no data.
 actor_not_found_in_tmdb_list = []
 
+# Cast and crew data returned alongside the movie details, keyed by TMDb movie ID.
+cast_crew_data_by_tmdb_id = {}
+
+# Index of every movie collected so far, and of the movies currently being fetched, keyed by TMDb movie ID.
+tmdb_movie_data_by_id = {}
+tmdb_movies_in_flight = {}
+tmdb_movie_index_lock = threading.Lock()
+
+
+def retrieve_actor_data(imdb_actor_id):
+    """Retrieve an actor's TMDb record and movie credits; return the actor_data dictionary and the TMDb IDs of
+       their movies, or None if the actor is not in TMDb."""
+    actor_info = find_actor(imdb_actor_id)
+    if len(actor_info) == 0:
+        return None
+    tmdb_actor_id = get_tmdb_actor_id(actor_info)
+    gender = get_actor_gender(actor_info)
+    birthday = get_actor_birthday(tmdb_actor_id)
+    movie_credits = get_movie_credits(tmdb_actor_id)
+    movie_titles = get_movie_titles(movie_credits)
+    tmdb_movie_ids = get_tmdb_movie_ids_from_credits(movie_credits)
+    actor_data = dict(IMDb_ID=imdb_actor_id, TMDb_ID=tmdb_actor_id, Gender=gender, Birthday=birthday,
+                      Movie_Credits=movie_titles)
+    return actor_data, tmdb_movie_ids
+
+
+def retrieve_movie_data(tmdb_movie_id):
+    """Retrieve a movie's IDs, alternative titles, release dates, keywords and budget from TMDb in one request.
+       The cast and crew returned with them are kept for retrieve_cast_and_crew_data_from_tmdb."""
+    movie_details = get_movie_details(tmdb_movie_id)
+    cast_crew_data_by_tmdb_id[tmdb_movie_id] = extract_cast_crew_data(tmdb_movie_id, movie_details)
+    return extract_tmdb_movie_data(tmdb_movie_id, movie_details)
+
+
+def retrieve_movie_data_once(tmdb_movie_id):
+    """Return a movie's tmdb_movie_data, only sending a request if the movie hasn't already been collected and
+       isn't already being fetched by another thread."""
+    with tmdb_movie_index_lock:
+        if tmdb_movie_id in tmdb_movie_data_by_id:
+            return tmdb_movie_data_by_id[tmdb_movie_id]
+        in_flight = tmdb_movies_in_flight.get(tmdb_movie_id)
+        if in_flight is None:
+            in_flight = tmdb_movies_in_flight[tmdb_movie_id] = Future()
+            fetch = True
+        else:
+            fetch = False
+
+    if not fetch:
+        return in_flight.result()
+
+    try:
+        tmdb_movie_data = retrieve_movie_data(tmdb_movie_id)
+    except Exception as e:
+        with tmdb_movie_index_lock:
+            del tmdb_movies_in_flight[tmdb_movie_id]
+        in_flight.set_exception(e)
+        raise
+    with tmdb_movie_index_lock:
+        tmdb_movie_data_by_id[tmdb_movie_id] = tmdb_movie_data
+        del tmdb_movies_in_flight[tmdb_movie_id]
+    in_flight.set_result(tmdb_movie_data)
+    return tmdb_movie_data
+
+
+def retrieve_actor_record(imdb_actor_id):
+    """Work queue worker: retrieve an actor's data and the TMDb IDs of their movies."""
+    actor_result = retrieve_actor_data(imdb_actor_id)
+    actor_data, tmdb_movie_ids = actor_result if actor_result is not None else (None, [])
+    return dict(IMDb_ID=imdb_actor_id, actor_data=actor_data, tmdb_movie_ids=tmdb_movie_ids)
+
 
-def retrieve_actor_and_movie_data_from_tmdb():
-    """Retrieve actor and movie information from TMDb."""
+def retrieve_movie_record(tmdb_movie_id):
+    """Work queue worker: retrieve a movie's data once and return it with the cast and crew fetched alongside."""
+    tmdb_movie_data = retrieve_movie_data_once(tmdb_movie_id)
+    return dict(tmdb_movie_data=tmdb_movie_data, cast_crew_data=cast_crew_data_by_tmdb_id.get(tmdb_movie_id))
+
+
+def load_collected_tmdb_movie_data():
+    """Fill the movie index and the cast and crew lookup from the movie queues' results."""
+    for queue_name in ("tmdb_movies", "tmdb_additional_titles"):
+        for movie_record in work_queue.WorkQueue(queue_name).results():
+            if movie_record is None:
+                continue
+            tmdb_movie_data = movie_record["tmdb_movie_data"]
+            tmdb_movie_data_by_id[tmdb_movie_data["TMDb_ID"]] = tmdb_movie_data
+            if movie_record["cast_crew_data"] is not None:
+                cast_crew_data_by_tmdb_id[tmdb_movie_data["TMDb_ID"]] = movie_record["cast_crew_data"]
+
+
+def prepare_tmdb_shard(shard_count):
+    if shard_count > 1:
+        tmdb_client.prepare_for_shard(shard_count)
+
+
+def retrieve_actor_shard(shard_index, shard_count):
+    """Work through one shard of the actor queue."""
+    prepare_tmdb_shard(shard_count)
+    actor_queue = work_queue.WorkQueue("tmdb_actors", shard_index, shard_count)
+    actor_queue.run(retrieve_actor_record, map_func=tmdb_client.map)
+
+
+def retrieve_movie_shard(shard_index, shard_count):
+    """Work through one shard of the credited movie queue."""
+    prepare_tmdb_shard(shard_count)
+    load_collected_tmdb_movie_data()
+    movie_queue = work_queue.WorkQueue("tmdb_movies", shard_index, shard_count)
+    movie_queue.run(retrieve_movie_record, map_func=tmdb_client.map)
+
+
+def report_incomplete_queue(queue):
+    if not queue.is_complete() or work_queue.FAILED in queue.status_counts():
+        print(f'{queue.name} has unfinished items {queue.status_counts()}; re-run to retry them.')
+
+
+def retrieve_actor_and_movie_data_from_tmdb(shard_count=1):
+    """Retrieve actor and movie information from TMDb. Progress is kept in work queues, so an interrupted run
+       picks up where it stopped, and the work can be split across shard_count processes."""
 
     # Load actor name and imdb id data
     actor_names_and_ids = utils.load_json_data("data_files/actor_names_and_ids.json")
 
-    # Query TMBb database using the defined functions and store the returned data in lists of dictionaries.
-    count = 0
-    for imdb_actor_id in actor_names_and_ids["imdb_ids"]:
-        count += 1
-        print(f'Current place in list: {count} / {len(actor_names_and_ids)}')
-
-        if len(find_actor(imdb_actor_id)) != 0:
-            tmdb_actor_id = get_tmdb_actor_id(find_actor(imdb_actor_id))
-            gender = get_actor_gender(find_actor(imdb_actor_id))
-            birthday = get_actor_birthday(tmdb_actor_id)
-            movie_credits = get_movie_credits(tmdb_actor_id)
-            movie_titles = get_movie_titles(movie_credits)
-            tmdb_movie_ids = get_tmdb_movie_ids_from_credits(movie_credits)
-            actor_data = dict(IMDb_ID=imdb_actor_id, TMDb_ID=tmdb_actor_id, Gender=gender, Birthday=birthday,
-                              Movie_Credits=movie_titles)
-            actor_data_list.append(actor_data)
-
-            for tmdb_movie_id in tmdb_movie_ids:
-                imdb_movie_id = get_imdb_movie_id(tmdb_movie_id)
-                alt_titles = get_alt_movie_titles(tmdb_movie_id)
-                release_dates = get_release_dates(tmdb_movie_id)
-                movie_keywords = get_movie_keywords(tmdb_movie_id)
-                budget = get_movie_budget(tmdb_movie_id)
-                tmdb_movie_data = dict(IMDb_ID=imdb_movie_id, TMDb_ID=tmdb_movie_id, Alternative_Titles=alt_titles,
-                                       Release_Dates=release_dates, Keywords=movie_keywords, Budget=budget)
-                if tmdb_movie_data not in tmdb_movie_data_list:
-                    tmdb_movie_data_list.append(tmdb_movie_data)
+    # Query TMDb for every actor.
+    actor_queue = work_queue.WorkQueue("tmdb_actors")
+    actor_queue.add(actor_names_and_ids["imdb_ids"])
+    work_queue.run_sharded(retrieve_actor_shard, shard_count)
+    report_incomplete_queue(actor_queue)
+
+    credited_tmdb_movie_ids = []
+    for actor_record in actor_queue.results():
+        if actor_record["actor_data"] is not None:
+            actor_data_list.append(actor_record["actor_data"])
+            credited_tmdb_movie_ids += actor_record["tmdb_movie_ids"]
         else:
-            actor_not_found_in_tmdb_list.append(imdb_actor_id)
-
-    utils.save_data_as_json("original_tmdb_movie_data_list.json", tmdb_movie_data_list)
-    utils.save_data_as_json("actor_data_list.json", actor_data_list)
+            actor_not_found_in_tmdb_list.append(actor_record["IMDb_ID"])
+
+    # Then query TMDb once for every distinct credited movie, and store the returned data in a list of dictionaries.
+    unique_tmdb_movie_ids = list(dict.fromkeys(credited_tmdb_movie_ids))
+    print(f'{len(credited_tmdb_movie_ids)} movie credits cover {len(unique_tmdb_movie_ids)} distinct movies.')
+    movie_queue = work_queue.WorkQueue("tmdb_movies")
+    movie_queue.add(unique_tmdb_movie_ids)
+    work_queue.run_sharded(retrieve_movie_shard, shard_count)
+    report_incomplete_queue(movie_queue)
+
+    load_collected_tmdb_movie_data()
+    tmdb_movie_data_list.extend(tmdb_movie_data_by_id[tmdb_movie_id] for tmdb_movie_id in unique_tmdb_movie_ids
+                                if tmdb_movie_id in tmdb_movie_data_by_id)
+
+    utils.save_records("original_tmdb_movie_data_list.json", tmdb_movie_data_list)
+    utils.save_records("actor_data_list.json", actor_data_list)
     utils.save_data_as_json("actor_not_found.json", actor_not_found_in_tmdb_list)
 
 
 def save_original_retrieved_tmdb_data():
     """Save the retrieved TMDb data as json files."""
-    utils.save_data_as_json("actor_data_list.json", actor_data_list)
-    utils.save_data_as_json("original_tmdb_movie_data_list.json", tmdb_movie_data_list)
+    utils.save_records("actor_data_list.json", actor_data_list)
+    utils.save_records("original_tmdb_movie_data_list.json", tmdb_movie_data_list)
     utils.save_data_as_json("actor_not_found_list.json", actor_not_found_in_tmdb_list)
 
 
 def summarise_original_tmdb_data_retrieval():
     """Display the tmdb data retrieval statistics."""
-    original_actor_data_list = utils.load_json_data("actor_data_list.json")
+    original_actor_data_list = utils.load_records("actor_data_list.json", columns=["IMDb_ID"])
     print(f"Tmdb data for {len(original_actor_data_list)} actors were successfully retrieved.\n")
 
     # Check how many searches returned no data.
@@ -213,55 +322,80 @@ def summarise_original_tmdb_data_retrieval():
         f"{len(original_actor_not_found_in_tmdb_list)} actors were not found in tmdb; no data was retrieved for them.")
 
 
-def retrieve_additional_actor_and_movie_data_from_tmdb():
+def retrieve_additional_title_record(title):
+    """Work queue worker: resolve a title to a TMDb ID and retrieve the matching movie's data once; return None
+       when TMDb has no match for the title."""
+    tmdb_movie_id = resolve_tmdb_movie_id(title)
+    if tmdb_movie_id is None:
+        return None
+    return retrieve_movie_record(tmdb_movie_id)
+
+
+def retrieve_additional_title_shard(shard_index, shard_count):
+    """Work through one shard of the additional title queue."""
+    prepare_tmdb_shard(shard_count)
+    load_collected_tmdb_movie_data()
+    title_queue = work_queue.WorkQueue("tmdb_additional_titles", shard_index, shard_count)
+    title_queue.run(retrieve_additional_title_record, map_func=tmdb_client.map)
+
+
+def retrieve_additional_actor_and_movie_data_from_tmdb(shard_count=1):
     """Retrieve additional actor and movie information from TMDb using the additional tmdb movie data."""
     additional_titles_list = utils.load_json_data("data_files/additional_titles_list.json")
+    tmdb_id_export.ensure_tmdb_title_index()
 
-    count = 0
-    for title in additional_titles_list["Titles"]:
-        count += 1
-        print(f'Currently on title {count} / {len(additional_titles_list["Titles"])}')
-        tmdb_movie_id = search_for_movie_get_tmdb_id(title)
-        imdb_movie_id = get_imdb_movie_id(tmdb_movie_id)
-        alt_titles = get_alt_movie_titles(tmdb_movie_id)
-        release_dates = get_release_dates(tmdb_movie_id)
-        movie_keywords = get_movie_keywords(tmdb_movie_id)
-        budget = get_movie_budget(tmdb_movie_id)
-        tmdb_movie_data = dict(IMDb_ID=imdb_movie_id, TMDb_ID=tmdb_movie_id, Alternative_Titles=alt_titles,
-                               Release_Dates=release_dates, Keywords=movie_keywords, Budget=budget)
-        additional_tmdb_movie_data_list.append(tmdb_movie_data)
+    title_queue = work_queue.WorkQueue("tmdb_additional_titles")
+    title_queue.add(additional_titles_list["Titles"])
+    work_queue.run_sharded(retrieve_additional_title_shard, shard_count)
+    report_incomplete_queue(title_queue)
+
+    title_records = title_queue.results()
+    additional_tmdb_movie_data_list.extend(title_record["tmdb_movie_data"] for title_record in title_records
+                                           if title_record is not None)
+    print(f'{len(additional_tmdb_movie_data_list)} of {len(title_records)} additional titles matched a TMDb movie. '
+          f'Local title index: {tmdb_title_index.hits} hits, {tmdb_title_index.misses} misses.')
 
 
 def save_additional_retrieved_tmdb_data():
-    utils.save_data_as_json("data_files/additional_tmdb_movie_data_list.json", additional_tmdb_movie_data_list)
+    utils.save_records("data_files/additional_tmdb_movie_data_list.json", additional_tmdb_movie_data_list)
 
 
 def concatenate_retrieved_tmdb_data():
     """Concat the original and additional tmdb movie data datasets."""
-    original_dataset = utils.load_json_data("data_files/original_tmdb_movie_data_list_all_2225.json")
-    additional_dataset = utils.load_json_data("data_files/additional_tmdb_movie_data_list.json")
+    original_dataset = utils.load_records("data_files/original_tmdb_movie_data_list_all_2225.json")
+    additional_dataset = utils.load_records("data_files/additional_tmdb_movie_data_list.json")
     concatenated_tmdb_movie_data_list = original_dataset + additional_dataset
     print(f'Original dataset size: {len(original_dataset)}'
           f'\nAdditional dataset size: {len(additional_dataset)}'
           f'\nConcatenated dataset size: {len(concatenated_tmdb_movie_data_list)}')
-    utils.save_data_as_json("data_files/concatenated_tmdb_movie_data_list.json", concatenated_tmdb_movie_data_list)
+    utils.save_records("data_files/concatenated_tmdb_movie_data_list.json", concatenated_tmdb_movie_data_list)
 
 
-def retrieve_cast_and_crew_data_from_tmdb():
+def retrieve_cast_crew_record(tmdb_movie_id):
+    """Work queue worker: return a movie's cast and crew, only going back to TMDb for movies whose credits
+       weren't fetched along with their details."""
+    if tmdb_movie_id in cast_crew_data_by_tmdb_id:
+        return cast_crew_data_by_tmdb_id[tmdb_movie_id]
+    cast, crew = get_cast_and_crew(tmdb_movie_id)
+    return dict(TMDb_ID=tmdb_movie_id, Cast=cast, Crew=crew)
+
+
+def retrieve_cast_crew_shard(shard_index, shard_count):
+    """Work through one shard of the cast and crew queue."""
+    prepare_tmdb_shard(shard_count)
+    load_collected_tmdb_movie_data()
+    cast_crew_queue = work_queue.WorkQueue("tmdb_cast_crew", shard_index, shard_count)
+    cast_crew_queue.run(retrieve_cast_crew_record, map_func=tmdb_client.map)
+
+
+def retrieve_cast_and_crew_data_from_tmdb(shard_count=1):
     """ Retrieve cast and crew data from TMDb. """
-    cast_crew_tmdb_data_list = []
-    new_tmdb_movie_data_list = utils.load_json_data("data_files/concatenated_tmdb_movie_data_list.json")
-
-    count = 0
-    for movie in new_tmdb_movie_data_list:
-        count += 1
-        print(f'Currently on movie {count} / {len(new_tmdb_movie_data_list)}')
-        if movie["TMDb_ID"] is not None:
-            tmdb_movie_id = movie["TMDb_ID"]
-            cast_and_crew = get_cast_and_crew(tmdb_movie_id)
-            cast = cast_and_crew[0]
-            crew = cast_and_crew[1]
-            cast_crew_data = dict(TMDb_ID=tmdb_movie_id, Cast=cast, Crew=crew)
-            cast_crew_tmdb_data_list.append(cast_crew_data)
-
-    utils.save_data_as_json("data_files/cast_crew_tmdb_movie_data_list.json", cast_crew_tmdb_data_list)
+    new_tmdb_movie_data_list = utils.load_records("data_files/concatenated_tmdb_movie_data_list.json",
+                                                  columns=["TMDb_ID"])
+
+    cast_crew_queue = work_queue.WorkQueue("tmdb_cast_crew")
+    cast_crew_queue.add(movie["TMDb_ID"] for movie in new_tmdb_movie_data_list if movie["TMDb_ID"] is not None)
+    work_queue.run_sharded(retrieve_cast_crew_shard, shard_count)
+    report_incomplete_queue(cast_crew_queue)
+
+    utils.save_records("data_files/cast_crew_tmdb_movie_data_list.json", cast_crew_queue.results())
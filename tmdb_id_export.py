@@ -0,0 +1,112 @@
+""" This file contains the offline title to TMDb ID resolver, built from TMDb's daily movie ID export. """
+
+import datetime
+import gzip
+import json
+import os
+import sqlite3
+import threading
+
+import utils
+
+TMDB_EXPORT_URL = "http://files.tmdb.org/p/exports/movie_ids_{date:%m_%d_%Y}.json.gz"
+DEFAULT_EXPORT_PATH = "data_files/tmdb_movie_ids.json.gz"
+DEFAULT_INDEX_PATH = "data_files/tmdb_movie_title_index.sqlite"
+# TMDb publishes a new export every day; an index a week old only misses the newest titles.
+INDEX_MAX_AGE = 7 * 24 * 60 * 60
+
+
+def download_tmdb_movie_id_export(export_path=DEFAULT_EXPORT_PATH, date=None):
+    """Download TMDb's movie ID export for the given date (yesterday's by default, the latest guaranteed one)."""
+    import requests
+    date = date or datetime.date.today() - datetime.timedelta(days=1)
+    os.makedirs(os.path.dirname(export_path) or ".", exist_ok=True)
+    with requests.get(TMDB_EXPORT_URL.format(date=date), stream=True) as response:
+        response.raise_for_status()
+        # Written beside the export and swapped in once complete, so a failed download keeps the previous one.
+        with open(export_path + ".part", 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+    os.replace(export_path + ".part", export_path)
+
+
+def build_tmdb_title_index(export_path=DEFAULT_EXPORT_PATH, index_path=DEFAULT_INDEX_PATH, batch_size=50000):
+    """Stream the gzipped JSON lines export into an SQLite index keyed by normalised title. The new index is
+       built beside the old one and swapped in once complete."""
+    building_path = index_path + ".building"
+    if os.path.exists(building_path):
+        os.remove(building_path)
+    connection = sqlite3.connect(building_path)
+    # WITHOUT ROWID clusters the rows by title, so the table is its own index.
+    connection.execute("CREATE TABLE movies (title TEXT, tmdb_id INTEGER, popularity REAL, video INTEGER, "
+                       "PRIMARY KEY (title, tmdb_id)) WITHOUT ROWID")
+
+    movie_count = 0
+    batch = []
+    with gzip.open(export_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            movie = json.loads(line)
+            # The search endpoint leaves adult titles out by default, so the index does too.
+            if movie.get("adult") or not movie.get("original_title"):
+                continue
+            batch.append((utils.normalise_title(movie["original_title"]), movie["id"], movie.get("popularity", 0),
+                          int(bool(movie.get("video")))))
+            if len(batch) == batch_size:
+                connection.executemany("INSERT OR IGNORE INTO movies VALUES (?, ?, ?, ?)", batch)
+                movie_count += len(batch)
+                batch = []
+    connection.executemany("INSERT OR IGNORE INTO movies VALUES (?, ?, ?, ?)", batch)
+    movie_count += len(batch)
+    connection.commit()
+    connection.close()
+
+    os.replace(building_path, index_path)
+    print(f'Indexed {movie_count} movie titles from {export_path}.')
+
+
+def ensure_tmdb_title_index(export_path=DEFAULT_EXPORT_PATH, index_path=DEFAULT_INDEX_PATH, max_age=INDEX_MAX_AGE):
+    """Build the title index if it is missing, older than max_age seconds or older than the export, downloading a
+       new export first if that is missing or stale too. If the download fails, an existing export is indexed
+       anyway; without one, the additional titles are resolved with the search endpoint alone."""
+    if not utils.is_stale(index_path, max_age) and (not os.path.exists(export_path)
+                                                    or os.path.getmtime(index_path) >= os.path.getmtime(export_path)):
+        return
+    if utils.is_stale(export_path, max_age):
+        try:
+            download_tmdb_movie_id_export(export_path)
+        except OSError as e:  # requests' errors are OSErrors too
+            if not os.path.exists(export_path):
+                print(f'Could not download the TMDb movie ID export ({e}); resolving titles with search only.')
+                return
+            print(f'Could not download a new TMDb movie ID export ({e}); indexing the one at {export_path}.')
+    build_tmdb_title_index(export_path, index_path)
+
+
+class TMDbTitleIndex:
+    """Answers title to TMDb ID lookups from the local export index. Where several movies share a title, the
+       most popular non-video release wins, which mirrors the ranking of the search endpoint's results."""
+
+    def __init__(self, index_path=DEFAULT_INDEX_PATH):
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.connection = None
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, title):
+        """Return the TMDb ID for the title, or None if the index has no match (or hasn't been built)."""
+        with self.lock:
+            if self.connection is None:
+                if not os.path.exists(self.index_path):
+                    self.misses += 1
+                    return None
+                self.connection = sqlite3.connect(f'file:{self.index_path}?mode=ro', uri=True,
+                                                  check_same_thread=False)
+            row = self.connection.execute("SELECT tmdb_id FROM movies WHERE title = ? "
+                                          "ORDER BY video, popularity DESC LIMIT 1",
+                                          (utils.normalise_title(title),)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
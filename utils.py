@@ -1,5 +1,14 @@
 """File contains the utility functions used across modules."""
+import collections
 import json
+import operator
+import os
+import pickle
+import re
+import time
+import unicodedata
+
+# pyarrow is imported by the functions that use it, so that importing utils (which every module does) stays cheap.
 
 
 def save_data_as_json(file_name, data):
@@ -10,3 +19,340 @@ def save_data_as_json(file_name, data):
 def load_json_data(file_name):
     with open(file_name, encoding='utf-8') as f:
         return json.load(f)
+
+
+def load_json_lines_data(file_name):
+    with open(file_name, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_stale(file_name, max_age):
+    """Whether a file is missing or was last written more than max_age seconds ago."""
+    return not os.path.exists(file_name) or time.time() - os.path.getmtime(file_name) > max_age
+
+
+def normalise_title(title):
+    """Normalise a movie title for matching: unicode-normalised, case-folded, with whitespace collapsed."""
+    title = unicodedata.normalize("NFKC", title).casefold()
+    return re.sub(r"\s+", " ", title).strip()
+
+
+def parquet_path(file_name):
+    """The Parquet file that save_records writes in place of a JSON file name."""
+    return os.path.splitext(file_name)[0] + ".parquet"
+
+
+def save_records(file_name, records):
+    """Save a list of dictionaries as a zstd-compressed Parquet file beside file_name (the same name with a
+       .parquet extension), keeping nested lists and dictionaries as Arrow list and struct columns.
+       Records Arrow can't give one type per field (e.g. a field that is a string in some records and a list in
+       others), or that Parquet can't store (e.g. an empty dictionary, a struct with no fields), and an empty
+       list, which has no fields to take a schema from, are saved as JSON under file_name instead."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    try:
+        if not records:
+            raise ValueError("there are no records")
+        pq.write_table(pa.Table.from_struct_array(pa.array(records)), parquet_path(file_name), compression="zstd")
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, TypeError, ValueError) as e:
+        print(f'Saving {file_name} as JSON; its records have no Parquet schema ({e}).')
+        # Also removes a Parquet file left part written by the failed write.
+        if os.path.exists(parquet_path(file_name)):
+            os.remove(parquet_path(file_name))
+        save_data_as_json(file_name, records)
+
+
+FILTER_OPERATORS = {"==": operator.eq, "=": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+                    ">": operator.gt, ">=": operator.ge, "in": lambda a, b: a in b,
+                    "not in": lambda a, b: a not in b}
+
+
+def matches_filters(record, filters):
+    """Check a record against (column, op, value) filters, all of which must hold."""
+    for column, op, value in filters:
+        field = record.get(column)
+        if field is None or not FILTER_OPERATORS[op](field, value):
+            return False
+    return True
+
+
+def load_records(file_name, columns=None, filters=None):
+    """Load records saved by save_records as a list of dictionaries, reading only the given columns and the rows
+       matching filters, a list of (column, op, value) tuples that must all hold (as in pyarrow's filters;
+       missing values never match). Reads the JSON file_name when there is no Parquet file, e.g. for datasets
+       saved before this storage existed."""
+    if os.path.exists(parquet_path(file_name)):
+        import pyarrow.parquet as pq
+        return pq.read_table(parquet_path(file_name), columns=columns, filters=filters or None).to_pylist()
+
+    records = load_json_data(file_name)
+    if filters:
+        records = [record for record in records if record is not None and matches_filters(record, filters)]
+    if columns is not None:
+        records = [{column: record.get(column) for column in columns} for record in records if record is not None]
+    return records
+
+
+def iter_json_array(f, chunk_size=1024 * 1024):
+    """Yield the elements of the JSON array in the open text file f one at a time, reading it chunk by chunk, so
+       only the current chunk and element are ever held in memory."""
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r'[ \t\n\r]*')
+    buffer = f.read(chunk_size)
+    position = whitespace.match(buffer).end()
+    if buffer[position:position + 1] != "[":
+        raise ValueError(f'{f.name} does not contain a JSON array.')
+    position += 1
+    at_eof = False
+
+    while True:
+        position = whitespace.match(buffer, position).end()
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        if position < len(buffer) and buffer[position] == ",":
+            position += 1
+            continue
+        try:
+            element, end = decoder.raw_decode(buffer, position)
+            # A number cut off by the end of the chunk still parses (e.g. "4.2" of "4.25e10"), so an element only
+            # counts once the separator after it has been read.
+            complete = at_eof or (end < len(buffer) and buffer[end] in ' \t\n\r,]')
+        except json.decoder.JSONDecodeError:
+            if at_eof:
+                raise
+            complete = False
+        if complete:
+            yield element
+            position = end
+            continue
+
+        chunk = f.read(chunk_size)
+        at_eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+class SchemaError(ValueError):
+    """Raised when a record doesn't match its RecordSchema."""
+
+
+class RecordSchema:
+    """The fields a record must have, with the type (or tuple of types) each field's value must be; include
+       type(None) to allow a field to be missing or null. Valid records are returned as compact namedtuples
+       holding only the schema's fields."""
+
+    def __init__(self, name, field_types):
+        self.name = name
+        self.field_types = field_types
+        self.record_type = collections.namedtuple(name, field_types)
+
+    def to_record(self, record):
+        if not isinstance(record, dict):
+            raise SchemaError(f'{self.name}: expected an object, got {type(record).__name__}.')
+        values = []
+        for field, field_type in self.field_types.items():
+            value = record.get(field)
+            if not isinstance(value, field_type):
+                raise SchemaError(f'{self.name}: field {field!r} is {type(value).__name__}, expected {field_type}.')
+            values.append(value)
+        return self.record_type(*values)
+
+
+def iter_records(file_name, schema=None, columns=None, skip_invalid=False):
+    """Yield the records of a dataset one at a time: from its Parquet file if save_records wrote one, otherwise
+       from file_name as JSON lines (.jsonl) or a JSON array. With a schema, each record is validated and
+       returned as the schema's namedtuple; invalid records raise SchemaError, or are skipped and counted when
+       skip_invalid is set."""
+    if schema is not None:
+        columns = list(schema.field_types)
+
+    if os.path.exists(parquet_path(file_name)):
+        import pyarrow.parquet as pq
+
+        def raw_records():
+            for batch in pq.ParquetFile(parquet_path(file_name)).iter_batches(columns=columns):
+                yield from batch.to_pylist()
+    elif file_name.endswith(".jsonl"):
+        def raw_records():
+            with open(file_name, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+    else:
+        def raw_records():
+            with open(file_name, encoding='utf-8') as f:
+                yield from iter_json_array(f)
+
+    invalid_count = 0
+    for record in raw_records():
+        if schema is None:
+            yield {column: record.get(column) for column in columns} if columns and record is not None else record
+            continue
+        try:
+            yield schema.to_record(record)
+        except SchemaError:
+            if not skip_invalid:
+                raise
+            invalid_count += 1
+    if invalid_count:
+        print(f'Skipped {invalid_count} records in {file_name} that did not match the {schema.name} schema.')
+
+
+def legacy_pickle_path(file_name):
+    """The pickle an Arrow artifact replaces, read when the artifact hasn't been written yet."""
+    return os.path.splitext(file_name)[0] + ".pkl"
+
+
+def save_dataframe(df, file_name):
+    """Save a DataFrame, with its index, as an uncompressed Arrow IPC (Feather v2) file, so it can be memory-mapped
+       on load. List columns become Arrow lists and datetimes Arrow timestamps; a column whose values have no
+       single Arrow type (e.g. strings mixed with lists) is stored as pickled values and restored on load."""
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        pickled_columns = []
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        df = df.copy()
+        pickled_columns = []
+        for column in df.columns:
+            try:
+                pa.array(df[column], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                df[column] = df[column].map(pickle.dumps)
+                pickled_columns.append(column)
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    metadata = dict(table.schema.metadata or {}, pickled_columns=json.dumps(pickled_columns))
+    feather.write_feather(table.replace_schema_metadata(metadata), file_name, compression="uncompressed")
+
+
+def load_dataframe(file_name, columns=None):
+    """Load a DataFrame saved by save_dataframe from a memory map, reading only the given columns (the index is
+       always included). Falls back to the pickle the artifact replaces if it hasn't been written yet."""
+    if not os.path.exists(file_name) and os.path.exists(legacy_pickle_path(file_name)):
+        with open(legacy_pickle_path(file_name), 'rb') as f:
+            df = pickle.load(f)
+        return df if columns is None else df[columns]
+
+    import pyarrow as pa
+    with pa.memory_map(file_name) as source:
+        table = pa.ipc.open_file(source).read_all()
+    metadata = table.schema.metadata or {}
+    if columns is not None:
+        index_columns = [column for column in table.schema.pandas_metadata["index_columns"]
+                         if isinstance(column, str)]
+        table = table.select(index_columns + [column for column in columns if column not in index_columns])
+    df = table.to_pandas(split_blocks=True)
+    for column in json.loads(metadata.get(b"pickled_columns", b"[]")):
+        if column in df.columns:
+            df[column] = df[column].map(pickle.loads)
+    for column in json.loads(metadata.get(b"categorical_columns", b"[]")):
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    # to_pandas gives list values as numpy arrays, and the cleaning functions append to and remove from them.
+    for field in table.schema:
+        if pa.types.is_list(field.type) and field.name in df.columns:
+            df[field.name] = df[field.name].map(list, na_action='ignore')
+    return df
+
+
+def load_table(file_name):
+    """Load an artifact saved by save_dataframe as a memory-mapped Arrow table, with the index as ordinary columns
+       (an unnamed index is called "index", as DataFrame.to_sql calls it). Artifacts with pickled columns are
+       unpickled through pandas first, as is the pickle the artifact replaces if it hasn't been written yet."""
+    import pyarrow as pa
+    if not os.path.exists(file_name) and os.path.exists(legacy_pickle_path(file_name)):
+        return pa.Table.from_pandas(load_dataframe(file_name).reset_index(), preserve_index=False)
+    with pa.memory_map(file_name) as source:
+        table = pa.ipc.open_file(source).read_all()
+    if json.loads((table.schema.metadata or {}).get(b"pickled_columns", b"[]")):
+        return pa.Table.from_pandas(load_dataframe(file_name).reset_index(), preserve_index=False)
+    return table.rename_columns(["index" if name == "__index_level_0__" else name for name in table.column_names])
+
+
+class DataFrameChunkWriter:
+    """Write a DataFrame to an artifact load_dataframe reads one chunk at a time, so only a chunk is ever held in
+       memory. The chunks' columns must keep the same types. The Arrow schema is fixed from the first chunk: a
+       column that is null in every row takes its type from field_types (e.g. derived from the table's SQL column
+       types) or, failing that, from a later chunk, for which chunks are held back up to max_pending_rows rows;
+       a column still without a type then is stored as pickled values and restored on load. Categorical columns
+       are stored as their values and restored on load, and the index isn't kept. Use as a context manager; the
+       file is removed if writing fails."""
+
+    def __init__(self, file_name, field_types=None, max_pending_rows=100000):
+        self.file_name = file_name
+        self.field_types = field_types or {}
+        self.max_pending_rows = max_pending_rows
+        self.rows = 0
+        self.categorical_columns = None
+        self.pickled_columns = []
+        self.pending_tables = []
+        self.schema = None
+        self.writer = None
+
+    def write(self, df):
+        import pyarrow as pa
+        if self.categorical_columns is None:
+            self.categorical_columns = [column for column in df.columns if df[column].dtype.name == "category"]
+        df = df.astype({column: object for column in self.categorical_columns})
+        self.rows += len(df)
+        if self.writer is not None:
+            df = df.assign(**{column: df[column].map(pickle.dumps) for column in self.pickled_columns})
+            table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+            self.writer.write_table(table.replace_schema_metadata(self.schema.metadata))
+            return
+        self.pending_tables.append(pa.Table.from_pandas(df, preserve_index=False))
+        if (all(field_type is not None for field_type in self.pending_field_types())
+                or sum(table.num_rows for table in self.pending_tables) >= self.max_pending_rows):
+            self.open_writer()
+
+    def pending_field_types(self):
+        """Each column's type in the first held-back chunk where it isn't all null, else its type in field_types
+           (None if it has neither)."""
+        import pyarrow as pa
+        return [next((table.schema.field(i).type for table in self.pending_tables
+                      if not pa.types.is_null(table.schema.field(i).type)), self.field_types.get(field.name))
+                for i, field in enumerate(self.pending_tables[0].schema)]
+
+    def open_writer(self):
+        import pyarrow as pa
+        first_schema = self.pending_tables[0].schema
+        field_types = self.pending_field_types()
+        self.pickled_columns = [field.name for field, field_type in zip(first_schema, field_types)
+                                if field_type is None]
+        fields = [pa.field(field.name, field_type or pa.binary())
+                  for field, field_type in zip(first_schema, field_types)]
+        metadata = dict(first_schema.metadata or {}, pickled_columns=json.dumps(self.pickled_columns),
+                        categorical_columns=json.dumps(self.categorical_columns))
+        self.schema = pa.schema(fields, metadata=metadata)
+        self.writer = pa.ipc.new_file(self.file_name, self.schema)
+        for table in self.pending_tables:
+            # The held-back chunks are null in the pickled columns, which hold pickled Nones instead.
+            for column in self.pickled_columns:
+                table = table.set_column(table.schema.get_field_index(column), column,
+                                         pa.array([pickle.dumps(None)] * table.num_rows, pa.binary()))
+            self.writer.write_table(table.cast(self.schema))
+        self.pending_tables = []
+
+    def close(self):
+        import pyarrow as pa
+        if self.writer is None:
+            if not self.pending_tables:
+                self.pending_tables.append(pa.table({}))
+                self.categorical_columns = self.categorical_columns or []
+            self.open_writer()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        if self.writer is not None:
+            self.writer.close()
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
@@ -0,0 +1,172 @@
+""" This file contains the durable work queue used to run long API collection passes resumably. """
+
+import glob
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+WORK_QUEUE_DIR = "data_files/work_queues"
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+class StopRun(Exception):
+    """Raised by a worker to stop the current run, leaving its item and every unstarted item pending."""
+
+
+class WorkQueue:
+    """A queue of work items with a per-item status, backed by SQLite. Each item's result is appended to a JSON
+       lines file as soon as it completes, so a run that dies part way restarts exactly where it stopped.
+
+       Items are assigned to shards by a stable hash of their key, so several worker processes can share a queue
+       by each running with a different shard_index."""
+
+    def __init__(self, name, shard_index=0, shard_count=1, max_attempts=3, directory=WORK_QUEUE_DIR):
+        self.name = name
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.max_attempts = max_attempts
+        self.directory = directory
+        self.db_path = os.path.join(directory, f'{name}.sqlite')
+        self.results_path = os.path.join(directory, f'{name}.shard{shard_index}.jsonl')
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.end_truncated_results_line()
+        self.connection = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS items (key TEXT PRIMARY KEY, position INTEGER, "
+                                "shard INTEGER, payload TEXT, status TEXT, attempts INTEGER, error TEXT)")
+        self.connection.commit()
+
+    def end_truncated_results_line(self):
+        """Terminate a last line left truncated by a crash so that new results start on a line of their own."""
+        if os.path.exists(self.results_path) and os.path.getsize(self.results_path) > 0:
+            with open(self.results_path, 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def add(self, payloads, key=str):
+        """Queue the payloads that aren't already in the queue, keyed by key(payload)."""
+        with self.lock:
+            position = self.connection.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM items").fetchone()[0]
+            rows = []
+            for payload in payloads:
+                item_key = key(payload)
+                rows.append((item_key, position, zlib.crc32(item_key.encode("utf-8")), json.dumps(payload), PENDING))
+                position += 1
+            self.connection.executemany("INSERT OR IGNORE INTO items VALUES (?, ?, ?, ?, ?, 0, NULL)", rows)
+            self.connection.commit()
+
+    def pending_items(self):
+        """Return the (key, payload) pairs this shard still has to process, in queue order."""
+        rows = self.connection.execute("SELECT key, payload FROM items WHERE shard % ? = ? AND "
+                                       "(status = ? OR (status = ? AND attempts < ?)) ORDER BY position",
+                                       (self.shard_count, self.shard_index, PENDING, FAILED, self.max_attempts))
+        return [(item_key, json.loads(payload)) for item_key, payload in rows]
+
+    def record_result(self, item_key, result):
+        with self.lock:
+            with open(self.results_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"key": item_key, "result": result}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.connection.execute("UPDATE items SET status = ?, attempts = attempts + 1, error = NULL "
+                                    "WHERE key = ?", (DONE, item_key))
+            self.connection.commit()
+
+    def record_failure(self, item_key, error):
+        with self.lock:
+            self.connection.execute("UPDATE items SET status = ?, attempts = attempts + 1, error = ? WHERE key = ?",
+                                    (FAILED, repr(error), item_key))
+            self.connection.commit()
+
+    def run(self, worker, map_func=map):
+        """Process this shard's outstanding items with worker(payload), recording each result or failure as it
+           completes. map_func lets a caller supply a concurrent map, e.g. an APIClient's thread pool.
+           A worker can raise StopRun to end the run early without counting an attempt against any item."""
+        items = self.pending_items()
+        total = len(items)
+        count = 0
+        count_lock = threading.Lock()
+        stopped = threading.Event()
+        started = time.monotonic()
+        print(f'{self.name} (shard {self.shard_index + 1} / {self.shard_count}): {total} items to process.')
+
+        def process(item):
+            nonlocal count
+            item_key, payload = item
+            if stopped.is_set():
+                return
+            try:
+                result = worker(payload)
+            except StopRun as e:
+                if not stopped.is_set():
+                    print(f'{self.name}: stopping run: {e}')
+                stopped.set()
+                return
+            except Exception as e:
+                print(f'{self.name}: {item_key} failed with {e!r}')
+                self.record_failure(item_key, e)
+                return
+            self.record_result(item_key, result)
+            with count_lock:
+                count += 1
+                print(f'{self.name}: currently on item {count} / {total} '
+                      f'({count / (time.monotonic() - started):.1f} items/s)')
+
+        for _ in map_func(process, items):
+            pass
+
+    def status_counts(self):
+        rows = self.connection.execute("SELECT status, COUNT(*) FROM items GROUP BY status")
+        return dict(rows.fetchall())
+
+    def is_complete(self):
+        """True when every item is done, or has failed max_attempts times."""
+        outstanding = self.connection.execute("SELECT COUNT(*) FROM items WHERE status = ? OR "
+                                              "(status = ? AND attempts < ?)",
+                                              (PENDING, FAILED, self.max_attempts)).fetchone()[0]
+        return outstanding == 0
+
+    def results(self):
+        """Return the results of every completed item across all shards, in queue order."""
+        results_by_key = {}
+        for results_path in glob.glob(os.path.join(self.directory, f'{glob.escape(self.name)}.shard*.jsonl')):
+            with open(results_path, encoding='utf-8') as f:
+                for line in f:
+                    # A crash mid-write can leave a truncated last line; that item is still pending and will rerun.
+                    try:
+                        record = json.loads(line)
+                    except json.decoder.JSONDecodeError:
+                        continue
+                    results_by_key[record["key"]] = record["result"]
+        done_keys = self.connection.execute("SELECT key FROM items WHERE status = ? ORDER BY position", (DONE,))
+        return [results_by_key[item_key] for (item_key,) in done_keys if item_key in results_by_key]
+
+    def close(self):
+        self.connection.close()
+
+
+def run_sharded(target, shard_count):
+    """Run target(shard_index, shard_count) in shard_count worker processes and wait for them all; a single
+       shard runs in the current process."""
+    if shard_count == 1:
+        target(0, 1)
+        return
+
+    processes = [multiprocessing.Process(target=target, args=(shard_index, shard_count))
+                 for shard_index in range(shard_count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    failed_shards = [shard_index for shard_index, process in enumerate(processes) if process.exitcode != 0]
+    if failed_shards:
+        raise RuntimeError(f'{target.__name__} failed in shards {failed_shards}.')